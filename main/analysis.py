@@ -0,0 +1,156 @@
+"""
+Модуль со стегоанализом изображений задач
+
+Для каждого изображения считаются три классические метрики обнаружения
+LSB-встраивания, все векторно над массивами NumPy:
+
+* хи-квадрат (Westfeld, Pfitzmann) - насколько выровнены частоты пар значений
+  2k и 2k+1; возвращается вероятность того, что младшие биты заполнены сообщением;
+* RS-анализ (Fridrich, Goljan, Du) - оценка доли пикселей с изменёнными младшими
+  битами по регулярным и сингулярным группам;
+* энтропия битовых плоскостей - энтропия узоров 2x2 в каждой плоскости, нормированная
+  к [0, 1]; у естественных изображений старшие плоскости заметно упорядочены.
+
+Функции модуля не обращаются к базе данных, поэтому ``analyse_file`` можно
+выполнять в отдельных процессах
+"""
+import math
+
+import numpy as np
+from PIL import Image
+
+from main import lsb
+
+RS_MASK = np.array([0, 1, 1, 0], dtype=np.int16)
+
+
+def _pixels(image: Image.Image) -> np.ndarray:
+    """
+    Массив каналов RGB (высота, ширина, 3) в int16
+    """
+    return np.asarray(image.convert('RGB'), dtype=np.int16)
+
+
+def chi_square(pixels: np.ndarray) -> float:
+    """
+    Вероятность встраивания по атаке хи-квадрат
+
+    Распределение хи-квадрат аппроксимируется по Уилсону-Хилферти,
+    чтобы не тянуть SciPy ради одной функции
+    """
+    histogram = np.stack([
+        np.bincount(pixels[..., channel].reshape(-1), minlength=256) for channel in range(pixels.shape[-1])
+    ]).reshape(-1, 2).astype(np.float64)
+    expected = histogram.mean(axis=1)
+    used = expected > 0
+    if used.sum() < 2:
+        return 0.0
+    statistic = float((((histogram[used, 0] - expected[used]) ** 2) / expected[used]).sum())
+    freedom = int(used.sum()) - 1
+    scale = 2 / (9 * freedom)
+    z = ((statistic / freedom) ** (1 / 3) - (1 - scale)) / math.sqrt(scale)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _smoothness(groups: np.ndarray) -> np.ndarray:
+    """
+    Дискриминирующая функция RS: сумма модулей разностей соседей в группе
+    """
+    return np.abs(np.diff(groups, axis=-1)).sum(axis=-1)
+
+
+def _flip(groups: np.ndarray, mask: np.ndarray, negative: bool) -> np.ndarray:
+    """
+    Применение F1 (2k <-> 2k+1) или F-1 (2k-1 <-> 2k) к позициям маски
+    """
+    flipped = ((groups + 1) ^ 1) - 1 if negative else groups ^ 1
+    return np.where(mask.astype(bool), flipped, groups)
+
+
+def _regular_singular(groups: np.ndarray) -> tuple:
+    """
+    Доли регулярных и сингулярных групп для масок M и -M
+    """
+    base = _smoothness(groups)
+    result = []
+    for negative in (False, True):
+        changed = _smoothness(_flip(groups, RS_MASK, negative))
+        result += [float((changed > base).mean()), float((changed < base).mean())]
+    return tuple(result)
+
+
+def rs_analysis(pixels: np.ndarray) -> float:
+    """
+    Оценка доли пикселей с изменёнными младшими битами (0..1) по RS-анализу
+    """
+    height, width, channels = pixels.shape
+    width -= width % len(RS_MASK)
+    if not width or not height:
+        return 0.0
+    groups = pixels[:, :width].transpose(2, 0, 1).reshape(-1, len(RS_MASK))
+    r_m, s_m, r_n, s_n = _regular_singular(groups)
+    r_m1, s_m1, r_n1, s_n1 = _regular_singular(groups ^ 1)
+    d0, d1 = r_m - s_m, r_m1 - s_m1
+    n0, n1 = r_n - s_n, r_n1 - s_n1
+    a, b, c = 2 * (d1 + d0), n0 - n1 - d1 - 3 * d0, d0 - n0
+    discriminant = b * b - 4 * a * c
+    if discriminant < 0 or (abs(a) < 1e-12 and abs(b) < 1e-12):
+        # Кривые не пересекаются при почти полном заполнении: R_M и S_M сходятся,
+        # а разность для -M растёт, поэтому долю оцениваем по их отношению
+        return min(max(1 - d0 / n0, 0.0), 1.0) if n0 > 0 else 0.0
+    if abs(a) < 1e-12:
+        x = -c / b
+    else:
+        roots = ((-b + math.sqrt(discriminant)) / (2 * a), (-b - math.sqrt(discriminant)) / (2 * a))
+        x = min(roots, key=abs)
+    if abs(x - 0.5) < 1e-12:
+        return 1.0
+    return min(max(x / (x - 0.5), 0.0), 1.0)
+
+
+def bitplane_entropy(pixels: np.ndarray) -> list:
+    """
+    Нормированная энтропия узоров 2x2 для каждой битовой плоскости (от младшей к старшей)
+    """
+    height, width = pixels.shape[0] - pixels.shape[0] % 2, pixels.shape[1] - pixels.shape[1] % 2
+    if not height or not width:
+        return [0.0] * 8
+    blocks = pixels[:height, :width].transpose(2, 0, 1)
+    result = []
+    for plane in range(8):
+        bits = (blocks >> plane) & 1
+        patterns = bits[:, ::2, ::2] | bits[:, ::2, 1::2] << 1 | bits[:, 1::2, ::2] << 2 | bits[:, 1::2, 1::2] << 3
+        frequency = np.bincount(patterns.reshape(-1), minlength=16) / patterns.size
+        frequency = frequency[frequency > 0]
+        result.append(float(-(frequency * np.log2(frequency)).sum() / 4))
+    return result
+
+
+def analyse(image: Image.Image) -> dict:
+    """
+    Полный отчёт по изображению
+
+    :return: словарь с полями модели ImageReport (кроме задачи)
+    """
+    pixels = _pixels(image)
+    chi = chi_square(pixels)
+    rs = rs_analysis(pixels)
+    entropy = bitplane_entropy(pixels)
+    capacity = max(lsb.capacity(image, lsb.CHANNELS, 1), 0)
+    return {
+        'chi_square': chi,
+        'rs_estimate': rs,
+        'lsb_entropy': entropy[0],
+        'bitplane_entropy': entropy,
+        'detectability': max(chi, rs),
+        'capacity': capacity,
+        'estimated_payload': int(rs * image.size[0] * image.size[1] * 3 / 8),
+    }
+
+
+def analyse_file(path: str) -> dict:
+    """
+    Отчёт по файлу изображения (для пула процессов)
+    """
+    with Image.open(path) as image:
+        return analyse(image)
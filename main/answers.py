@@ -0,0 +1,153 @@
+"""
+Модуль с кэшем ответов на задачи
+
+Для проверки ответа нужны только хэш правильного ответа и признак активности
+задачи, поэтому они держатся в памяти процесса: неправильные ответы (а при
+переборе их подавляющее большинство) отклоняются без обращения к базе.
+Ответы сравниваются по SHA-256 от нормализованной строки.
+
+Кэш ограничен по размеру (вытесняется давно не использованная задача) и по
+времени жизни записи. При изменении или удалении задачи запись сбрасывается
+сигналом модели; в других процессах она устареет не позже чем через TTL.
+Сброс, пришедший, пока запись загружается, увеличивает версию ключа, и
+загруженное до него значение в кэш не попадает
+"""
+import hashlib
+import hmac
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from django.conf import settings
+
+
+def normalize(answer: str) -> str:
+    """
+    Нормализация ответа: единая форма Unicode и обрезка пробелов по краям
+    """
+    return unicodedata.normalize('NFC', answer).strip()
+
+
+def answer_hash(answer: str) -> bytes:
+    """
+    Хэш нормализованного ответа
+    """
+    return hashlib.sha256(normalize(answer).encode('utf-8')).digest()
+
+
+class AnswerCache:
+    """
+    Потокобезопасный LRU-кэш с TTL: id задачи -> (хэш ответа, активность)
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._loading = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def peek(self, id: int) -> Tuple[bool, Optional[Tuple[bytes, bool]]]:
+        """
+        Получение записи без загрузки из базы (для асинхронного кода)
+
+        :return: (найдена ли живая запись, значение)
+        """
+        with self._lock:
+            item = self._items.get(id)
+            if item is None or item[0] <= time.monotonic():
+                return False, None
+            self._items.move_to_end(id)
+            return True, item[1]
+
+    def get(self, id: int, load: Callable[[int], Optional[Tuple[str, bool]]]) -> Optional[Tuple[bytes, bool]]:
+        """
+        Получение записи, при промахе она загружается через ``load``
+
+        :param id: id задачи
+        :param load: функция, возвращающая (ответ, активность) или None, если задачи нет
+        :return: (хэш ответа, активность) или None, если задачи нет
+        """
+        found, value = self.peek(id)
+        if found:
+            return value
+        with self._lock:
+            version = self._versions.get(id, 0)
+            self._loading[id] = self._loading.get(id, 0) + 1
+        now = time.monotonic()
+        try:
+            loaded = load(id)
+        except BaseException:
+            with self._lock:
+                self._finish_loading(id)
+            raise
+        value = None if loaded is None else (answer_hash(loaded[0]), loaded[1])
+        with self._lock:
+            if self._finish_loading(id) == version:
+                self._items[id] = (now + self.ttl, value)
+                self._items.move_to_end(id)
+                while len(self._items) > self.size:
+                    self._items.popitem(last=False)
+        return value
+
+    def _finish_loading(self, id: int) -> int:
+        """
+        Отметка о конце загрузки записи (вызывается под блокировкой)
+
+        :return: версия ключа на момент конца загрузки
+        """
+        self._loading[id] -= 1
+        if self._loading[id]:
+            return self._versions.get(id, 0)
+        del self._loading[id]
+        return self._versions.pop(id, 0)
+
+    def invalidate(self, id: int):
+        """
+        Сброс записи задачи (и значения, которое сейчас загружается)
+        """
+        with self._lock:
+            self._items.pop(id, None)
+            if id in self._loading:
+                self._versions[id] = self._versions.get(id, 0) + 1
+
+    def clear(self):
+        """
+        Сброс всего кэша
+        """
+        with self._lock:
+            self._items.clear()
+            for id in self._loading:
+                self._versions[id] = self._versions.get(id, 0) + 1
+
+
+cache = AnswerCache(settings.ANSWER_CACHE_SIZE, settings.ANSWER_CACHE_TTL)
+
+
+def _compare(value: Optional[Tuple[bytes, bool]], answer: str) -> bool:
+    """
+    Сравнение ответа с записью кэша (неактивная или отсутствующая задача - всегда неверно)
+    """
+    if value is None or not value[1]:
+        return False
+    return hmac.compare_digest(value[0], answer_hash(answer))
+
+
+def check(id: int, answer: str, load: Callable[[int], Optional[Tuple[str, bool]]]) -> bool:
+    """
+    Проверка ответа на активную задачу
+    """
+    return _compare(cache.get(id, load), answer)
+
+
+def check_cached(id: int, answer: str) -> Optional[bool]:
+    """
+    Проверка ответа только по кэшу
+
+    :return: результат проверки или None, если задачи нет в кэше
+    """
+    found, value = cache.peek(id)
+    return _compare(value, answer) if found else None
@@ -0,0 +1,67 @@
+"""
+Модуль с асинхронными версиями api функций (для запуска под ASGI, например uvicorn)
+
+Django 4.0 ещё не умеет выполнять запросы ORM из асинхронного кода, поэтому
+вся работа с базой и шаблонами уходит в поток через ``sync_to_async``, а в
+цикле событий остаётся только то, что не блокирует: лимит частоты в памяти
+процесса и проверка ответа по кэшу. Неправильный ответ, который есть в кэше,
+обрабатывается без переключения потоков вовсе
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+
+from main import answers, ratelimit
+from main.api.main import answer_result, bad_request, page_response, parse_id, search_response, too_many_requests
+from main.models import Task
+
+
+def async_login_required(view):
+    """
+    Асинхронный аналог login_required
+    Пользователь из сессии загружается в потоке, после этого request.user уже вычислен
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@async_login_required
+async def check_answer(request):
+    """
+    Проверка ответа на задачу
+    """
+    user_answer = request.GET.get('answer', '')
+    id = parse_id(request.GET.get('id', ''))
+    if id is None:
+        return bad_request('Некорректный id задачи')
+    if ratelimit.get_backend().blocking:
+        allowed, retry_after = await sync_to_async(ratelimit.allow_answer)(request.user.id, id)
+    else:
+        allowed, retry_after = ratelimit.allow_answer(request.user.id, id)
+    if not allowed:
+        return too_many_requests(retry_after)
+    is_ok = answers.check_cached(id, user_answer)
+    if is_ok is None or is_ok:
+        is_ok = await sync_to_async(Task.solve)(id, user_answer, request.user)
+    return answer_result(is_ok)
+
+
+@async_login_required
+async def tasks_search(request):
+    """
+    Полнотекстовый поиск задач по названию и описанию
+    """
+    return await sync_to_async(search_response)(request)
+
+
+@async_login_required
+async def tasks_page(request):
+    """
+    Получение следующей страницы каталога задач по курсору
+    """
+    return await sync_to_async(page_response)(request)
@@ -1,49 +1,166 @@
 """
 Модуль с api функциями
 """
+from typing import Optional
+
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.template.loader import render_to_string
 
-from main.models import Task
+from main import ratelimit
+from main.models import Complaint, Task
+from main.pagination import keyset_page
+from stego.settings import TASKS_PAGE_SIZE
 
 
-@login_required()
-def check_answer(request):
+def too_many_requests(retry_after: int) -> JsonResponse:
     """
-    Проверка ответа на задачу
+    Ответ 429 при превышении лимита частоты
+    """
+    response = JsonResponse({'retry_after': retry_after}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def bad_request(message: str) -> JsonResponse:
+    """
+    Ответ 400 на некорректный параметр запроса
+    """
+    return JsonResponse({'error': message}, status=400)
+
+
+def parse_id(value: str) -> Optional[int]:
+    """
+    id из параметра запроса: положительное десятичное число, иначе None
+    """
+    value = value.lstrip('0')
+    if not value.isascii() or not value.isdigit() or len(value) > 18:
+        return None
+    return int(value)
+
+
+def answer_result(is_ok: bool) -> JsonResponse:
+    """
+    Ответ с результатом проверки
     """
-    user_answer = request.GET.get('answer', '')
-    id = request.GET.get('id', -1)
-    task = Task.get_by_id(id)
-    right_answer = task.answer
-    if right_answer == user_answer:
-        task.set_done(request.user)
     return JsonResponse({
-        'is_ok': True if right_answer == user_answer else False,
+        'is_ok': is_ok,
         'message': '<p class="text-success fs-4">Правильный ответ</p>'
-        if right_answer == user_answer else
+        if is_ok else
         '<p class="text-danger fs-4">Неправильный ответ</p>'
     })
 
 
+@login_required()
+def check_answer(request):
+    """
+    Проверка ответа на задачу
+    Некорректный id отклоняется ответом 400, затем проверяется лимит частоты
+    (ответ 429 с Retry-After), затем неправильный ответ отклоняется по кэшу,
+    без обращения к базе
+    """
+    user_answer = request.GET.get('answer', '')
+    id = parse_id(request.GET.get('id', ''))
+    if id is None:
+        return bad_request('Некорректный id задачи')
+    allowed, retry_after = ratelimit.allow_answer(request.user.id, id)
+    if not allowed:
+        return too_many_requests(retry_after)
+    return answer_result(Task.solve(id, user_answer, request.user))
+
+
+def id_list(values: list) -> list:
+    """
+    Список id из параметров запроса, нечисловые значения отбрасываются
+    """
+    return [id for id in map(parse_id, values) if id is not None]
+
+
+@login_required()
+def complaints_resolve(request):
+    """
+    Массовое рассмотрение жалоб
+    Доступно только администраторам, принимает POST со списками id accept и dismiss
+    """
+    if not request.user.is_staff or request.method != 'POST':
+        raise Http404
+    result = Complaint.resolve_many(
+        accept=id_list(request.POST.getlist('accept')),
+        dismiss=id_list(request.POST.getlist('dismiss')),
+    )
+    return JsonResponse(result)
+
+
 @login_required()
 def tasks_search(request):
     """
-    Получение задач по названию
+    Полнотекстовый поиск задач по названию и описанию
+    """
+    return search_response(request)
+
+
+@login_required()
+def tasks_page(request):
+    """
+    Получение следующей страницы каталога задач по курсору
+    """
+    return page_response(request)
+
+
+def search_response(request) -> JsonResponse:
+    """
+    Формирование ответа поиска (общее для синхронной и асинхронной версий)
+
+    При ``format=json`` возвращается компактный список задач, который отрисовывает клиент:
+    ``title`` и ``snippet`` - уже экранированный HTML с подсветкой, ``author`` - обычный текст.
+    Иначе все карточки рендерятся за один проход шаблона
     """
     title = request.GET.get('title', '')
-    tasks = Task.get_by_title(title)
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    tasks, has_next = Task.search_by_text(title, page, TASKS_PAGE_SIZE)
+    done = Task.get_done_among(request.user, tasks)
+    next_page = page + 1 if has_next else ''
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'tasks': [
+                {
+                    'id': task.id,
+                    'title': task.title_highlight,
+                    'author': task.author.username,
+                    'solved': task.id in done,
+                    'snippet': task.snippet
+                } for task in tasks
+            ],
+            'next_page': next_page
+        })
     if not tasks:
         return JsonResponse({
-            'html': '<p class="text-danger fs-3">Ничего не найдено</p>'
+            'html': '<p class="text-danger fs-3">Ничего не найдено</p>' if page == 1 else '',
+            'next_page': ''
         }, safe=False)
-    tasks_html = ""
-    for task in tasks:
-        context = {
-            'item': [task, task.is_done(request.user)]
-        }
-        tasks_html += render_to_string('pages/tasks/card.html', context, request)
+    context = {
+        'items': [[task, task.id in done] for task in tasks]
+    }
     return JsonResponse({
-        'html': tasks_html
+        'html': render_to_string('pages/tasks/cards.html', context, request),
+        'next_page': next_page
     }, safe=False)
+
+
+def page_response(request) -> JsonResponse:
+    """
+    Формирование ответа со страницей каталога (общее для синхронной и асинхронной версий)
+    """
+    tasks, next_cursor = keyset_page(
+        Task.get_catalogue(request.user), request.GET.get('cursor', ''), TASKS_PAGE_SIZE
+    )
+    context = {
+        'items': [[task, task.solved] for task in tasks]
+    }
+    return JsonResponse({
+        'html': render_to_string('pages/tasks/cards.html', context, request),
+        'next': next_cursor
+    })
@@ -0,0 +1,143 @@
+"""
+Бенчмарки страниц и api функций
+
+Не входят в обычный прогон тестов (имя файла не начинается с test), запуск::
+
+    python manage.py test main.benchmarks
+
+В тестовой базе генерируется набор данных (см. main.dataset) с фиксированным
+seed, затем для каждой страницы и api функции измеряются перцентили задержки и
+количество SQL запросов, а после этого на живой сервер подаётся нагрузка от
+параллельных решающих (см. main.loadgen). Результаты пишутся в JSON
+(путь из переменной окружения ``BENCH_OUTPUT``, по умолчанию bench.json),
+чтобы сравнивать прогоны между собой
+"""
+import json
+import os
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client, LiveServerTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from main import answers, dataset, loadgen, profiles
+from main.models import Task, UserSettings
+from main.tests import TempMediaMixin
+
+
+class BenchmarkTest(TempMediaMixin, LiveServerTestCase):
+    """
+    Замер задержек и количества запросов на сгенерированных данных
+    """
+    SEED = 0
+    USERS = 2000
+    TASKS = 1000
+    SOLVES = 40000
+    COMPLAINTS = 300
+    ITERATIONS = 50
+    SOLVERS = 200
+    LOAD_REQUESTS = 2000
+    CONCURRENCY = 16
+
+    def setUp(self):
+        self.dataset = dataset.seed(
+            self.SEED, self.USERS, self.TASKS, self.SOLVES, self.COMPLAINTS, prefix='bench'
+        )
+        profiles.get_cache().clear()
+        answers.cache.clear()
+        self.tasks = list(Task.get_active().order_by('id').values_list('id', 'answer'))
+
+    @staticmethod
+    def measure(client: Client, make_path, iterations: int) -> dict:
+        """
+        Последовательные запросы одного клиента
+
+        :return: задержки в мс (перцентили и первый, "холодный" запрос) и количество SQL запросов
+        """
+        latencies, queries = [], []
+        for number in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(make_path(number))
+                latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, (make_path(number), response.status_code)
+            queries.append(len(context))
+        ordered = sorted(latencies)
+        return {
+            'requests': iterations,
+            'cold_ms': round(latencies[0], 2),
+            'p50_ms': round(loadgen.percentile(ordered, 0.5), 2),
+            'p95_ms': round(loadgen.percentile(ordered, 0.95), 2),
+            'p99_ms': round(loadgen.percentile(ordered, 0.99), 2),
+            'max_ms': round(ordered[-1], 2),
+            'cold_queries': queries[0],
+            'min_queries': min(queries),
+            'max_queries': max(queries),
+        }
+
+    def views(self) -> dict:
+        """
+        Замер страниц и api функций от имени самого активного пользователя
+        Лимит частоты ответов на время замера снят, чтобы мерить саму проверку
+        """
+        user = UserSettings.get_top(1)[0].user
+        client = Client()
+        client.force_login(user)
+        task_ids = [id for id, _ in self.tasks]
+        targets = {
+            'task_list': lambda number: '/tasks/list/',
+            'profile': lambda number: f'/accounts/profile/{user.id}/',
+            'history': lambda number: '/accounts/profile/history/',
+            'tasks_search': lambda number: (
+                f'/api/tasks_search/?format=json&title={dataset.WORDS[number % len(dataset.WORDS)]}'
+            ),
+            'check_answer': lambda number: (
+                f'/api/check_answer/?id={task_ids[number % len(task_ids)]}&answer=wrong{number}'
+            ),
+        }
+        unlimited = dict(settings.ANSWER_RATE_LIMIT, USER=(10 ** 6, 10 ** 6), TASK=(10 ** 6, 10 ** 6))
+        with override_settings(ANSWER_RATE_LIMIT=unlimited):
+            return {name: self.measure(client, make_path, self.ITERATIONS) for name, make_path in targets.items()}
+
+    def load(self) -> dict:
+        """
+        Параллельные решающие: у каждого своя сессия, примерно каждый десятый ответ правильный
+        Лимит частоты ответов действует, поэтому в кодах ответов могут быть 429
+        """
+        rng = random.Random(self.SEED)
+        cookies = []
+        for user in UserSettings.objects.select_related('user').order_by('id')[:self.SOLVERS]:
+            client = Client()
+            client.force_login(user.user)
+            cookies.append(client.cookies[settings.SESSION_COOKIE_NAME].value)
+        attempts = []
+        for _ in range(self.LOAD_REQUESTS):
+            id, answer = rng.choice(self.tasks)
+            attempts.append((id, answer if rng.random() < 0.1 else f'wrong{rng.random()}'))
+        result = loadgen.run(
+            self.live_server_url,
+            lambda number: f'/api/check_answer/?id={attempts[number][0]}&answer={attempts[number][1]}',
+            self.LOAD_REQUESTS,
+            self.CONCURRENCY,
+            lambda number: f'Cookie: {settings.SESSION_COOKIE_NAME}={cookies[number % len(cookies)]}\r\n'
+        )
+        result['solvers'] = len(cookies)
+        return result
+
+    def test_benchmark(self):
+        """
+        Полный прогон с записью результатов в JSON
+        После нагрузки счётчики решений должны сходиться с таблицей решений
+        """
+        results = {
+            'seed': self.SEED,
+            'dataset': self.dataset,
+            'database': connection.vendor,
+            'views': self.views(),
+            'load': self.load(),
+        }
+        self.assertEqual(Task.recount_done(), 0)
+        with open(os.environ.get('BENCH_OUTPUT', 'bench.json'), 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,196 @@
+"""
+Модуль с генерацией синтетических данных для бенчмарков и нагрузочных проверок
+
+Данные вставляются пачками (``bulk_create``, а решения - ``executemany`` напрямую
+в таблицу ``done``), поэтому сигналы моделей не вызываются. То, что обычно
+поддерживают сигналы и ``Task.set_done``, заполняется сразу при вставке
+(``done_count``, очки) или пересчитывается целиком после неё (гистограмма
+рейтинга, поисковый индекс). Производные изображения и отчёты стегоанализа
+не строятся - для них есть команды generate_derivatives и analyse_images.
+
+Популярность задач распределена по Парето: немногие задачи решают очень
+многие, на них же приходится большая часть жалоб. Генерация детерминирована:
+одинаковые ``seed`` и размеры дают одинаковые данные
+"""
+import io
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from main import lsb, search
+from main.models import Complaint, ScoreBucket, Task, UserSettings
+
+WORDS = (
+    'пиксель', 'шум', 'канал', 'палитра', 'контраст', 'секрет', 'ключ', 'шифр', 'кадр', 'маска',
+    'pixel', 'noise', 'channel', 'palette', 'secret', 'cipher', 'frame', 'mask', 'layer', 'bit',
+)
+PLACEHOLDER_IMAGE = 'images/tasks/dataset.png'
+IMAGE_DIR = 'images/tasks/dataset'
+IMAGE_SIZE = 64
+
+
+def words(rng: random.Random, count: int) -> str:
+    """
+    Случайный текст из словаря (чтобы полнотекстовый поиск что-то находил)
+    """
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def placeholder_image() -> str:
+    """
+    Общая картинка для задач без отдельного изображения
+    """
+    if not default_storage.exists(PLACEHOLDER_IMAGE):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), (56, 4, 108)).save(buffer, 'PNG')
+        default_storage.save(PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue()))
+    return PLACEHOLDER_IMAGE
+
+
+def image_name(seed: int, number: int) -> str:
+    """
+    Имя сгенерированного изображения задачи
+    """
+    return f'{IMAGE_DIR}/{seed}-{number}.png'
+
+
+def stego_image(seed: int, number: int, answer: str) -> bytes:
+    """
+    PNG со случайным градиентом и шумом (похоже на фотографию), в который встроен ответ
+
+    :param seed: seed набора данных
+    :param number: номер задачи, вместе с seed определяет картинку
+    :param answer: встраиваемый ответ
+    """
+    rng = np.random.default_rng([seed, number])
+    axis = np.linspace(0, 1, IMAGE_SIZE)
+    start, step = rng.uniform(0, 160, 3), rng.uniform(40, 95, (2, 3))
+    pixels = (
+        start + axis[:, None, None] * step[0] + axis[None, :, None] * step[1]
+        + rng.normal(0, 3, (IMAGE_SIZE, IMAGE_SIZE, 3))
+    )
+    cover = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
+    return lsb.to_png(lsb.encode(cover, answer))
+
+
+def write_stego_image(root: str, seed: int, number: int, answer: str):
+    """
+    Запись изображения задачи прямо в файл (выполняется в отдельном процессе)
+    """
+    path = os.path.join(root, image_name(seed, number))
+    with open(path, 'wb') as file:
+        file.write(stego_image(seed, number, answer))
+
+
+def write_stego_images(seed: int, answers: list, workers: Optional[int] = None):
+    """
+    Генерация изображений всех задач в пуле процессов
+    """
+    root = default_storage.path('')
+    os.makedirs(os.path.join(root, IMAGE_DIR), exist_ok=True)
+    count = len(answers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for _ in pool.map(
+                write_stego_image, [root] * count, [seed] * count, range(count), answers,
+                chunksize=max(1, count // 64)
+        ):
+            pass
+
+
+def seed(seed: int = 0, users: int = 2000, tasks: int = 500, solves: int = 20000, complaints: int = 200,
+         prefix: str = 'user', batch_size: int = 5000, images: bool = False, workers: Optional[int] = None,
+         progress: Callable[[str], None] = lambda message: None) -> dict:
+    """
+    Генерация пользователей, задач, решений и жалоб
+
+    :param seed: начальное значение генератора случайных чисел
+    :param users: количество пользователей
+    :param tasks: количество задач
+    :param solves: примерное количество решений (у одной задачи не больше ``users``)
+    :param complaints: количество жалоб
+    :param prefix: префикс логинов, пароль у всех ``password``
+    :param batch_size: размер пачки вставки
+    :param images: генерировать ли для каждой задачи своё изображение с встроенным ответом
+        (иначе у всех задач общая картинка)
+    :param workers: количество процессов для генерации изображений (по умолчанию - по ядрам)
+    :param progress: функция для сообщений о ходе генерации
+    :return: количество созданных объектов каждого вида
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    answers = [f'answer{i}' for i in range(tasks)]
+    if images:
+        progress('изображения')
+        write_stego_images(seed, answers, workers)
+    image = None if images else placeholder_image()
+    popularity = [rng.paretovariate(1.2) for _ in range(tasks)]
+    total = sum(popularity) or 1
+    done_counts = [min(users, round(solves * weight / total)) for weight in popularity]
+
+    with transaction.atomic():
+        progress('пользователи')
+        last_user = get_user_model().objects.aggregate(id=Max('id'))['id'] or 0
+        last_task = Task.objects.aggregate(id=Max('id'))['id'] or 0
+        password = make_password('password')
+        get_user_model().objects.bulk_create((
+            get_user_model()(username=f'{prefix}{i}', password=password, date_joined=now)
+            for i in range(users)
+        ), batch_size=batch_size)
+        user_ids = list(get_user_model().objects.filter(id__gt=last_user).order_by('id').values_list('id', flat=True))
+
+        progress('задачи')
+        points = [rng.randint(5, 50) for _ in range(tasks)]
+        Task.objects.bulk_create((
+            Task(
+                author_id=rng.choice(user_ids), title=words(rng, 3), description=words(rng, 30),
+                image=image_name(seed, i) if images else image, answer=answers[i], points=points[i],
+                score_tier=rng.randint(0, 300), active=rng.random() > 0.05, done_count=done_counts[i],
+            ) for i in range(tasks)
+        ), batch_size=batch_size)
+        task_ids = list(Task.objects.filter(id__gt=last_task).order_by('id').values_list('id', flat=True))
+
+        progress('решения')
+        scores = [0] * users
+        sql = f'INSERT INTO {Task.done.through._meta.db_table} (task_id, user_id) VALUES (%s, %s)'
+        rows = []
+        with connection.cursor() as cursor:
+            for task_id, task_points, count in zip(task_ids, points, done_counts):
+                for index in rng.sample(range(users), count):
+                    scores[index] += task_points
+                    rows.append((task_id, user_ids[index]))
+                if len(rows) >= batch_size:
+                    cursor.executemany(sql, rows)
+                    rows = []
+            cursor.executemany(sql, rows)
+
+        progress('настройки пользователей')
+        UserSettings.objects.bulk_create((
+            UserSettings(user_id=user_id, score=score) for user_id, score in zip(user_ids, scores)
+        ), batch_size=batch_size)
+
+        progress('жалобы')
+        Complaint.objects.bulk_create((
+            Complaint(author_id=rng.choice(user_ids), task_id=task_id, description=words(rng, 10))
+            for task_id in rng.choices(task_ids, weights=popularity, k=complaints)
+        ), batch_size=batch_size)
+
+        progress('рейтинг и поисковый индекс')
+        ScoreBucket.rebuild()
+        search.rebuild()
+    return {
+        'users': users,
+        'tasks': tasks,
+        'solves': sum(done_counts),
+        'complaints': complaints,
+    }
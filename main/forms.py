@@ -1,11 +1,17 @@
 """
 Модуль с формами
 """
+import os
+
 from django import forms
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.forms import ClearableFileInput, TextInput, EmailInput
+from PIL import Image, UnidentifiedImageError
 
-from main.models import UserSettings, Task, Complaint
+from main import lsb, perceptual
+from main.uploads import LimitedImageField
+from main.models import ImageHash, UserSettings, Task, Complaint
 
 
 class UserEditForm(forms.ModelForm):
@@ -26,21 +32,35 @@ class UserEditForm(forms.ModelForm):
 class UserSettingsEditForm(forms.ModelForm):
     """
     Форма редактирования настроек пользователя
+    Из аватара удаляются метаданные (EXIF с геометками и т.п.)
     """
+    avatar = LimitedImageField(
+        'avatar',
+        strip=True,
+        label='Аватар',
+        widget=ClearableFileInput(attrs={'class': 'form-control'})
+    )
 
     class Meta:
         model = UserSettings
         fields = ('avatar',)
-        labels = {'avatar': 'Аватар'}
-        widgets = {
-            'avatar': ClearableFileInput(attrs={'class': 'form-control'})
-        }
 
 
 class CreateTaskForm(forms.ModelForm):
     """
     Форма создания задачи
+    Изображение сравнивается по перцептивному хэшу с изображениями других задач,
+    и похожее можно опубликовать только с отметкой ``allow_duplicate``
     """
+    image = LimitedImageField(
+        'task',
+        label='Картинка со спрятанным текстом',
+        widget=ClearableFileInput(attrs={'class': 'form-control'})
+    )
+    allow_duplicate = forms.BooleanField(
+        label='Всё равно опубликовать, если есть похожие изображения',
+        required=False
+    )
 
     class Meta:
         model = Task
@@ -48,18 +68,97 @@ class CreateTaskForm(forms.ModelForm):
         labels = {
             'title': 'Название',
             'description': 'Описание',
-            'image': 'Картинка со спрятанным текстом',
             'answer': 'Ответ',
             'points': 'Очки за успешное прохождение задачи',
         }
         widgets = {
             'author': forms.HiddenInput(),
-            'image': ClearableFileInput(attrs={'class': 'form-control'}),
             'title': forms.TextInput(attrs={'autocomplete': 'off'}),
             'answer': forms.TextInput(attrs={'autocomplete': 'off'}),
             'score_tier': forms.HiddenInput()
         }
 
+    def clean(self) -> dict:
+        """
+        Поиск задач с похожими изображениями (список сохраняется в ``duplicates``)
+        """
+        cleaned_data = super().clean()
+        image = cleaned_data.get('image')
+        self.duplicates = []
+        if not image or cleaned_data.get('allow_duplicate'):
+            return cleaned_data
+        try:
+            image.seek(0)
+            hashes = perceptual.hashes(Image.open(image))
+        except (OSError, UnidentifiedImageError):
+            return cleaned_data
+        self.duplicates = ImageHash.find_similar(hashes)
+        if self.duplicates:
+            self.add_error('image', 'Похожие изображения уже есть в других задачах')
+        return cleaned_data
+
+
+class EncodeTaskForm(CreateTaskForm):
+    """
+    Форма создания задачи со встраиванием текста на сервере
+
+    Автор загружает обычное изображение, а текст прячется в младшие биты
+    выбранных каналов. Перед сохранением текст извлекается обратно и
+    проверяется, что ответ из него восстанавливается
+    """
+    image = LimitedImageField(
+        'task',
+        label='Картинка, в которую будет спрятан текст',
+        widget=ClearableFileInput(attrs={'class': 'form-control'})
+    )
+    secret = forms.CharField(
+        label='Спрятанный текст',
+        required=False,
+        widget=forms.Textarea(attrs={'rows': 3}),
+        help_text='Если оставить пустым, будет спрятан сам ответ'
+    )
+    channels = forms.MultipleChoiceField(
+        label='Каналы',
+        choices=[(channel, channel) for channel in lsb.CHANNELS],
+        initial=list(lsb.CHANNELS),
+        widget=forms.CheckboxSelectMultiple
+    )
+    bits = forms.TypedChoiceField(
+        label='Количество младших бит',
+        choices=[(bits, bits) for bits in range(1, 5)],
+        coerce=int,
+        initial=1
+    )
+
+    def clean(self) -> dict:
+        """
+        Встраивание текста в изображение и проверка, что он извлекается обратно
+        """
+        cleaned_data = super().clean()
+        image = cleaned_data.get('image')
+        answer = cleaned_data.get('answer')
+        if not image or not answer or self.errors:
+            return cleaned_data
+        secret = cleaned_data.get('secret') or answer
+        if answer not in secret:
+            self.add_error('secret', 'Спрятанный текст должен содержать ответ')
+            return cleaned_data
+        channels, bits = cleaned_data['channels'], cleaned_data['bits']
+        try:
+            image.seek(0)
+            encoded = lsb.encode(Image.open(image), secret, channels, bits)
+            if lsb.decode(encoded, channels, bits) != secret:
+                raise ValueError('Текст не восстанавливается из изображения')
+        except UnidentifiedImageError:
+            self.add_error('image', 'Не удалось прочитать изображение')
+            return cleaned_data
+        except ValueError as error:
+            self.add_error('image', str(error))
+            return cleaned_data
+        name = os.path.splitext(os.path.basename(image.name))[0] + '.png'
+        cleaned_data['image'] = SimpleUploadedFile(name, lsb.to_png(encoded), 'image/png')
+        return cleaned_data
+
 
 class CreateComplaintForm(forms.ModelForm):
     """
@@ -0,0 +1,93 @@
+"""
+Модуль с производными изображениями (превью и WebP)
+
+Для каждого загруженного изображения создаются уменьшенные копии в двух
+размерах и двух форматах (WebP и JPEG для старых браузеров). Копии лежат в
+``derived/`` рядом с оригиналами, а их имена однозначно выводятся из имени
+оригинала. Оригинал никогда не изменяется: задача строится на точных значениях
+пикселей, поэтому ссылка на скачивание всегда ведёт на него. Копии
+поворачиваются по EXIF-ориентации оригинала, так как сами её не хранят.
+
+Генерация (как и другая обработка изображений) выполняется фоновой задачей
+(см. main.jobs), чтобы не задерживать ответ на запрос с загрузкой
+"""
+import logging
+import posixpath
+from io import BytesIO
+from typing import Optional
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+SIZES = {
+    'thumb': (320, 320),
+    'display': (1280, 1280),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True}),
+}
+
+
+def derivative_name(name: str, size: str, extension: str) -> str:
+    """
+    Получение имени производного изображения по имени оригинала
+    """
+    stem = posixpath.splitext(name)[0]
+    return f'derived/{stem}_{size}.{extension}'
+
+
+def original_stem(name: str) -> Optional[str]:
+    """
+    Имя оригинала без расширения по имени производного изображения
+    (None, если это не производное изображение)
+    """
+    if not name.startswith('derived/'):
+        return None
+    stem, size = posixpath.splitext(name)[0][len('derived/'):].rpartition('_')[::2]
+    return stem if size in SIZES and stem else None
+
+
+def generate_derivatives(name: str) -> bool:
+    """
+    Создание всех производных изображений для оригинала
+
+    Если все копии уже существуют (например, для общего аватара по умолчанию),
+    повторно они не создаются
+
+    :param name: имя оригинала в хранилище
+    :return: True, если копии готовы
+    """
+    names = [
+        (size, extension, derivative_name(name, size, extension))
+        for size in SIZES for extension in FORMATS
+    ]
+    if all(default_storage.exists(derived) for _, _, derived in names):
+        return True
+    if not default_storage.exists(name):
+        return False
+    try:
+        with default_storage.open(name) as file:
+            original = Image.open(file)
+            original.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Не удалось открыть изображение %s', name)
+        return False
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+    for size, extension, derived in names:
+        image = original.copy()
+        image.thumbnail(SIZES[size], Image.LANCZOS)
+        image_format, options = FORMATS[extension]
+        if image_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, image_format, **options)
+        if default_storage.exists(derived):
+            default_storage.delete(derived)
+        default_storage.save(derived, ContentFile(buffer.getvalue()))
+    return True
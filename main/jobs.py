@@ -0,0 +1,167 @@
+"""
+Модуль с фоновыми задачами без внешнего брокера
+
+Очередь - таблица ``Job`` в основной базе. Представления и сигналы ставят
+задачи через ``Job.enqueue`` в своей транзакции, а выполняют их обработчики
+``manage.py run_jobs`` (несколько процессов, каждый забирает задачи сам,
+поэтому пропускная способность растёт с числом процессов). Задача, упавшая с
+ошибкой, повторяется с экспоненциальной задержкой, пока не кончатся попытки.
+
+Для разработки задачи можно выполнять в потоках процесса сайта
+(``settings.JOB_QUEUE['IN_PROCESS']``): после коммита транзакции с новой
+задачей фоновый поток разбирает очередь, пока она не опустеет
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from django.conf import settings
+from django.db import connection
+
+from main import images
+from main.models import ImageHash, ImageReport, Job, Task, UserSettings
+
+logger = logging.getLogger(__name__)
+
+HANDLERS: Dict[str, Callable] = {}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='jobs')
+_slots = threading.Semaphore(2)
+_wakeup = threading.Event()
+
+
+def handler(name: str) -> Callable:
+    """
+    Регистрация обработчика задач с именем ``name``
+    """
+    def register(func: Callable) -> Callable:
+        HANDLERS[name] = func
+        return func
+    return register
+
+
+@handler('task_derivatives')
+def task_derivatives(task_id: int, name: str):
+    """
+    Уменьшенные копии изображения задачи
+    """
+    if images.generate_derivatives(name):
+        Task.objects.filter(pk=task_id, image=name).update(image_derivatives=True)
+
+
+@handler('avatar_derivatives')
+def avatar_derivatives(usersettings_id: int, name: str):
+    """
+    Уменьшенные копии аватара
+    """
+    if images.generate_derivatives(name):
+        UserSettings.objects.filter(pk=usersettings_id, avatar=name).update(avatar_derivatives=True)
+
+
+@handler('analyse_task')
+def analyse_task(task_id: int, name: str):
+    """
+    Стегоанализ изображения задачи
+    """
+    ImageReport.analyse_task(task_id, name)
+
+
+@handler('index_image_hashes')
+def index_image_hashes(task_id: int, name: str):
+    """
+    Перцептивные хэши изображения задачи
+    """
+    ImageHash.index_task(task_id, name)
+
+
+@handler('recount_done')
+def recount_done():
+    """
+    Пересчёт количества решивших задачи
+    """
+    fixed = Task.recount_done()
+    if fixed:
+        logger.info('Исправлено задач: %s', fixed)
+
+
+def worker_name(suffix: str = '') -> str:
+    """
+    Имя обработчика: хост и pid процесса
+    """
+    return f'{socket.gethostname()}:{os.getpid()}{suffix}'
+
+
+def run(job: Job) -> bool:
+    """
+    Выполнение взятой задачи
+
+    :return: True, если задача выполнена
+    """
+    func = HANDLERS.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'Нет обработчика {job.name}')
+        func(*job.args)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Ошибка задачи %s %s (попытка %s)', job.name, job.args, job.attempts)
+        job.fail(traceback.format_exc(limit=5))
+        return False
+    job.finish()
+    return True
+
+
+def work(worker: str, batch: int = 1, once: bool = False, stop: Callable[[], bool] = lambda: False) -> int:
+    """
+    Цикл обработчика: забрать задачи, выполнить, повторить
+
+    :param worker: имя обработчика
+    :param batch: сколько задач забирать за раз
+    :param once: завершиться, когда задач, которые пора выполнять, не останется
+    :param stop: завершиться, как только вернёт True (проверяется между задачами)
+    :return: количество выполненных задач
+    """
+    done = 0
+    while not stop():
+        jobs = Job.claim(worker, batch)
+        if not jobs:
+            if Job.release_stale(settings.JOB_QUEUE['STALE_TIMEOUT']):
+                continue
+            if once:
+                break
+            time.sleep(settings.JOB_QUEUE['POLL_INTERVAL'])
+            continue
+        for job in jobs:
+            done += run(job)
+    return done
+
+
+def _drain():
+    """
+    Разбор очереди в фоновом потоке, пока в неё приходят новые задачи
+    """
+    try:
+        while True:
+            _wakeup.clear()
+            work(worker_name(f':{threading.current_thread().name}'), once=True)
+            if not _wakeup.is_set():
+                break
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Ошибка разбора очереди')
+    finally:
+        _slots.release()
+        connection.close()
+
+
+def drain_in_background():
+    """
+    Запуск разбора очереди в фоновом потоке (если свободных потоков нет,
+    новую задачу заберёт уже работающий поток)
+    """
+    _wakeup.set()
+    if _slots.acquire(blocking=False):
+        _executor.submit(_drain)
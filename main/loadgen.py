@@ -0,0 +1,117 @@
+"""
+Модуль с простым генератором HTTP-нагрузки на asyncio (без внешних зависимостей)
+
+Каждый из ``concurrency`` клиентов держит своё keep-alive соединение и
+последовательно отправляет GET-запросы. Для каждого запроса запоминается
+задержка и код ответа, по ним считаются запросы в секунду и перцентили
+"""
+import asyncio
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterator, List, Tuple
+from urllib.parse import urlsplit
+
+
+def percentile(values: List[float], share: float) -> float:
+    """
+    Перцентиль по отсортированному списку (ближайший ранг)
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(share * len(values)) - 1))]
+
+
+async def _read_response(reader: asyncio.StreamReader) -> Tuple[int, bool]:
+    """
+    Чтение одного ответа HTTP/1.1
+
+    :return: код ответа и признак того, что сервер закрывает соединение
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.read()
+        return status, True
+    return status, headers.get('connection') == 'close'
+
+
+async def _client(url: str, make_path: Callable[[int], str], counter: Iterator[int],
+                  headers: Callable[[int], str], results: list):
+    """
+    Один клиент: своё соединение, запросы до исчерпания общего счётчика
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    reader = writer = None
+    for number in counter:
+        if writer is None:
+            reader, writer = await asyncio.open_connection(host, port)
+        request = (
+            f'GET {make_path(number)} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+            f'{headers(number)}Connection: keep-alive\r\n\r\n'
+        )
+        started = time.perf_counter()
+        try:
+            writer.write(request.encode('latin-1'))
+            await writer.drain()
+            status, closed = await _read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            status, closed = 0, True
+        results.append((time.perf_counter() - started, status))
+        if closed:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _run(url, make_path, total, concurrency, headers) -> list:
+    counter = iter(range(total))
+    results = []
+    await asyncio.gather(*(
+        _client(url, make_path, counter, headers, results) for _ in range(concurrency)
+    ))
+    return results
+
+
+def run(url: str, make_path: Callable[[int], str], total: int, concurrency: int,
+        headers: Callable[[int], str] = lambda number: '') -> Dict:
+    """
+    Запуск нагрузки
+
+    :param url: адрес сервера (используются только хост и порт)
+    :param make_path: путь запроса по его номеру
+    :param total: общее количество запросов
+    :param concurrency: количество одновременных клиентов
+    :param headers: дополнительные заголовки по номеру запроса (строки с \\r\\n в конце)
+    :return: сводка: запросы в секунду, перцентили задержки в мс, коды ответов
+    """
+    started = time.perf_counter()
+    results = asyncio.run(_run(url, make_path, total, concurrency, headers))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    return {
+        'requests': len(results),
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(results) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        'statuses': dict(Counter(status for _, status in results)),
+    }
@@ -0,0 +1,114 @@
+"""
+Модуль со стеганографией в младших битах (LSB)
+
+Текст кодируется в UTF-8, перед ним записывается длина (4 байта, big-endian).
+Биты сообщения раскладываются по ``bits`` младшим битам выбранных каналов
+пикселей в порядке обхода изображения (строка за строкой, внутри пикселя - в
+порядке каналов). Вся работа идёт над массивами NumPy целиком, без циклов по
+пикселям, поэтому многомегапиксельные изображения обрабатываются за доли секунды
+"""
+from io import BytesIO
+from typing import Iterable
+
+import numpy as np
+from PIL import Image
+
+CHANNELS = 'RGB'
+HEADER_BYTES = 4
+
+
+def _prepare(image: Image.Image) -> Image.Image:
+    """
+    Приведение изображения к RGB или RGBA
+    """
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    return image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+
+
+def _channel_indexes(channels: Iterable[str]) -> list:
+    """
+    Номера каналов в порядке RGB
+    """
+    indexes = sorted({CHANNELS.index(channel) for channel in channels})
+    if not indexes:
+        raise ValueError('Не выбраны каналы')
+    return indexes
+
+
+def capacity(image: Image.Image, channels: Iterable[str], bits: int) -> int:
+    """
+    Сколько байт текста помещается в изображение
+    """
+    width, height = image.size
+    return width * height * len(_channel_indexes(channels)) * bits // 8 - HEADER_BYTES
+
+
+def encode(image: Image.Image, text: str, channels: Iterable[str] = CHANNELS, bits: int = 1) -> Image.Image:
+    """
+    Встраивание текста в изображение
+
+    :param image: изображение-контейнер
+    :param text: скрываемый текст
+    :param channels: каналы, в которые идёт запись (подмножество RGB)
+    :param bits: сколько младших бит каждого канала используется (1-8)
+    :return: новое изображение с текстом (сохранять нужно без потерь, например в PNG)
+    """
+    if not 1 <= bits <= 8:
+        raise ValueError('Глубина должна быть от 1 до 8 бит')
+    image = _prepare(image)
+    indexes = _channel_indexes(channels)
+    payload = text.encode('utf-8')
+    if len(payload) > capacity(image, channels, bits):
+        raise ValueError('Текст не помещается в изображение')
+    payload = len(payload).to_bytes(HEADER_BYTES, 'big') + payload
+
+    stream = np.unpackbits(np.frombuffer(payload, dtype=np.uint8))
+    stream = np.concatenate([stream, np.zeros(-len(stream) % bits, dtype=np.uint8)])
+    weights = (1 << np.arange(bits - 1, -1, -1)).astype(np.uint8)
+    values = stream.reshape(-1, bits) @ weights
+
+    pixels = np.array(image, dtype=np.uint8)
+    carrier = pixels[..., indexes].reshape(-1)
+    keep = np.uint8(0xFF ^ ((1 << bits) - 1))
+    carrier[:len(values)] = (carrier[:len(values)] & keep) | values.astype(np.uint8)
+    pixels[..., indexes] = carrier.reshape(pixels.shape[:2] + (len(indexes),))
+    return Image.fromarray(pixels, image.mode)
+
+
+def _read_bits(carrier: np.ndarray, bits: int, count: int) -> np.ndarray:
+    """
+    Чтение ``count`` бит сообщения из начала носителя
+    """
+    values = carrier[:-(-count // bits)]
+    shifts = np.arange(bits - 1, -1, -1, dtype=np.uint8)
+    return ((values[:, None] >> shifts) & 1).astype(np.uint8).reshape(-1)[:count]
+
+
+def decode(image: Image.Image, channels: Iterable[str] = CHANNELS, bits: int = 1) -> str:
+    """
+    Извлечение текста, записанного функцией encode
+
+    :raises ValueError: если в изображении нет корректного сообщения
+    """
+    image = _prepare(image)
+    indexes = _channel_indexes(channels)
+    carrier = np.asarray(image, dtype=np.uint8)[..., indexes].reshape(-1)
+    header = np.packbits(_read_bits(carrier, bits, HEADER_BYTES * 8)).tobytes()
+    length = int.from_bytes(header, 'big')
+    if length > len(carrier) * bits // 8 - HEADER_BYTES:
+        raise ValueError('В изображении нет сообщения')
+    message = np.packbits(_read_bits(carrier, bits, (HEADER_BYTES + length) * 8))[HEADER_BYTES:]
+    try:
+        return message.tobytes().decode('utf-8')
+    except UnicodeDecodeError as error:
+        raise ValueError('В изображении нет сообщения') from error
+
+
+def to_png(image: Image.Image) -> bytes:
+    """
+    Сохранение изображения в PNG (без потерь, иначе младшие биты испортятся)
+    """
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
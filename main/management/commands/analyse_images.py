@@ -0,0 +1,58 @@
+"""
+Команда стегоанализа изображений уже созданных задач
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from main.analysis import analyse_file
+from main.models import ImageReport, Task
+
+
+class Command(BaseCommand):
+    """
+    Построение отчётов ImageReport для задач без отчёта (или с устаревшим)
+    Изображения анализируются в пуле процессов, отчёты пишутся пачками
+    """
+    help = 'Строит отчёты стегоанализа для изображений задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Количество процессов (по умолчанию - по ядрам)')
+        parser.add_argument('--batch', type=int, default=500, help='Размер пачки записи в базу')
+        parser.add_argument('--all', action='store_true', help='Пересчитать и актуальные отчёты')
+
+    def handle(self, *args, **options):
+        tasks = Task.objects.exclude(image='')
+        if not options['all']:
+            tasks = tasks.exclude(report__image_name=F('image'))
+        jobs = list(tasks.values_list('id', 'image'))
+        done = 0
+        reports = []
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(analyse_file, default_storage.path(name)): (id, name) for id, name in jobs
+            }
+            for future in as_completed(futures):
+                id, name = futures[future]
+                try:
+                    report = future.result()
+                except Exception as error:  # pylint: disable=broad-except
+                    self.stderr.write(f'Задача {id}: {error}')
+                    continue
+                reports.append(ImageReport(task_id=id, image_name=name, **report))
+                if len(reports) >= options['batch']:
+                    done += self.save(reports)
+                    reports = []
+        done += self.save(reports)
+        self.stdout.write(f'Проанализировано изображений: {done} из {len(jobs)}')
+
+    @staticmethod
+    def save(reports: list) -> int:
+        """
+        Запись пачки отчётов (старые отчёты этих задач заменяются)
+        """
+        ImageReport.objects.filter(task_id__in=[report.task_id for report in reports]).delete()
+        ImageReport.objects.bulk_create(reports)
+        return len(reports)
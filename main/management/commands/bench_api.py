@@ -0,0 +1,84 @@
+"""
+Команда нагрузочного сравнения синхронных и асинхронных api функций
+"""
+import json
+import random
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+
+from main import loadgen
+from main.models import Task
+
+ENDPOINTS = {
+    'check_answer': lambda task_ids, number: f'check_answer/?id={random.choice(task_ids)}&answer=bench{number}',
+    'tasks_search': lambda task_ids, number: f'tasks_search/?format=json&title=task{number % 10}',
+    'tasks_page': lambda task_ids, number: 'tasks_page/',
+}
+
+
+class Command(BaseCommand):
+    """
+    Нагрузка на уже запущенный сервер и вывод сводки в JSON
+
+    Сервер нужно запускать без лимита частоты ответов, иначе check_answer
+    почти целиком мерит ответы 429. Коды ответов выводятся в сводке, о 429
+    команда дополнительно предупреждает
+
+    Пример сравнения (один процесс в обоих случаях)::
+
+        ANSWER_RATE_LIMIT=0 uvicorn stego.asgi:application --port 8001
+        python manage.py bench_api --url http://127.0.0.1:8001/ --prefix api/async/
+        python manage.py bench_api --url http://127.0.0.1:8001/ --prefix api/
+    """
+    help = 'Нагрузочный тест api функций на запущенном сервере'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=settings.BASE_URL, help='Адрес сервера')
+        parser.add_argument('--prefix', default='api/', help='api/ (синхронные) или api/async/ (асинхронные)')
+        parser.add_argument('--endpoint', action='append', choices=list(ENDPOINTS), help='Можно указать несколько раз')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--users', type=int, default=50, help='Сколько пользователей (сессий) использовать')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        cookies = [self.login(user) for user in get_user_model().objects.order_by('id')[:options['users']]]
+        task_ids = list(Task.get_active().values_list('id', flat=True)[:1000])
+        if not cookies or not task_ids:
+            raise CommandError('Нужны пользователи и активные задачи')
+        results = {}
+        for endpoint in options['endpoint'] or list(ENDPOINTS):
+            make_path = ENDPOINTS[endpoint]
+            results[endpoint] = loadgen.run(
+                options['url'],
+                lambda number, make_path=make_path: '/' + options['prefix'] + make_path(task_ids, number),
+                options['requests'],
+                options['concurrency'],
+                lambda number: f'Cookie: {settings.SESSION_COOKIE_NAME}={cookies[number % len(cookies)]}\r\n'
+            )
+            limited = results[endpoint]['statuses'].get(429, 0)
+            if limited:
+                self.stderr.write(
+                    f'{endpoint}: {limited} из {results[endpoint]["requests"]} ответов - 429, '
+                    f'запустите сервер с ANSWER_RATE_LIMIT=0'
+                )
+        output = json.dumps({'prefix': options['prefix'], 'results': results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        self.stdout.write(output)
+
+    @staticmethod
+    def login(user) -> str:
+        """
+        Создание сессии пользователя, возвращается её ключ
+        """
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
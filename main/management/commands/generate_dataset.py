@@ -0,0 +1,57 @@
+"""
+Команда генерации синтетических данных производственного размера
+"""
+import json
+import re
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from main import dataset
+
+
+class Command(BaseCommand):
+    """
+    Массовая генерация пользователей, задач (с изображениями), решений и жалоб (см. main.dataset)
+
+    Пример::
+
+        python manage.py generate_dataset --seed 1
+        python manage.py generate_derivatives
+        python manage.py analyse_images
+    """
+    help = 'Генерирует пользователей, задачи, решения и жалобы пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--tasks', type=int, default=20000)
+        parser.add_argument('--solves', type=int, default=3000000, help='Примерное количество решений')
+        parser.add_argument('--complaints', type=int, default=50000)
+        parser.add_argument('--prefix', default='user', help='Префикс логинов (пароль у всех "password")')
+        parser.add_argument('--batch', type=int, default=5000, help='Размер пачки вставки')
+        parser.add_argument(
+            '--no-images', action='store_true', help='Общая картинка вместо изображений со встроенным ответом'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None, help='Процессов для изображений (по умолчанию - по ядрам)'
+        )
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if get_user_model().objects.filter(username__regex=rf'^{re.escape(prefix)}[0-9]+$').exists():
+            raise CommandError(f'Пользователи с префиксом "{prefix}" уже есть, укажите другой --prefix')
+        started = time.perf_counter()
+        if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous = OFF')
+        result = dataset.seed(
+            options['seed'], options['users'], options['tasks'], options['solves'], options['complaints'],
+            prefix=prefix, batch_size=options['batch'], images=not options['no_images'],
+            workers=options['workers'],
+            progress=lambda message: self.stdout.write(f'{time.perf_counter() - started:8.1f} с: {message}'),
+        )
+        result['seconds'] = round(time.perf_counter() - started, 1)
+        self.stdout.write(json.dumps(result))
@@ -0,0 +1,25 @@
+"""
+Команда генерации уменьшенных копий для уже загруженных изображений
+"""
+from django.core.management.base import BaseCommand
+
+from main.images import generate_derivatives
+from main.models import Task, UserSettings
+
+
+class Command(BaseCommand):
+    """
+    Создание превью и WebP для задач и аватаров, у которых их ещё нет
+    Одинаковые файлы (например, аватар по умолчанию) обрабатываются один раз
+    """
+    help = 'Создаёт уменьшенные копии изображений задач и аватаров'
+
+    def handle(self, *args, **options):
+        for model, field, flag in (
+                (Task, 'image', 'image_derivatives'),
+                (UserSettings, 'avatar', 'avatar_derivatives'),
+        ):
+            names = model.objects.filter(**{flag: False}).values_list(field, flat=True).distinct()
+            ready = [name for name in names.iterator() if name and generate_derivatives(name)]
+            updated = model.objects.filter(**{flag: False, f'{field}__in': ready}).update(**{flag: True})
+            self.stdout.write(f'{model.__name__}: обработано файлов {len(ready)}, записей {updated}')
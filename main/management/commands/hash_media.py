@@ -0,0 +1,93 @@
+"""
+Команда перевода уже загруженных изображений на имена по хэшу содержимого
+"""
+import os
+import shutil
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Value, When
+
+from main import images, profiles
+from main.models import DEFAULT_AVATAR, ImageHash, ImageReport, Task, UserSettings
+from main.storage import content_addressed_storage, is_content_addressed
+
+
+class Command(BaseCommand):
+    """
+    Копирование файлов под имена по хэшу (одинаковые файлы хранятся один раз)
+    и замена путей в ImageField пачками, по одному UPDATE на пачку.
+    Готовые уменьшенные копии копируются вслед за оригиналом, отчёты
+    стегоанализа и перцептивные хэши получают новое имя файла. Старые файлы
+    остаются на месте (пока страницы со старыми путями могут быть в кэше),
+    если не указан --delete.
+    Аватар по умолчанию не переносится
+    """
+    help = 'Переводит изображения задач и аватары на имена по хэшу содержимого'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=500, help='Сколько путей заменять одним UPDATE')
+        parser.add_argument('--delete', action='store_true', help='Удалить старые файлы после переноса')
+
+    def handle(self, *args, **options):
+        for model, field, skip in ((Task, 'image', ['']), (UserSettings, 'avatar', ['', DEFAULT_AVATAR])):
+            names = model.objects.exclude(**{f'{field}__in': skip}).exclude(
+                **{f'{field}__isnull': True}
+            ).values_list(field, flat=True).distinct()
+            renames = {}
+            for name in names.iterator():
+                if is_content_addressed(name) or not default_storage.exists(name):
+                    continue
+                with default_storage.open(name) as file:
+                    renames[name] = content_addressed_storage.save(name, file)
+                self.copy_derivatives(name, renames[name])
+            updated = 0
+            items = list(renames.items())
+            for start in range(0, len(items), options['batch']):
+                updated += self.rename(model, field, dict(items[start:start + options['batch']]))
+            if options['delete']:
+                for name in renames:
+                    self.delete(name)
+            self.stdout.write(f'{model.__name__}: перенесено файлов {len(renames)}, записей {updated}')
+        profiles.invalidate_all()
+
+    @staticmethod
+    def rename(model, field: str, renames: dict) -> int:
+        """
+        Замена путей одной пачки одним UPDATE (и имён файлов в отчётах стегоанализа и перцептивных хэшах)
+        """
+        def new_name(column: str) -> Case:
+            return Case(*(When(**{column: old}, then=Value(new)) for old, new in renames.items()))
+        with transaction.atomic():
+            if model is Task:
+                for related in (ImageReport, ImageHash):
+                    related.objects.filter(image_name__in=renames).update(image_name=new_name('image_name'))
+            return model.objects.filter(**{f'{field}__in': renames}).update(**{field: new_name(field)})
+
+    @staticmethod
+    def copy_derivatives(old: str, new: str):
+        """
+        Копирование готовых уменьшенных копий под новое имя оригинала (жёсткой ссылкой, если можно)
+        """
+        for size in images.SIZES:
+            for extension in images.FORMATS:
+                source = images.derivative_name(old, size, extension)
+                target = images.derivative_name(new, size, extension)
+                if not default_storage.exists(source) or default_storage.exists(target):
+                    continue
+                os.makedirs(os.path.dirname(default_storage.path(target)), exist_ok=True)
+                try:
+                    os.link(default_storage.path(source), default_storage.path(target))
+                except OSError:
+                    shutil.copyfile(default_storage.path(source), default_storage.path(target))
+
+    @staticmethod
+    def delete(name: str):
+        """
+        Удаление старого файла вместе с его уменьшенными копиями
+        """
+        default_storage.delete(name)
+        for size in images.SIZES:
+            for extension in images.FORMATS:
+                default_storage.delete(images.derivative_name(name, size, extension))
@@ -0,0 +1,58 @@
+"""
+Команда подсчёта перцептивных хэшей изображений уже созданных задач
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from main.models import ImageHash, Task
+from main.perceptual import file_hashes
+
+
+class Command(BaseCommand):
+    """
+    Построение ImageHash для задач без хэшей (или с устаревшими)
+    Изображения обрабатываются в пуле процессов, хэши пишутся пачками
+    """
+    help = 'Считает перцептивные хэши изображений задач для поиска похожих'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Количество процессов (по умолчанию - по ядрам)')
+        parser.add_argument('--batch', type=int, default=2000, help='Размер пачки записи в базу')
+        parser.add_argument('--all', action='store_true', help='Пересчитать и актуальные хэши')
+
+    def handle(self, *args, **options):
+        tasks = Task.objects.exclude(image='')
+        if not options['all']:
+            tasks = tasks.exclude(hashes__image_name=F('image'))
+        jobs = [(id, name) for id, name in tasks.values_list('id', 'image') if default_storage.exists(name)]
+        done = 0
+        rows = []
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(file_hashes, default_storage.path(name)): (id, name) for id, name in jobs
+            }
+            for future in as_completed(futures):
+                id, name = futures[future]
+                try:
+                    hashes = future.result()
+                except Exception as error:  # pylint: disable=broad-except
+                    self.stderr.write(f'Задача {id}: {error}')
+                    continue
+                rows.append(ImageHash(task_id=id, image_name=name, **ImageHash.fields_for(hashes)))
+                if len(rows) >= options['batch']:
+                    done += self.save(rows)
+                    rows = []
+        done += self.save(rows)
+        self.stdout.write(f'Обработано изображений: {done} из {len(jobs)}')
+
+    @staticmethod
+    def save(rows: list) -> int:
+        """
+        Запись пачки хэшей (старые хэши этих задач заменяются)
+        """
+        ImageHash.objects.filter(task_id__in=[row.task_id for row in rows]).delete()
+        ImageHash.objects.bulk_create(rows)
+        return len(rows)
@@ -0,0 +1,18 @@
+"""
+Команда пересборки гистограммы рейтинга
+"""
+from django.core.management.base import BaseCommand
+
+from main.models import ScoreBucket
+
+
+class Command(BaseCommand):
+    """
+    Пересборка ScoreBucket по текущим очкам пользователей
+    Нужна после ручного изменения очков в обход Task.set_done
+    """
+    help = 'Пересобирает гистограмму очков для рейтинга'
+
+    def handle(self, *args, **options):
+        ScoreBucket.rebuild()
+        self.stdout.write(f'Корзин в рейтинге: {ScoreBucket.objects.count()}')
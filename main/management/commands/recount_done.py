@@ -0,0 +1,25 @@
+"""
+Команда пересчёта количества решивших задачи
+"""
+from django.core.management.base import BaseCommand
+
+from main.models import Job, Task
+
+
+class Command(BaseCommand):
+    """
+    Сверка ``Task.done_count`` с таблицей ``done`` и исправление расхождений
+    Расхождения появляются, например, при удалении пользователей (строки ``done`` удаляются каскадно)
+    """
+    help = 'Пересчитывает Task.done_count по таблице решений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enqueue', action='store_true', help='Поставить пересчёт в очередь фоновых задач')
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            Job.enqueue('recount_done', priority=Job.LOW, key='recount_done')
+            self.stdout.write('Пересчёт поставлен в очередь')
+            return
+        fixed = Task.recount_done()
+        self.stdout.write(f'Исправлено задач: {fixed}')
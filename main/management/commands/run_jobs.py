@@ -0,0 +1,71 @@
+"""
+Команда запуска обработчиков фоновых задач
+"""
+import multiprocessing
+import os
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main import jobs
+from main.models import Job
+
+
+def serve(batch: int, once: bool) -> int:
+    """
+    Обработчик в отдельном процессе. SIGINT и SIGTERM завершают его после текущей задачи
+    """
+    stopping = []
+    for number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(number, lambda *args: stopping.append(True))
+    return jobs.work(jobs.worker_name(), batch, once, lambda: bool(stopping))
+
+
+def serve_process(batch: int, once: bool, counter):
+    """
+    Обработчик в дочернем процессе, количество выполненных задач прибавляется к ``counter``
+    """
+    done = serve(batch, once)
+    with counter.get_lock():
+        counter.value += done
+
+
+class Command(BaseCommand):
+    """
+    Несколько процессов-обработчиков, каждый сам забирает задачи из очереди.
+    SIGINT или SIGTERM останавливает их после текущих задач
+    """
+    help = 'Выполняет фоновые задачи из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Количество процессов')
+        parser.add_argument('--batch', type=int, default=1, help='Сколько задач процесс забирает за раз')
+        parser.add_argument('--once', action='store_true', help='Завершиться, когда очередь опустеет')
+        parser.add_argument('--retry-failed', action='store_true', help='Вернуть в очередь невыполненные задачи')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            self.stdout.write(f'Возвращено в очередь: {Job.retry_failed()}')
+        if options['workers'] == 1:
+            done = serve(options['batch'], options['once'])
+            self.stdout.write(f'Выполнено задач: {done}')
+            return
+        connections.close_all()
+        counter = multiprocessing.Value('i', 0)
+        processes = [
+            multiprocessing.Process(target=serve_process, args=(options['batch'], options['once'], counter))
+            for _ in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+
+        def stop(*args):  # pylint: disable=unused-argument
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, signal.SIGTERM)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        for process in processes:
+            process.join()
+        self.stdout.write(f'Выполнено задач: {counter.value}')
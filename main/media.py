@@ -0,0 +1,181 @@
+"""
+Модуль с раздачей загруженных файлов
+
+Представление ``serve`` поддерживает запросы диапазонов (Range, If-Range),
+сильные ETag с ответом 304 и передачу файла веб-серверу
+(``settings.MEDIA_SENDFILE``): ``x-sendfile`` для Apache/lighttpd или
+``x-accel-redirect`` для nginx. Во втором случае Python только проверяет доступ,
+а байты (в том числе диапазоны) отдаёт сам веб-сервер.
+
+Изображения задач и их уменьшенные копии отдаются, только пока есть
+активная задача с этим файлом. Файлы с именами по хэшу (см. main.storage)
+кэшируются бессрочно, поэтому после блокировки задачи копия может остаться
+в кэше браузера или прокси, но с сервера файл больше не отдаётся
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags
+
+from main import images
+from main.models import Task
+from main.storage import IMMUTABLE_CACHE_CONTROL, HASHED_NAME
+
+TASK_IMAGES = 'images/tasks/'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def is_allowed(name: str) -> bool:
+    """
+    Проверка доступа: изображение задачи (или его копия) отдаётся, пока задача активна
+    """
+    original = images.original_stem(name)
+    if original is not None:
+        if not original.startswith(TASK_IMAGES):
+            return True
+        return Task.objects.filter(active=True, image__range=(f'{original}.', f'{original}.\uffff')).exists()
+    if not name.startswith(TASK_IMAGES):
+        return True
+    return Task.objects.filter(active=True, image=name).exists()
+
+
+def make_etag(name: str, stat: os.stat_result) -> str:
+    """
+    Сильный ETag: хэш из имени для файлов по хэшу содержимого, иначе время изменения и размер
+    """
+    match = HASHED_NAME.search(name)
+    if match is not None:
+        return f'"{match.group(3)}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбор заголовка Range с одним диапазоном
+
+    :return: (первый байт, последний байт) или None, если заголовок не поддерживается
+        (тогда отдаётся весь файл)
+    :raise ValueError: если диапазон не пересекается с файлом (ответ 416)
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        length = int(last)
+        if not length:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first > last:
+        if first >= size:
+            raise ValueError(header)
+        return None
+    return first, last
+
+
+def read_range(path: str, first: int, length: int):
+    """
+    Чтение диапазона файла кусками
+    """
+    with open(path, 'rb') as file:
+        file.seek(first)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offload(name: str, path: str) -> Optional[HttpResponse]:
+    """
+    Ответ, по которому файл отдаёт веб-сервер, или None, если передача не настроена
+    """
+    if settings.MEDIA_SENDFILE == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = path
+    elif settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+    else:
+        return None
+    del response['Content-Type']
+    return response
+
+
+def build_response(request, path: str, size: int, etag: str) -> HttpResponse:
+    """
+    Ответ с файлом целиком или с запрошенным диапазоном
+    """
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    header = request.META.get('HTTP_RANGE', '')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    byte_range = None
+    if header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)  # pylint: disable=consider-using-with
+        response['Content-Length'] = str(size)
+        return response
+    first, last = byte_range
+    response = StreamingHttpResponse(read_range(path, first, last - first + 1), status=206, content_type=content_type)
+    response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    response['Content-Length'] = str(last - first + 1)
+    return response
+
+
+def serve(request, path: str):
+    """
+    Отдача загруженного файла
+    Параметр ``download`` добавляет Content-Disposition: attachment
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = default_storage.path(name)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError) as error:
+        raise Http404 from error
+    if not os.path.isfile(full_path) or not is_allowed(name):
+        raise Http404
+    etag = make_etag(name, stat)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(name) else REVALIDATE_CACHE_CONTROL,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+    }
+    if 'download' in request.GET:
+        headers['Content-Disposition'] = f'attachment; filename="{posixpath.basename(name)}"'
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponse(status=304)
+        for header, value in headers.items():
+            if header != 'Accept-Ranges':
+                response[header] = value
+        return response
+
+    response = offload(name, full_path)
+    if response is None:
+        response = build_response(request, full_path, stat.st_size, etag)
+    for header, value in headers.items():
+        response[header] = value
+    return response
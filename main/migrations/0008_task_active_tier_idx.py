@@ -0,0 +1,17 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_remove_task_group'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['active', 'score_tier'], name='task_active_tier_idx'),
+        ),
+    ]
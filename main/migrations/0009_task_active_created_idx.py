@@ -0,0 +1,17 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_task_active_tier_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['active', 'created', 'id'], name='task_active_created_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_index(apps, schema_editor):
+    """
+    Создание индекса FTS5 и заполнение его активными задачами
+    На базах без FTS5 индекс не создаётся, поиск работает через icontains
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE main_task_fts USING fts5('
+            'title, description, tokenize="unicode61 remove_diacritics 2")'
+        )
+    except OperationalError:
+        return
+    schema_editor.execute(
+        'INSERT INTO main_task_fts (rowid, title, description) '
+        'SELECT id, title, description FROM main_task WHERE active'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS main_task_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_task_active_created_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
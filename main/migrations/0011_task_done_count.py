@@ -0,0 +1,30 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:28
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_done_count(apps, schema_editor):
+    Task = apps.get_model('main', 'Task')
+    Task.objects.update(done_count=Coalesce(Subquery(
+        Task.done.through.objects.filter(
+            task_id=OuterRef('pk')
+        ).values('task_id').annotate(count=Count('*')).values('count')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_task_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='done_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_done_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:29
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_buckets(apps, schema_editor):
+    ScoreBucket = apps.get_model('main', 'ScoreBucket')
+    UserSettings = apps.get_model('main', 'UserSettings')
+    ScoreBucket.objects.bulk_create(
+        ScoreBucket(score=row['score'], count=row['count'])
+        for row in UserSettings.objects.values('score').annotate(count=Count('id'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_task_done_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(unique=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='usersettings',
+            index=models.Index(fields=['-score', 'id'], name='usersettings_score_idx'),
+        ),
+        migrations.RunPython(fill_buckets, migrations.RunPython.noop),
+    ]
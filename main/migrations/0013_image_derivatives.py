@@ -0,0 +1,23 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_scorebucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='image_derivatives',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='usersettings',
+            name='avatar_derivatives',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_name', models.CharField(max_length=255)),
+                ('chi_square', models.FloatField()),
+                ('rs_estimate', models.FloatField()),
+                ('lsb_entropy', models.FloatField()),
+                ('bitplane_entropy', models.JSONField()),
+                ('detectability', models.FloatField()),
+                ('capacity', models.IntegerField()),
+                ('estimated_payload', models.IntegerField()),
+                ('created', models.DateTimeField(auto_now=True)),
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='report', to='main.task')),
+            ],
+        ),
+    ]
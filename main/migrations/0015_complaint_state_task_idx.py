@@ -0,0 +1,17 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_imagereport'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['state', 'task'], name='complaint_state_task_idx'),
+        ),
+    ]
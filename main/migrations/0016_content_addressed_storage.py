@@ -0,0 +1,24 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:48
+
+from django.db import migrations, models
+import main.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_complaint_state_task_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='task',
+            name='image',
+            field=models.ImageField(storage=main.storage.ContentAddressedStorage(), upload_to='images/tasks/'),
+        ),
+        migrations.AlterField(
+            model_name='usersettings',
+            name='avatar',
+            field=models.ImageField(default='images/users/no_avatar.png', storage=main.storage.ContentAddressedStorage(), upload_to='images/users/'),
+        ),
+    ]
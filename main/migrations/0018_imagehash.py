@@ -0,0 +1,45 @@
+# Generated by Django 4.0.2 on 2026-10-18 17:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_task_image_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageHash',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_name', models.CharField(max_length=255)),
+                ('ahash', models.BigIntegerField()),
+                ('dhash', models.BigIntegerField()),
+                ('phash', models.BigIntegerField()),
+                ('phash_0', models.PositiveIntegerField()),
+                ('phash_1', models.PositiveIntegerField()),
+                ('phash_2', models.PositiveIntegerField()),
+                ('phash_3', models.PositiveIntegerField()),
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='hashes', to='main.task')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='imagehash',
+            index=models.Index(fields=['phash_0'], name='imagehash_phash_0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagehash',
+            index=models.Index(fields=['phash_1'], name='imagehash_phash_1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagehash',
+            index=models.Index(fields=['phash_2'], name='imagehash_phash_2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagehash',
+            index=models.Index(fields=['phash_3'], name='imagehash_phash_3_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -1,22 +1,48 @@
 """
 Модуль с моделями
 """
-from typing import List
+from datetime import timedelta
+from typing import Iterable, List, Optional, Tuple
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
-from django.db.models.signals import post_save
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, Exists, F, Func, IntegerField, Max, OuterRef, QuerySet, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.html import escape
+from django.utils.text import Truncator
+from PIL import Image
+
+from main import analysis, answers, perceptual, profiles, search
+from main.pagination import count_page
+from main.storage import content_addressed_storage
+
+
+DEFAULT_AVATAR = 'images/users/no_avatar.png'
 
 
 class UserSettings(models.Model):
     """
     Модель настроек пользователя
+
+    :param avatar_derivatives: готовы ли уменьшенные копии аватара (см. main.images)
     """
     user = models.OneToOneField(to=get_user_model(), on_delete=models.CASCADE)
-    avatar = models.ImageField(upload_to='images/users/', default='images/users/no_avatar.png')
+    avatar = models.ImageField(
+        upload_to='images/users/', default=DEFAULT_AVATAR, storage=content_addressed_storage
+    )
+    avatar_derivatives = models.BooleanField(default=False)
     score = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', 'id'], name='usersettings_score_idx'),
+        ]
+
     @staticmethod
     def get_usersettings_by_user(user: get_user_model):
         """
@@ -29,12 +55,162 @@ class UserSettings(models.Model):
             usersettings.save()
         return usersettings
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Загрузка из базы с запоминанием аватара (см. avatar_changed)
+        """
+        instance = super().from_db(db, field_names, values)
+        instance.saved_avatar = instance.__dict__.get('avatar')
+        return instance
+
+    def avatar_changed(self) -> bool:
+        """
+        Отличается ли аватар от сохранённого в базе
+        Сохранённое значение запоминается при загрузке и сохранении, из базы оно
+        читается, только если неизвестно (объект создан вручную или поле отложено)
+        """
+        saved = getattr(self, 'saved_avatar', None)
+        if saved is None:
+            saved = UserSettings.objects.filter(pk=self.pk).values_list('avatar', flat=True).first()
+        return saved != self.avatar.name
+
     def add_score(self, score: int):
         """
         Добавление очков
         """
         self.score += score
 
+    def get_rank(self) -> int:
+        """
+        Получение места в рейтинге
+        Пользователи с одинаковыми очками делят одно место
+        """
+        return ScoreBucket.get_rank(self.score)
+
+    def get_summary(self) -> dict:
+        """
+        Сводка для страницы профиля из кэша (см. main.profiles)
+
+        В кэше лежат только количества и id задач, сами задачи читаются одним
+        запросом при каждом показе, поэтому количество прохождений всегда свежее
+
+        :return: словарь с количеством решённых и созданных задач, первыми пятью
+            задачами каждого списка (пары [задача, количество прохождений])
+            и предлагаемой задачей
+        """
+        def build() -> dict:
+            history = Task.get_done_tasks(self.user)
+            created = Task.get_tasks_of_user(self.user)
+            suggestion = Task.get_suggestion_task(self.user)
+            return {
+                'count_of_tasks_to_history': history.count(),
+                'tasks_to_history': [task.id for task in history[:5]],
+                'count_of_created_tasks': created.count(),
+                'created_tasks': [task.id for task in created[:5]],
+                'suggestion_task': suggestion and suggestion.id,
+            }
+        summary = profiles.get(self.user_id, build)
+        ids = [*summary['tasks_to_history'], *summary['created_tasks'], summary['suggestion_task']]
+        tasks = Task.get_active().filter(id__in=ids).select_related('author__usersettings').in_bulk()
+
+        def pairs(ids: List[int]) -> list:
+            return [[tasks[id], tasks[id].done_count] for id in ids if id in tasks]
+        return {
+            **summary,
+            'tasks_to_history': pairs(summary['tasks_to_history']),
+            'created_tasks': pairs(summary['created_tasks']),
+            'suggestion_task': tasks.get(summary['suggestion_task']),
+        }
+
+    @staticmethod
+    def get_top(count: int) -> QuerySet:
+        """
+        Получение первых мест рейтинга (по индексу на score)
+        """
+        return UserSettings.objects.select_related('user').order_by('-score', 'id')[:count]
+
+
+class ScoreBucket(models.Model):
+    """
+    Модель гистограммы очков для рейтинга
+
+    Для каждого значения очков хранится количество пользователей с ним. Место
+    пользователя - это сумма по корзинам с большими очками плюс один, поэтому
+    запрос пробегает по индексу только различные значения очков выше данного
+    (O(число различных значений), а не O(число пользователей)) и не дорожает с
+    ростом числа пользователей. Изменение очков стоит два UPDATE одной строки.
+    Корзины обновляются при создании и удалении настроек и при решении задач;
+    опустевшие корзины остаются с нулём до пересборки, а счётчик никогда не
+    уходит ниже нуля
+
+    :param score: значение очков
+    :param count: количество пользователей с такими очками
+    """
+    score = models.IntegerField(unique=True)
+    count = models.IntegerField(default=0)
+
+    @staticmethod
+    def add(score: int, delta: int):
+        """
+        Изменение количества пользователей с данными очками
+        Уменьшение не создаёт корзину и не опускает счётчик ниже нуля: если корзины
+        нет (например, гистограмма ещё не заполнена), считать из неё некого
+        """
+        if delta < 0:
+            ScoreBucket.objects.filter(score=score).update(count=Greatest(F('count') + delta, 0))
+            return
+        if ScoreBucket.objects.filter(score=score).update(count=F('count') + delta):
+            return
+        try:
+            with transaction.atomic():
+                ScoreBucket.objects.create(score=score, count=delta)
+        except IntegrityError:
+            ScoreBucket.objects.filter(score=score).update(count=F('count') + delta)
+
+    @staticmethod
+    def move(old_score: int, new_score: int):
+        """
+        Перенос пользователя из одной корзины в другую
+        """
+        if old_score == new_score:
+            return
+        ScoreBucket.add(old_score, -1)
+        ScoreBucket.add(new_score, 1)
+
+    @staticmethod
+    def get_rank(score: int) -> int:
+        """
+        Получение места по количеству очков
+        Пользователи с одинаковыми очками делят одно место, корзины с нулём не влияют
+        """
+        above = ScoreBucket.objects.filter(score__gt=score).aggregate(total=Sum('count'))['total']
+        return (above or 0) + 1
+
+    @staticmethod
+    def rank_expression(score) -> Coalesce:
+        """
+        Место в рейтинге как подзапрос, чтобы получить его тем же запросом, что и пользователя
+
+        :param score: выражение с очками пользователя, например ``OuterRef('usersettings__score')``
+        """
+        above = ScoreBucket.objects.filter(score__gt=score).order_by().annotate(
+            total=Func(F('count'), function='SUM')
+        ).values('total')
+        return Coalesce(Subquery(above, output_field=IntegerField()), 0) + 1
+
+    @staticmethod
+    def rebuild():
+        """
+        Полная пересборка гистограммы по UserSettings (опустевшие корзины удаляются)
+        """
+        with transaction.atomic():
+            ScoreBucket.objects.all().delete()
+            ScoreBucket.objects.bulk_create(
+                ScoreBucket(score=row['score'], count=row['count'])
+                for row in UserSettings.objects.values('score').annotate(count=Count('id'))
+            )
+
 
 @receiver(post_save, sender=get_user_model())
 def update_profile_signal(sender, instance, created, **kwargs):  # pylint: disable=unused-argument
@@ -51,6 +227,75 @@ def update_profile_signal(sender, instance, created, **kwargs):  # pylint: disab
     UserSettings.objects.create(user=instance)
 
 
+@receiver(post_save, sender=UserSettings)
+def add_to_rating_signal(sender, instance, created, **kwargs):  # pylint: disable=unused-argument
+    """
+    Учёт новых настроек пользователя в гистограмме рейтинга
+
+    :param sender: источник сигнала
+    :param instance: созданный объект
+    :param created: признак того, что объект был создан (или изменён)
+    :param kwargs: всё остальное
+    """
+    if created:
+        ScoreBucket.add(instance.score, 1)
+
+
+@receiver(pre_save, sender=UserSettings)
+def avatar_change_signal(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Сброс признака готовых копий при смене аватара
+
+    :param sender: источник сигнала
+    :param instance: сохраняемый объект
+    :param kwargs: всё остальное
+    """
+    if instance.pk is None:
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'avatar' not in update_fields:
+        return
+    if instance.avatar_changed():
+        instance.avatar_derivatives = False
+
+
+@receiver(post_save, sender=UserSettings)
+def avatar_derivatives_signal(sender, instance, created, **kwargs):  # pylint: disable=unused-argument
+    """
+    Постановка генерации уменьшенных копий аватара в очередь, только когда аватар
+    сменился. Для общего аватара по умолчанию копии не делаются
+
+    :param sender: источник сигнала
+    :param instance: сохранённый объект
+    :param created: признак того, что объект был создан (или изменён)
+    :param kwargs: всё остальное
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'avatar' not in update_fields:
+        return
+    changed = created or getattr(instance, 'saved_avatar', None) != instance.avatar.name
+    instance.saved_avatar = instance.avatar.name
+    if not changed or instance.avatar_derivatives or instance.avatar.name in ('', DEFAULT_AVATAR):
+        return
+    profiles.invalidate(instance.user_id)
+    name = instance.avatar.name
+    Job.enqueue(
+        'avatar_derivatives', instance.pk, name, priority=Job.HIGH, key=f'avatar_derivatives:{instance.pk}:{name}'
+    )
+
+
+@receiver(post_delete, sender=UserSettings)
+def remove_from_rating_signal(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Удаление настроек пользователя из гистограммы рейтинга
+
+    :param sender: источник сигнала
+    :param instance: удалённый объект
+    :param kwargs: всё остальное
+    """
+    ScoreBucket.add(instance.score, -1)
+
+
 class Task(models.Model):
     """
     Модель задачи
@@ -62,19 +307,41 @@ class Task(models.Model):
     :param answer: ответ
     :param points: очки, которые получит пользователь при решении задачи
     :param created: дата создания задачи
+    :param updated: дата последнего сохранения задачи (версия для кэша карточек)
     :param active: параметр, отвечающий за блокировку
     :param done: параметр, отвечающий за выполнение
+    :param done_count: количество решивших (хранится отдельно, обновляется в set_done)
+    :param image_derivatives: готовы ли уменьшенные копии изображения (см. main.images)
     """
     author = models.ForeignKey(to=get_user_model(), on_delete=models.CASCADE, related_name='author')
     title = models.CharField(max_length=255)
     description = models.TextField()
-    image = models.ImageField(upload_to='images/tasks/')
+    image = models.ImageField(upload_to='images/tasks/', storage=content_addressed_storage)
+    image_derivatives = models.BooleanField(default=False)
     answer = models.CharField(max_length=255)
     points = models.IntegerField()
     score_tier = models.IntegerField()
     created = models.DateTimeField(auto_now_add=True, null=False)
+    updated = models.DateTimeField(auto_now=True)
     active = models.BooleanField(default=True)
     done = models.ManyToManyField(to=get_user_model())
+    done_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['active', 'score_tier'], name='task_active_tier_idx'),
+            models.Index(fields=['active', 'created', 'id'], name='task_active_created_idx'),
+            models.Index(fields=['image'], name='task_image_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Загрузка из базы с запоминанием активности (см. task_profile_signal)
+        """
+        instance = super().from_db(db, field_names, values)
+        instance.saved_active = instance.__dict__.get('active')
+        return instance
 
     @staticmethod
     def get_suggestion_task(user: get_user_model):
@@ -84,19 +351,25 @@ class Task(models.Model):
         Потом идёт выбор из задач, где  предлагаемый уровень выше, чем очки пользователя
         Потом идёт выбор из задач, где  предлагаемый уровень ниже, чем очки пользователя
         Если так и не нашлось задачи, то возврашается None
+
+        Каждый диапазон - отдельный запрос с LIMIT 1 по индексу (active, score_tier):
+        порядок берётся из индекса (ниже очков - с конца), решённые задачи отсекаются
+        подзапросом. Обычно задача находится первым же запросом
         """
         user_score = user.usersettings.score
-        tasks = Task.objects.filter(score_tier__gte=user_score, score_tier__lte=user_score + 5).order_by('score_tier')
-        for task in tasks:
-            if not task.is_done(user):
-                return task
-        tasks = Task.objects.filter(score_tier__gt=user_score + 5).order_by('score_tier')
-        for task in tasks:
-            if not task.is_done(user):
-                return task
-        tasks = Task.objects.filter(score_tier__lt=user_score).order_by('-score_tier')
-        for task in tasks:
-            if not task.is_done(user):
+        candidates = Task.get_active().exclude(
+            id__in=Task.get_done_ids(user)
+        ).select_related(
+            'author'
+        )
+        bands = (
+            candidates.filter(score_tier__gte=user_score, score_tier__lte=user_score + 5).order_by('score_tier', 'id'),
+            candidates.filter(score_tier__gt=user_score + 5).order_by('score_tier', 'id'),
+            candidates.filter(score_tier__lt=user_score).order_by('-score_tier', '-id'),
+        )
+        for band in bands:
+            task = band.first()
+            if task is not None:
                 return task
         return None
 
@@ -105,44 +378,131 @@ class Task(models.Model):
         """
         Получение задач, которые создал пользователь
         """
-        return Task.objects.filter(author=user, active=True).order_by('created')
+        return Task.objects.filter(
+            author=user, active=True
+        ).select_related(
+            'author__usersettings'
+        ).order_by('created')
 
     def get_done_count(self) -> int:
         """
         Получение количества пользователей, решивших задачу
         """
-        return self.done.count()
+        return self.done_count
+
+    @staticmethod
+    def recount_done() -> int:
+        """
+        Пересчёт ``done_count`` по таблице ``done``
+        Исправляются только разошедшиеся задачи, одним UPDATE
+
+        :return: количество исправленных задач
+        """
+        real_count = Coalesce(Subquery(
+            Task.done.through.objects.filter(
+                task_id=OuterRef('pk')
+            ).values('task_id').annotate(count=Count('*')).values('count')
+        ), 0)
+        return Task.objects.annotate(
+            real_count=real_count
+        ).exclude(
+            done_count=F('real_count')
+        ).update(done_count=real_count)
 
     @staticmethod
-    def get_done_tasks(user: get_user_model()) -> List:
+    def get_done_ids(user: get_user_model()) -> QuerySet:
+        """
+        Получение id задач, решённых пользователем
+
+        Запрос идёт напрямую в промежуточную таблицу ``done``, поэтому его можно
+        использовать как подзапрос, не загружая сами задачи
+        """
+        return Task.done.through.objects.filter(user=user).values('task_id')
+
+    @staticmethod
+    def get_done_tasks(user: get_user_model()) -> QuerySet:
         """
         Получение сделаных задач
+
+        Возвращается ленивый QuerySet, упорядоченный по дате создания.
+        Его можно срезать и считать через
+        ``count()`` - всё выполняется за фиксированное число запросов,
+        автор и его настройки (для аватара в карточке) подгружаются тем же запросом
         """
-        tasks = Task.get_active().order_by('created')
-        result = []
-        for task in tasks:
-            if user in task.done.all():
-                result.append(task)
-        return result
+        return Task.get_active().filter(
+            id__in=Task.get_done_ids(user)
+        ).select_related(
+            'author__usersettings'
+        ).order_by('created')
+
+    @staticmethod
+    def get_done_among(user: get_user_model(), tasks: List) -> set:
+        """
+        Получение id задач из списка, которые решил пользователь (одним запросом)
+        """
+        return set(
+            Task.get_done_ids(user).filter(task_id__in=[task.id for task in tasks]).values_list('task_id', flat=True)
+        )
+
+    @staticmethod
+    def get_catalogue(user: get_user_model()) -> QuerySet:
+        """
+        Получение активных задач для каталога
+
+        Каждая задача аннотирована признаком ``solved`` (решена ли пользователем),
+        автор подгружается тем же запросом
+        """
+        return Task.get_active().select_related(
+            'author'
+        ).annotate(
+            solved=Exists(Task.get_done_ids(user).filter(task_id=OuterRef('pk')))
+        )
 
     def is_done(self, user: get_user_model()) -> bool:
         """
         Проверка на то, сделана ли задача
         """
-        return user in self.done.all()
+        return Task.get_done_ids(user).filter(task_id=self.id).exists()
 
-    def set_done(self, user: get_user_model()):
+    def get_points_for(self, score: int) -> int:
         """
-        Обновление задачи при решении
+        Получение очков за решение с учётом множителя уровня
+        Слабому игроку очки удваиваются, сильному - уменьшаются вдвое
         """
         points = self.points
-        if user.usersettings.score < self.score_tier - 5:
+        if score < self.score_tier - 5:
             points *= 2
-        elif user.usersettings.score > self.score_tier + 10:
+        elif score > self.score_tier + 10:
             points *= 0.5
-        user.usersettings.add_score(int(points))
-        user.usersettings.save()
-        self.done.add(user)
+        return int(points)
+
+    def set_done(self, user: get_user_model()) -> bool:
+        """
+        Обновление задачи при решении
+
+        Выполняется в одной транзакции: отметка о решении вставляется в ``done``
+        (повторная вставка упирается в уникальность пары и ничего не меняет),
+        затем строка настроек блокируется, и очки начисляются одним UPDATE через F()
+        с учётом множителя уровня. ``done_count`` и гистограмма рейтинга
+        обновляются в той же транзакции.
+        Поэтому параллельные решения не теряют очки и не начисляют их дважды
+
+        :return: True, если задача решена впервые
+        """
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    Task.done.through.objects.create(task_id=self.id, user_id=user.id)
+            except IntegrityError:
+                return False
+            user_settings = UserSettings.objects.select_for_update().filter(user=user)
+            score = user_settings.values_list('score', flat=True).get()
+            points = self.get_points_for(score)
+            user_settings.update(score=F('score') + points)
+            ScoreBucket.move(score, score + points)
+            Task.objects.filter(id=self.id).update(done_count=F('done_count') + 1)
+            profiles.invalidate(user.id, self.author_id)
+        return True
 
     @staticmethod
     def get_by_id(id: int):
@@ -154,12 +514,67 @@ class Task(models.Model):
         except Task.DoesNotExist:
             return None
 
+    @staticmethod
+    def get_answer(id: int) -> Optional[Tuple[str, bool]]:
+        """
+        Получение ответа и признака активности задачи без загрузки всей строки
+        """
+        return Task.objects.filter(id=id).values_list('answer', 'active').first()
+
+    @staticmethod
+    def check_answer(id: int, answer: str) -> bool:
+        """
+        Проверка ответа через кэш ответов (см. main.answers)
+        """
+        try:
+            id = int(id)
+        except (TypeError, ValueError):
+            return False
+        return answers.check(id, answer, Task.get_answer)
+
+    @staticmethod
+    def solve(id: int, answer: str, user) -> bool:
+        """
+        Проверка ответа и засчитывание решения
+        Если задачу заблокировали или удалили после проверки, решение не засчитывается
+        """
+        if not Task.check_answer(id, answer):
+            return False
+        task = Task.get_active().filter(id=id).first()
+        if task is None:
+            return False
+        task.set_done(user)
+        return True
+
+    @staticmethod
+    def deactivate_many(ids: List[int]) -> int:
+        """
+        Блокировка задач одним UPDATE
+
+        UPDATE по QuerySet не вызывает сигналы модели, поэтому задачи здесь же
+        убираются из поискового индекса и из кэша ответов
+
+        :return: количество заблокированных задач
+        """
+        ids = list(Task.objects.filter(id__in=ids, active=True).values_list('id', flat=True))
+        if not ids:
+            return 0
+        count = Task.objects.filter(id__in=ids).update(active=False)
+        for id in ids:
+            search.unindex_task(id)
+            transaction.on_commit(lambda id=id: answers.cache.invalidate(id))
+        profiles.invalidate_all()
+        return count
+
     @staticmethod
     def get_active() -> List:
         """
         Получение только активных задач
+        Условие записано как ``active IN (1)``: ``active=True`` Django превращает в
+        голое ``WHERE active``, и SQLite не может начать по нему индексы
+        (active, ...), а значит, и взять из них порядок сортировки
         """
-        return Task.objects.filter(active=True)
+        return Task.objects.filter(active__in=[True])
 
     @staticmethod
     def get_by_title(title: str):
@@ -168,6 +583,280 @@ class Task(models.Model):
         """
         return Task.objects.filter(active=True, title__icontains=title)
 
+    @staticmethod
+    def search_by_text(text: str, page: int = 1, size: int = 20) -> Tuple[List, bool]:
+        """
+        Полнотекстовый поиск по названию и описанию
+
+        Используется индекс FTS5 (поиск по префиксам слов, сортировка по релевантности).
+        Если индекс недоступен, выполняется запасной поиск через ``icontains``.
+        Пустая строка (или строка без слов) ничего не отбирает: возвращаются все активные задачи.
+        У найденных задач заполняются ``title_highlight`` и ``snippet`` с подсветкой
+
+        :return: задачи страницы и признак того, что есть следующая страница
+        """
+        offset = (page - 1) * size
+        has_words = bool(search.build_query(text))
+        found = search.search_ids(text, offset, size + 1) if has_words else None
+        if found is None:
+            tasks = Task.get_active()
+            if has_words:
+                tasks = tasks.filter(models.Q(title__icontains=text) | models.Q(description__icontains=text))
+            tasks = list(tasks.select_related('author').order_by('created', 'id')[offset:offset + size + 1])
+            for task in tasks:
+                task.title_highlight = escape(task.title)
+                task.snippet = escape(Truncator(task.description).words(24))
+        else:
+            tasks_by_id = Task.objects.select_related('author').in_bulk([id for id, _, _ in found])
+            tasks = []
+            for id, title, snippet in found:
+                task = tasks_by_id.get(id)
+                if task is None:
+                    continue
+                task.title_highlight = title
+                task.snippet = snippet
+                tasks.append(task)
+        return tasks[:size], len(tasks) > size
+
+
+@receiver(post_save, sender=Task)
+def index_task_signal(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Обновление поискового индекса при сохранении задачи
+
+    :param sender: источник сигнала
+    :param instance: сохранённая задача
+    :param kwargs: всё остальное
+    """
+    search.index_task(instance.id, instance.title, instance.description, instance.active)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_profile_signal(sender, instance, created: bool = False, **kwargs):  # pylint: disable=unused-argument
+    """
+    Сброс всех сводок профиля (см. main.profiles), когда меняется набор активных
+    задач: новая, заблокированная, снова открытая или удалённая задача может
+    появиться в чужой сводке или исчезнуть из неё (например, из предложенных).
+    Активность сравнивается с запомненной при загрузке, поэтому обычное
+    сохранение задачи сводки не сбрасывает
+
+    :param sender: источник сигнала
+    :param instance: сохранённая или удалённая задача
+    :param created: создана ли задача (только для post_save)
+    :param kwargs: всё остальное
+    """
+    if kwargs['signal'] is post_delete:
+        profiles.invalidate_all()
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'active' not in update_fields:
+        return
+    changed = created or getattr(instance, 'saved_active', None) != instance.active
+    instance.saved_active = instance.active
+    if changed:
+        profiles.invalidate_all()
+
+
+@receiver(post_save, sender=Task)
+def task_image_derivatives_signal(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Постановка генерации уменьшенных копий изображения задачи в очередь
+
+    :param sender: источник сигнала
+    :param instance: сохранённая задача
+    :param kwargs: всё остальное
+    """
+    if instance.image_derivatives or not instance.image:
+        return
+    name = instance.image.name
+    Job.enqueue('task_derivatives', instance.pk, name, priority=Job.HIGH, key=f'task_derivatives:{instance.pk}:{name}')
+
+
+@receiver(post_delete, sender=Task)
+def unindex_task_signal(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Удаление задачи из поискового индекса
+
+    :param sender: источник сигнала
+    :param instance: удалённая задача
+    :param kwargs: всё остальное
+    """
+    search.unindex_task(instance.id)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_answer_signal(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Сброс кэшированного ответа при изменении или удалении задачи
+    Сброс выполняется после фиксации транзакции: иначе параллельный запрос мог бы
+    до фиксации снова положить в кэш старый ответ
+
+    :param sender: источник сигнала
+    :param instance: задача
+    :param kwargs: всё остальное
+    """
+    id = instance.id
+    transaction.on_commit(lambda: answers.cache.invalidate(id))
+
+
+class ImageReport(models.Model):
+    """
+    Модель отчёта стегоанализа изображения задачи (см. main.analysis)
+
+    :param task: задача
+    :param image_name: имя проанализированного файла (чтобы отличить устаревший отчёт)
+    :param chi_square: вероятность встраивания по атаке хи-квадрат
+    :param rs_estimate: доля пикселей с изменёнными младшими битами по RS-анализу
+    :param lsb_entropy: нормированная энтропия младшей битовой плоскости
+    :param bitplane_entropy: энтропия всех восьми плоскостей, от младшей к старшей
+    :param detectability: итоговая заметность встраивания (0..1)
+    :param capacity: вместимость при записи в 1 младший бит RGB, байт
+    :param estimated_payload: оценка объёма спрятанных данных, байт
+    :param created: дата анализа
+    """
+    task = models.OneToOneField(to=Task, on_delete=models.CASCADE, related_name='report')
+    image_name = models.CharField(max_length=255)
+    chi_square = models.FloatField()
+    rs_estimate = models.FloatField()
+    lsb_entropy = models.FloatField()
+    bitplane_entropy = models.JSONField()
+    detectability = models.FloatField()
+    capacity = models.IntegerField()
+    estimated_payload = models.IntegerField()
+    created = models.DateTimeField(auto_now=True)
+
+    @staticmethod
+    def analyse_task(task_id: int, image_name: str):
+        """
+        Анализ изображения задачи и сохранение отчёта
+        """
+        if not default_storage.exists(image_name):
+            return
+        with default_storage.open(image_name) as file:
+            report = analysis.analyse(Image.open(file))
+        report['image_name'] = image_name
+        if ImageReport.objects.filter(task_id=task_id).update(**report):
+            return
+        try:
+            with transaction.atomic():
+                ImageReport.objects.create(task_id=task_id, **report)
+        except IntegrityError:
+            ImageReport.objects.filter(task_id=task_id).update(**report)
+
+
+@receiver(post_save, sender=Task)
+def analyse_task_image_signal(sender, instance, created, **kwargs):  # pylint: disable=unused-argument
+    """
+    Постановка стегоанализа нового изображения задачи в очередь
+
+    :param sender: источник сигнала
+    :param instance: сохранённая задача
+    :param created: признак того, что объект был создан (или изменён)
+    :param kwargs: всё остальное
+    """
+    if created and instance.image:
+        Job.enqueue('analyse_task', instance.id, instance.image.name, key=f'analyse_task:{instance.id}')
+
+
+class ImageHash(models.Model):
+    """
+    Модель перцептивных хэшей изображения задачи (см. main.perceptual)
+
+    Хэши хранятся как знаковые 64-битные числа, части pHash - отдельными
+    столбцами с индексами для поиска похожих изображений
+
+    :param task: задача
+    :param image_name: имя файла, по которому посчитаны хэши
+    :param ahash: средний хэш
+    :param dhash: разностный хэш
+    :param phash: хэш по DCT
+    :param phash_0: старшие 16 бит pHash (phash_1..phash_3 - следующие)
+    """
+    task = models.OneToOneField(to=Task, on_delete=models.CASCADE, related_name='hashes')
+    image_name = models.CharField(max_length=255)
+    ahash = models.BigIntegerField()
+    dhash = models.BigIntegerField()
+    phash = models.BigIntegerField()
+    phash_0 = models.PositiveIntegerField()
+    phash_1 = models.PositiveIntegerField()
+    phash_2 = models.PositiveIntegerField()
+    phash_3 = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=[f'phash_{i}'], name=f'imagehash_phash_{i}_idx') for i in range(perceptual.CHUNKS)
+        ]
+
+    @staticmethod
+    def fields_for(hashes: dict) -> dict:
+        """
+        Значения полей модели по хэшам из main.perceptual.hashes
+        """
+        return {
+            **{name: perceptual.to_signed(value) for name, value in hashes.items()},
+            **{f'phash_{i}': chunk for i, chunk in enumerate(perceptual.chunks(hashes['phash']))},
+        }
+
+    @staticmethod
+    def index_task(task_id: int, image_name: str):
+        """
+        Подсчёт и сохранение хэшей изображения задачи
+        """
+        if not default_storage.exists(image_name):
+            return
+        with default_storage.open(image_name) as file:
+            fields = ImageHash.fields_for(perceptual.hashes(Image.open(file)))
+        fields['image_name'] = image_name
+        if ImageHash.objects.filter(task_id=task_id).update(**fields):
+            return
+        try:
+            with transaction.atomic():
+                ImageHash.objects.create(task_id=task_id, **fields)
+        except IntegrityError:
+            ImageHash.objects.filter(task_id=task_id).update(**fields)
+
+    @staticmethod
+    def find_similar(hashes: dict, max_distance: int = perceptual.MAX_DISTANCE, limit: int = 5) -> list:
+        """
+        Поиск задач с похожими изображениями
+
+        Кандидаты выбираются одним запросом по индексам частей pHash
+        (совпадение части или отличие в один бит), затем отсеиваются по полному
+        расстоянию. Находятся все изображения с расстоянием не больше
+        ``perceptual.MAX_DISTANCE``
+
+        :param hashes: хэши изображения (main.perceptual.hashes)
+        :param max_distance: наибольшее расстояние Хэмминга по pHash
+        :param limit: сколько задач вернуть
+        :return: пары [задача, расстояние], самые похожие в начале
+        """
+        condition = models.Q()
+        for i, chunk in enumerate(perceptual.chunks(hashes['phash'])):
+            condition |= models.Q(**{f'phash_{i}__in': perceptual.neighbours(chunk)})
+        candidates = ImageHash.objects.filter(condition).values_list('task_id', 'phash')
+        distances = sorted(
+            (perceptual.distance(hashes['phash'], value), task_id) for task_id, value in candidates
+        )
+        distances = [(value, task_id) for value, task_id in distances if value <= max_distance][:limit]
+        tasks = Task.objects.select_related('author').in_bulk([task_id for _, task_id in distances])
+        return [[tasks[task_id], value] for value, task_id in distances if task_id in tasks]
+
+
+@receiver(post_save, sender=Task)
+def image_hash_signal(sender, instance, created, **kwargs):  # pylint: disable=unused-argument
+    """
+    Постановка подсчёта перцептивных хэшей нового изображения задачи в очередь
+
+    :param sender: источник сигнала
+    :param instance: сохранённая задача
+    :param created: признак того, что объект был создан (или изменён)
+    :param kwargs: всё остальное
+    """
+    if created and instance.image:
+        Job.enqueue('index_image_hashes', instance.id, instance.image.name, key=f'index_image_hashes:{instance.id}')
+
 
 class Complaint(models.Model):
     """
@@ -177,12 +866,21 @@ class Complaint(models.Model):
         1 - принято
         2 - отказано
     """
+    PENDING = 0
+    ACCEPTED = 1
+    DISMISSED = 2
+
     author = models.ForeignKey(to=get_user_model(), on_delete=models.CASCADE)
     task = models.ForeignKey(to=Task, on_delete=models.CASCADE)
     date = models.DateTimeField(auto_now_add=True)
     description = models.TextField()
     state = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'task'], name='complaint_state_task_idx'),
+        ]
+
     @staticmethod
     def get_by_id(id: int):
         """
@@ -196,21 +894,47 @@ class Complaint(models.Model):
     def accept(self):
         """
         Принятие жалобы и блокировка задачи
+        Остальные жалобы на задачу отклоняются, всё одной транзакцией (см. resolve_many)
         """
-        self.state = 1
+        Complaint.resolve_many(accept=[self.id])
+        self.state = Complaint.ACCEPTED
         self.task.active = False
-        self.save()
-        self.task.save()
-        complaints = Complaint.get_complaints_of_task(self.task)
-        for complaint in complaints:
-            complaint.dismiss()
 
     def dismiss(self):
         """
         Отклонение жалобы
         """
-        self.state = 2
-        self.save()
+        Complaint.resolve_many(dismiss=[self.id])
+        self.state = Complaint.DISMISSED
+
+    @staticmethod
+    def resolve_many(accept: Iterable[int] = (), dismiss: Iterable[int] = ()) -> dict:
+        """
+        Массовое рассмотрение жалоб (в том числе на разные задачи)
+
+        Принятые жалобы блокируют свои задачи, а все прочие жалобы на эти задачи,
+        ещё ожидающие рассмотрения, отклоняются. Каждое изменение - один UPDATE
+        по множеству строк, всё внутри одной транзакции. Уже рассмотренные жалобы
+        не трогаются
+
+        :param accept: id принимаемых жалоб
+        :param dismiss: id отклоняемых жалоб
+        :return: количество принятых и отклонённых жалоб и заблокированных задач
+        """
+        accept, dismiss = list(accept), list(dismiss)
+        with transaction.atomic():
+            accepted = Complaint.objects.filter(id__in=accept, state=Complaint.PENDING)
+            task_ids = list(accepted.values_list('task_id', flat=True).distinct())
+            accepted_count = accepted.update(state=Complaint.ACCEPTED)
+            dismissed_count = Complaint.objects.filter(
+                models.Q(id__in=dismiss) | models.Q(task_id__in=task_ids), state=Complaint.PENDING
+            ).update(state=Complaint.DISMISSED)
+            blocked_count = Task.deactivate_many(task_ids)
+        return {
+            'accepted': accepted_count,
+            'dismissed': dismissed_count,
+            'blocked': blocked_count,
+        }
 
     @staticmethod
     def get_complaints_of_task(task: Task, state: int = 0) -> List:
@@ -225,3 +949,223 @@ class Complaint(models.Model):
         Получение жалоб "на рассмотрении"
         """
         return Complaint.objects.filter(state=0)
+
+    @staticmethod
+    def get_queue(cursor: str, size: int) -> Tuple[list, str]:
+        """
+        Очередь модерации: жалобы "на рассмотрении", сгруппированные по задачам
+        Задачи упорядочены по убыванию количества жалоб, страница берётся по курсору.
+        Страница загружается тремя запросами независимо от количества жалоб:
+        группы, задачи с авторами и последняя жалоба каждой группы.
+        Группы, чья задача или жалоба удалена между этими запросами, пропускаются
+
+        :param cursor: курсор предыдущей страницы (пустая строка для первой)
+        :param size: количество задач на странице
+        :return: список словарей (task, reports, last) и курсор следующей страницы
+        """
+        groups, next_cursor = count_page(
+            Complaint.get_active().values('task_id').annotate(reports=Count('id'), last_id=Max('id')),
+            cursor, size, 'reports', 'task_id'
+        )
+        tasks = Task.objects.select_related('author').in_bulk([group['task_id'] for group in groups])
+        last = Complaint.objects.select_related('author').in_bulk([group['last_id'] for group in groups])
+        return [
+            {
+                'task': tasks[group['task_id']],
+                'reports': group['reports'],
+                'last': last[group['last_id']],
+            }
+            for group in groups
+            if group['task_id'] in tasks and group['last_id'] in last
+        ], next_cursor
+
+
+class Job(models.Model):
+    """
+    Модель фоновой задачи (см. main.jobs)
+    Состояния:
+        0 - в очереди
+        1 - выполняется
+        2 - не выполнена (попытки кончились)
+    Выполненные задачи удаляются из таблицы
+
+    :param name: имя обработчика из ``main.jobs.HANDLERS``
+    :param args: аргументы обработчика (список, хранится в JSON)
+    :param priority: приоритет, задачи с большим приоритетом выполняются раньше
+    :param key: ключ дедупликации: в очереди не бывает двух задач с одним ключом
+    :param state: состояние
+    :param attempts: сколько раз задача запускалась
+    :param max_attempts: сколько раз её можно запустить
+    :param run_at: время, раньше которого задачу не запускать (повтор после ошибки)
+    :param worker: обработчик, который выполняет задачу
+    :param locked_at: время, когда задачу взяли в работу
+    :param last_error: описание последней ошибки
+    :param created: дата постановки в очередь
+    """
+    QUEUED = 0
+    RUNNING = 1
+    FAILED = 2
+
+    LOW = -10
+    NORMAL = 0
+    HIGH = 10
+
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list)
+    priority = models.SmallIntegerField(default=NORMAL)
+    key = models.CharField(max_length=255, null=True, blank=True)
+    state = models.SmallIntegerField(default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', '-priority', 'run_at', 'id'], name='job_queue_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=models.Q(state=0), name='job_queued_key_unique'),
+        ]
+
+    @staticmethod
+    def enqueue(name: str, *args, priority: int = NORMAL, key: Optional[str] = None, delay: float = 0) -> 'Job':
+        """
+        Постановка задачи в очередь
+        Задача записывается в текущей транзакции, поэтому видна обработчикам
+        только вместе с данными, ради которых она поставлена
+
+        :param name: имя обработчика
+        :param args: аргументы обработчика (должны сериализоваться в JSON)
+        :param priority: приоритет
+        :param key: ключ дедупликации. Если в очереди уже есть задача с этим ключом,
+            новая не ставится, а у старой повышается приоритет (до ``priority``)
+        :param delay: через сколько секунд можно выполнять
+        :return: поставленная задача (или уже стоявшая в очереди)
+        """
+        job = Job(
+            name=name, args=list(args), priority=priority, key=key,
+            run_at=timezone.now() + timedelta(seconds=delay), max_attempts=settings.JOB_QUEUE['MAX_ATTEMPTS'],
+        )
+        try:
+            with transaction.atomic():
+                job.save()
+        except IntegrityError:
+            existing = Job.objects.filter(key=key, state=Job.QUEUED).first()
+            if existing is None:
+                return Job.enqueue(name, *args, priority=priority, key=key, delay=delay)
+            if priority > existing.priority:
+                Job.objects.filter(pk=existing.pk, state=Job.QUEUED).update(priority=priority)
+            return existing
+        Job.wake()
+        return job
+
+    @staticmethod
+    def wake():
+        """
+        Запуск обработки в потоке процесса сайта после коммита,
+        если задачи выполняются в нём (``settings.JOB_QUEUE['IN_PROCESS']``)
+        """
+        if settings.JOB_QUEUE['IN_PROCESS']:
+            from main import jobs  # pylint: disable=import-outside-toplevel
+            transaction.on_commit(jobs.drain_in_background)
+
+    @staticmethod
+    def claim(worker: str, limit: int = 1) -> List['Job']:
+        """
+        Взятие в работу задач, которые пора выполнять, по убыванию приоритета
+
+        Если база умеет ``SELECT ... FOR UPDATE SKIP LOCKED`` (PostgreSQL), обработчики
+        не мешают друг другу. Иначе (SQLite) каждая задача забирается отдельным
+        условным UPDATE, и задачу, которую уже забрал другой обработчик, пропускают
+
+        :param worker: имя обработчика
+        :param limit: сколько задач взять
+        """
+        now = timezone.now()
+        queued = Job.objects.filter(state=Job.QUEUED, run_at__lte=now).order_by('-priority', 'run_at', 'id')
+        changes = {'state': Job.RUNNING, 'worker': worker, 'locked_at': now, 'attempts': F('attempts') + 1}
+        if connection.features.has_select_for_update_skip_locked:
+            with transaction.atomic():
+                ids = list(queued.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+                Job.objects.filter(id__in=ids).update(**changes)
+        else:
+            ids = []
+            for id in queued.values_list('id', flat=True)[:limit * 4]:
+                if Job.objects.filter(id=id, state=Job.QUEUED).update(**changes):
+                    ids.append(id)
+                    if len(ids) == limit:
+                        break
+        return list(Job.objects.filter(id__in=ids, worker=worker).order_by('-priority', 'run_at', 'id'))
+
+    def finish(self):
+        """
+        Удаление выполненной задачи
+        """
+        Job.objects.filter(pk=self.pk).delete()
+
+    def fail(self, error: str):
+        """
+        Ошибка выполнения: повтор с экспоненциальной задержкой или отметка о неудаче,
+        если попытки кончились. Если в очереди уже есть задача с тем же ключом,
+        повтор не нужен - её выполнят и так
+        """
+        if self.attempts >= self.max_attempts:
+            Job.objects.filter(pk=self.pk).update(state=Job.FAILED, worker='', locked_at=None, last_error=error)
+            return
+        delay = settings.JOB_QUEUE['RETRY_DELAY'] * 2 ** max(self.attempts - 1, 0)
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=self.pk).update(
+                    state=Job.QUEUED, worker='', locked_at=None, last_error=error,
+                    run_at=timezone.now() + timedelta(seconds=delay)
+                )
+        except IntegrityError:
+            self.finish()
+
+    @staticmethod
+    def release_stale(timeout: float) -> int:
+        """
+        Возврат в очередь задач, которые выполняются дольше ``timeout`` секунд
+        (обработчик, скорее всего, завершился, не закончив их)
+
+        :return: количество таких задач
+        """
+        stale = Job.objects.filter(state=Job.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=timeout))
+        count = 0
+        for job in stale:
+            job.fail(f'Обработчик {job.worker} не завершил задачу за {timeout} с')
+            count += 1
+        return count
+
+    @staticmethod
+    def retry_failed() -> int:
+        """
+        Возврат в очередь всех невыполненных задач с новым запасом попыток
+
+        :return: количество задач
+        """
+        count = 0
+        for job in Job.objects.filter(state=Job.FAILED).only('id'):
+            try:
+                with transaction.atomic():
+                    count += Job.objects.filter(pk=job.pk).update(state=Job.QUEUED, attempts=0, run_at=timezone.now())
+            except IntegrityError:
+                job.finish()
+        return count
+
+
+@receiver(post_delete, sender=get_user_model())
+def recount_done_signal(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Пересчёт количества решивших задачи после удаления пользователя
+    (его решения удаляются каскадно, мимо ``Task.set_done``)
+
+    :param sender: источник сигнала
+    :param instance: удалённый пользователь
+    :param kwargs: всё остальное
+    """
+    Job.enqueue('recount_done', priority=Job.LOW, key='recount_done')
@@ -0,0 +1,94 @@
+"""
+Модуль с keyset-пагинацией
+
+Курсор указывает на последнюю показанную запись по паре (дата, id), поэтому
+стоимость следующей страницы не зависит от её номера - в отличие от OFFSET
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from django.db.models import Q, QuerySet
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(date: datetime, id: int) -> str:
+    """
+    Кодирование курсора в строку вида ``<микросекунды>.<id>``
+    """
+    return f'{(date - EPOCH) // timedelta(microseconds=1)}.{id}'
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    """
+    Разбор курсора. Для пустой или испорченной строки возвращается None
+    """
+    try:
+        microseconds, id = cursor.split('.')
+        return EPOCH + timedelta(microseconds=int(microseconds)), int(id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def encode_count_cursor(count: int, id: int) -> str:
+    """
+    Кодирование курсора для сортировки по убыванию количества, строка вида ``<количество>.<id>``
+    """
+    return f'{count}.{id}'
+
+
+def decode_count_cursor(cursor: str) -> Optional[Tuple[int, int]]:
+    """
+    Разбор курсора по количеству. Для пустой или испорченной строки возвращается None
+    """
+    try:
+        count, id = cursor.split('.')
+        return int(count), int(id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def count_page(queryset: QuerySet, cursor: str, size: int, field: str, id_field: str = 'id') -> Tuple[list, str]:
+    """
+    Получение страницы сгруппированного запроса по курсору
+    Сортировка по убыванию агрегата ``field``, при равенстве - по возрастанию ``id_field``
+
+    :param queryset: запрос ``values(...).annotate(...)``, возвращающий словари
+    :param cursor: курсор предыдущей страницы (пустая строка для первой)
+    :param size: размер страницы
+    :param field: имя агрегата, по которому идёт сортировка
+    :param id_field: уникальное поле группы
+    :return: список словарей страницы и курсор следующей страницы (пустая строка, если она последняя)
+    """
+    position = decode_count_cursor(cursor)
+    if position is not None:
+        count, id = position
+        queryset = queryset.filter(Q(**{f'{field}__lt': count}) | Q(**{field: count, f'{id_field}__gt': id}))
+    items = list(queryset.order_by(f'-{field}', id_field)[:size + 1])
+    if len(items) <= size:
+        return items, ''
+    items = items[:size]
+    return items, encode_count_cursor(items[-1][field], items[-1][id_field])
+
+
+def keyset_page(queryset: QuerySet, cursor: str, size: int, field: str = 'created') -> Tuple[list, str]:
+    """
+    Получение страницы по курсору
+    Условие курсора начинается с ``field >= date``, чтобы индекс (..., field, id)
+    начинал поиск с позиции курсора, а не фильтровал все строки до неё
+
+    :param queryset: исходный запрос, упорядочивание задаётся здесь
+    :param cursor: курсор предыдущей страницы (пустая строка для первой)
+    :param size: размер страницы
+    :param field: поле с датой, по которому идёт сортировка
+    :return: список объектов страницы и курсор следующей страницы (пустая строка, если она последняя)
+    """
+    position = decode_cursor(cursor)
+    if position is not None:
+        date, id = position
+        queryset = queryset.filter(**{f'{field}__gte': date}).filter(Q(**{f'{field}__gt': date}) | Q(id__gt=id))
+    items = list(queryset.order_by(field, 'id')[:size + 1])
+    if len(items) <= size:
+        return items, ''
+    items = items[:size]
+    return items, encode_cursor(getattr(items[-1], field), items[-1].id)
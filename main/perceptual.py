@@ -0,0 +1,130 @@
+"""
+Модуль с перцептивными хэшами изображений
+
+Три 64-битных хэша, устойчивых к пересжатию, масштабированию и небольшим
+правкам (в том числе к встраиванию текста в младшие биты):
+
+* aHash - пиксели 8x8 ярче среднего;
+* dHash - яркость растёт слева направо (9x8);
+* pHash - низкочастотные коэффициенты DCT 32x32 больше медианы.
+
+Похожесть - расстояние Хэмминга. Для поиска pHash делится на четыре 16-битные
+части (multi-index hashing): если расстояние не больше 7, то хотя бы одна часть
+отличается не больше чем на один бит, поэтому кандидатов достаточно искать
+по точному совпадению части или её 16 соседей - это запросы по индексу
+"""
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+MAX_DISTANCE = 7
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    """
+    Матрица DCT-II (ортонормированная)
+    """
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT = _dct_matrix(32)
+
+
+def _gray(image: Image.Image, size: tuple) -> np.ndarray:
+    """
+    Уменьшенное изображение в оттенках серого
+    """
+    if image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    return np.asarray(image.convert('L').resize(size, Image.BILINEAR), dtype=np.float64)
+
+
+def _to_int(bits: np.ndarray) -> int:
+    """
+    64 булевых значения в беззнаковое целое
+    """
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+
+def ahash(image: Image.Image) -> int:
+    """
+    Средний хэш
+    """
+    pixels = _gray(image, (8, 8))
+    return _to_int(pixels > pixels.mean())
+
+
+def dhash(image: Image.Image) -> int:
+    """
+    Разностный хэш
+    """
+    pixels = _gray(image, (9, 8))
+    return _to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(image: Image.Image) -> int:
+    """
+    Хэш по DCT
+    """
+    coefficients = (DCT @ _gray(image, (32, 32)) @ DCT.T)[:8, :8]
+    return _to_int(coefficients > np.median(coefficients.ravel()[1:]))
+
+
+def hashes(image: Image.Image) -> Dict[str, int]:
+    """
+    Все три хэша изображения
+    """
+    image.load()
+    return {'ahash': ahash(image), 'dhash': dhash(image), 'phash': phash(image)}
+
+
+def file_hashes(path: str) -> Dict[str, int]:
+    """
+    Хэши изображения из файла (для пула процессов)
+    """
+    with Image.open(path) as image:
+        return hashes(image)
+
+
+def distance(first: int, second: int) -> int:
+    """
+    Расстояние Хэмминга между хэшами
+    """
+    return bin((first ^ second) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+
+def to_signed(value: int) -> int:
+    """
+    Беззнаковый 64-битный хэш в знаковое целое (для BigIntegerField)
+    """
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value: int) -> int:
+    """
+    Обратное преобразование для to_signed
+    """
+    return value & 0xFFFFFFFFFFFFFFFF
+
+
+def chunks(value: int) -> List[int]:
+    """
+    Части хэша для индексов, от старших бит к младшим
+    """
+    value = to_unsigned(value)
+    mask = (1 << CHUNK_BITS) - 1
+    return [(value >> (CHUNK_BITS * (CHUNKS - 1 - i))) & mask for i in range(CHUNKS)]
+
+
+def neighbours(chunk: int) -> List[int]:
+    """
+    Часть хэша и все значения, отличающиеся от неё на один бит
+    """
+    return [chunk] + [chunk ^ (1 << bit) for bit in range(CHUNK_BITS)]
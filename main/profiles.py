@@ -0,0 +1,94 @@
+"""
+Модуль с кэшем сводки профиля
+
+Для страницы профиля нужны количество решённых и созданных задач, первые пять
+задач из каждого списка и предлагаемая задача. Всё это собирается несколькими
+запросами, поэтому сводка держится в кэше Django (``settings.PROFILE_CACHE``),
+где старые записи вытесняются по размеру и времени жизни.
+
+В записи хранятся только количества и id задач: сами задачи (с количеством
+прохождений) читаются одним запросом при показе. Запись пользователя
+сбрасывается только событиями, которые её меняют: решение задачи (у решившего
+и у автора задачи) и смена аватара. Создание, блокировка, повторное открытие
+и удаление задачи меняют набор активных задач и могут затронуть чужие сводки
+(например, предложенную задачу), поэтому они сбрасывают все записи сразу.
+Место в рейтинге меняется при любом чужом решении, поэтому в сводку оно не
+входит, а считается подзапросом в запросе пользователя.
+
+Сброс не удаляет запись, а меняет версию в её ключе: общую (поколение) или
+версию пользователя. Версии читаются до сборки сводки, поэтому сводка,
+собранная до сброса, записывается под старым ключом и больше не читается.
+Версии - случайные строки, а не счётчики: вытесненная из кэша версия не может
+совпасть со старой. Для нескольких процессов нужен общий кэш (например, Redis
+или Memcached)
+"""
+import uuid
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+GENERATION_KEY = 'profile:generation'
+
+
+def get_cache():
+    """
+    Кэш, в котором хранятся сводки
+    """
+    return caches[settings.PROFILE_CACHE['CACHE']]
+
+
+def _version_key(user_id: int) -> str:
+    """
+    Ключ версии сводки пользователя
+    """
+    return f'profile:version:{user_id}'
+
+
+def _key(user_id: int) -> str:
+    """
+    Ключ сводки пользователя с учётом текущих поколения и версии
+    Недостающие версии создаются через ``add``, чтобы параллельные запросы получили одну
+    """
+    keys = [GENERATION_KEY, _version_key(user_id)]
+    versions = get_cache().get_many(keys)
+    for key in keys:
+        if key not in versions:
+            get_cache().add(key, uuid.uuid4().hex, timeout=None)
+            versions[key] = get_cache().get(key)
+    return f'profile:{versions[GENERATION_KEY]}:{user_id}:{versions[keys[1]]}'
+
+
+def get(user_id: int, build: Callable[[], dict]) -> dict:
+    """
+    Получение сводки, при промахе она собирается через ``build``
+
+    :param user_id: id пользователя
+    :param build: функция, собирающая сводку
+    :return: словарь сводки
+    """
+    key = _key(user_id)
+    summary = get_cache().get(key)
+    if summary is None:
+        summary = build()
+        get_cache().set(key, summary, timeout=settings.PROFILE_CACHE['TTL'])
+    return summary
+
+
+def invalidate(*user_ids: int):
+    """
+    Сброс сводок пользователей после фиксации текущей транзакции
+    """
+    def bump():
+        get_cache().set_many({_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, timeout=None)
+    transaction.on_commit(bump)
+
+
+def invalidate_all():
+    """
+    Сброс всех сводок после фиксации текущей транзакции
+    """
+    def bump():
+        get_cache().set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+    transaction.on_commit(bump)
@@ -0,0 +1,206 @@
+"""
+Модуль с ограничением частоты отправки ответов (token bucket)
+
+У каждого ключа есть ведро на ``capacity`` жетонов, которое пополняется со
+скоростью ``rate`` жетонов в секунду; каждый запрос забирает один жетон.
+Проверка идёт до любой работы с моделями, поэтому отклонённый запрос почти
+ничего не стоит. Запрос проверяется сразу по нескольким вёдрам (``take_all``)
+и забирает жетоны, только если их хватает во всех: отклонённый одним лимитом
+запрос не тратит остальные.
+
+Лимит выключается настройкой ``settings.ANSWER_RATE_LIMIT['ENABLED']``
+(например, для нагрузочных тестов). Хранилище состояния подключаемое
+(``settings.ANSWER_RATE_LIMIT['BACKEND']``):
+
+* ``LocalMemoryBackend`` - словарь в памяти процесса, для одного процесса;
+* ``CacheBackend`` - кэш Django (например, Redis или Memcached), общий для
+  нескольких процессов. В кэше нет сравнения с обменом, поэтому ведро
+  заменено скользящим окном длиной ``capacity / rate`` секунд на атомарных
+  счётчиках (``add`` + ``incr``): параллельные запросы получают разные номера
+  и лимит не превышается при любой конкуренции
+"""
+import math
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+def refill(
+        state: Optional[Tuple[float, float]], rate: float, capacity: int, now: float
+) -> Tuple[bool, Tuple[float, float], float]:
+    """
+    Пополнение ведра и попытка взять жетон
+
+    :param state: (жетоны, время последнего обновления) или None для нового ведра
+    :return: (разрешён ли запрос, новое состояние, сколько секунд ждать следующего жетона)
+    """
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return True, (tokens - 1, now), 0.0
+    return False, (tokens, now), (1 - tokens) / rate
+
+
+def sliding_window(previous: int, current: int, elapsed: float, window: float, capacity: int) -> Tuple[bool, float]:
+    """
+    Проверка лимита по скользящему окну
+
+    Запросы прошлого окна учитываются с весом, убывающим по мере хода текущего
+
+    :param previous: запросов в прошлом окне
+    :param current: запросов в текущем окне, включая проверяемый
+    :param elapsed: сколько секунд прошло с начала текущего окна
+    :return: (разрешён ли запрос, сколько секунд ждать, если запрос не засчитан)
+    """
+    if previous * (1 - elapsed / window) + current <= capacity:
+        return True, 0.0
+    if current <= capacity:
+        return False, window * (1 - (capacity - current) / previous) - elapsed
+    return False, window - elapsed + window * (1 - (capacity - 1) / (current - 1))
+
+
+class LocalMemoryBackend:
+    """
+    Хранение вёдер в памяти процесса
+
+    Вместе с состоянием ведра хранится момент, когда оно наполнится целиком
+    (по его собственным скорости и ёмкости). Полные вёдра ничем не отличаются
+    от новых и удаляются, когда ключей становится больше ``MAX_KEYS`` и вдвое
+    больше, чем осталось после прошлой очистки, поэтому очистка в среднем
+    стоит O(1) на запрос
+    """
+    blocking = False
+
+    def __init__(self, options: dict):
+        self.max_keys = options.get('MAX_KEYS', 100000)
+        self._buckets = {}
+        self._evict_at = self.max_keys
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, capacity: int) -> Tuple[bool, float]:
+        """
+        Попытка взять жетон из ведра ключа
+
+        :return: (разрешён ли запрос, сколько секунд ждать)
+        """
+        return self.take_all([(key, rate, capacity)])
+
+    def take_all(self, limits: List[Tuple[str, float, int]]) -> Tuple[bool, float]:
+        """
+        Попытка взять по жетону из нескольких вёдер: жетоны забираются, только если они есть во всех
+
+        :param limits: список (ключ, скорость, ёмкость)
+        :return: (разрешён ли запрос, сколько секунд ждать, пока жетоны появятся во всех вёдрах)
+        """
+        now = time.monotonic()
+        with self._lock:
+            results = []
+            for key, rate, capacity in limits:
+                bucket = self._buckets.get(key)
+                results.append((key, rate, capacity, *refill(bucket and bucket[0], rate, capacity, now)))
+            waits = [wait for _, _, _, allowed, _, wait in results if not allowed]
+            if waits:
+                return False, max(waits)
+            for key, rate, capacity, _, state, _ in results:
+                self._buckets[key] = (state, now + (capacity - state[0]) / rate)
+            if len(self._buckets) > self._evict_at:
+                self._evict(now)
+        return True, 0.0
+
+    def _evict(self, now: float):
+        """
+        Удаление полностью восстановившихся вёдер
+        """
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[1] > now}
+        self._evict_at = max(self.max_keys, 2 * len(self._buckets))
+
+
+class CacheBackend:
+    """
+    Хранение счётчиков скользящего окна в кэше Django, общем для всех процессов
+    Отклонённый запрос возвращает свои номера во всех окнах (``decr``), поэтому не тратит лимиты
+    """
+    blocking = True
+
+    def __init__(self, options: dict):
+        self.cache = caches[options.get('CACHE', 'default')]
+        self.prefix = options.get('PREFIX', 'ratelimit:')
+
+    def _increment(self, key: str, timeout: int) -> int:
+        """
+        Атомарное увеличение счётчика, создаваемого при первом обращении
+        """
+        self.cache.add(key, 0, timeout=timeout)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Счётчик вытеснен между add и incr
+            return 1 if self.cache.add(key, 1, timeout=timeout) else self.cache.incr(key)
+
+    def take(self, key: str, rate: float, capacity: int) -> Tuple[bool, float]:
+        """
+        Попытка засчитать запрос в окне ключа
+
+        :return: (разрешён ли запрос, сколько секунд ждать)
+        """
+        return self.take_all([(key, rate, capacity)])
+
+    def take_all(self, limits: List[Tuple[str, float, int]]) -> Tuple[bool, float]:
+        """
+        Попытка засчитать запрос в окнах нескольких ключей: при первом отказе
+        запрос снимается со всех уже увеличенных счётчиков
+
+        :param limits: список (ключ, скорость, ёмкость)
+        :return: (разрешён ли запрос, сколько секунд ждать по отказавшему ключу)
+        """
+        counted = []
+        allowed, wait = True, 0.0
+        for key, rate, capacity in limits:
+            window = capacity / rate
+            index, elapsed = divmod(time.time(), window)
+            current = f'{self.prefix}{key}:{int(index)}'
+            count = self._increment(current, math.ceil(2 * window))
+            counted.append(current)
+            previous = self.cache.get(f'{self.prefix}{key}:{int(index) - 1}', 0)
+            allowed, wait = sliding_window(previous, count, elapsed, window, capacity)
+            if not allowed:
+                break
+        if not allowed:
+            for current in counted:
+                try:
+                    self.cache.decr(current)
+                except ValueError:
+                    pass
+        return allowed, wait
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    Получение хранилища, указанного в настройках
+    """
+    global _backend  # pylint: disable=global-statement
+    if _backend is None:
+        _backend = import_string(settings.ANSWER_RATE_LIMIT['BACKEND'])(settings.ANSWER_RATE_LIMIT)
+    return _backend
+
+
+def allow_answer(user_id: int, task_id: int) -> Tuple[bool, int]:
+    """
+    Проверка лимитов на отправку ответа: общего для пользователя и на пару пользователь-задача
+
+    :return: (разрешён ли запрос, через сколько секунд можно повторить)
+    """
+    if not settings.ANSWER_RATE_LIMIT.get('ENABLED', True):
+        return True, 0
+    allowed, wait = get_backend().take_all([
+        (f'task:{user_id}:{task_id}', *settings.ANSWER_RATE_LIMIT['TASK']),
+        (f'user:{user_id}', *settings.ANSWER_RATE_LIMIT['USER']),
+    ])
+    return allowed, math.ceil(wait)
@@ -0,0 +1,117 @@
+"""
+Модуль с полнотекстовым поиском задач
+
+Индекс хранится в виртуальной таблице SQLite FTS5 ``main_task_fts`` и содержит
+только активные задачи (rowid совпадает с id задачи). Таблица создаётся миграцией,
+а в актуальном состоянии поддерживается сигналами модели Task. Если база
+данных не SQLite или FTS5 недоступен, функции поиска возвращают None, и
+вызывающий код переходит на запасной вариант через ``icontains``
+"""
+import re
+from typing import List, Optional, Tuple
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import SafeString, mark_safe
+
+FTS_TABLE = 'main_task_fts'
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+_fts_ready = False
+
+
+def fts_available() -> bool:
+    """
+    Проверка того, что индекс FTS5 существует в текущей базе данных
+    """
+    global _fts_ready  # pylint: disable=global-statement
+    if not _fts_ready and connection.vendor == 'sqlite':
+        _fts_ready = FTS_TABLE in connection.introspection.table_names()
+    return _fts_ready
+
+
+def build_query(text: str) -> str:
+    """
+    Преобразование пользовательского ввода в запрос FTS5
+    Каждое слово ищется по префиксу, все слова должны присутствовать
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text.lower()))
+
+
+def highlight(text: str) -> SafeString:
+    """
+    Экранирование фрагмента и замена служебных маркеров на <mark>
+    """
+    return mark_safe(
+        escape(text).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+    )
+
+
+def index_task(id: int, title: str, description: str, active: bool):
+    """
+    Добавление (или обновление) задачи в индексе
+    Неактивные задачи из индекса убираются
+    """
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [id])
+        if active:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)',
+                [id, title, description]
+            )
+
+
+def rebuild():
+    """
+    Полная пересборка индекса по активным задачам
+    Нужна после массовой вставки задач, при которой сигналы модели не вызываются
+    """
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+            f'SELECT id, title, description FROM main_task WHERE active'
+        )
+
+
+def unindex_task(id: int):
+    """
+    Удаление задачи из индекса
+    """
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [id])
+
+
+def search_ids(text: str, offset: int, limit: int) -> Optional[List[Tuple[int, SafeString, SafeString]]]:
+    """
+    Поиск по индексу
+
+    :param text: строка поиска
+    :param offset: сколько результатов пропустить
+    :param limit: сколько результатов вернуть
+    :return: список (id задачи, заголовок с подсветкой, фрагмент описания с подсветкой),
+        упорядоченный по релевантности (bm25, заголовок весит больше описания),
+        либо None, если индекс недоступен
+    """
+    if not fts_available():
+        return None
+    query = build_query(text)
+    if not query:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, '
+            f'highlight({FTS_TABLE}, 0, %s, %s), '
+            f'snippet({FTS_TABLE}, 1, %s, %s, %s, 24) '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s OFFSET %s',
+            [HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END, '…', query, limit, offset]
+        )
+        return [(id, highlight(title), highlight(snippet)) for id, title, snippet in cursor.fetchall()]
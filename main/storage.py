@@ -0,0 +1,58 @@
+"""
+Модуль с хранилищем файлов по хэшу содержимого
+
+Файл сохраняется под именем ``<каталог>/<ab>/<cd>/<sha256>.<расширение>``, где
+каталог берётся из ``upload_to`` поля, а ``ab`` и ``cd`` - первые символы хэша
+(чтобы в одном каталоге не скапливались сотни тысяч файлов). Одинаковые
+загрузки в один каталог хранятся одним файлом. Содержимое по такому имени
+никогда не меняется, поэтому URL можно кэшировать бессрочно
+(``IMMUTABLE_CACHE_CONTROL``)
+"""
+import hashlib
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+HASHED_NAME = re.compile(r'(?:^|/)([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})\.\w+$')
+
+
+def is_content_addressed(name: str) -> bool:
+    """
+    Проверка того, что файл назван по хэшу содержимого
+    """
+    return HASHED_NAME.search(name) is not None
+
+
+def content_name(name: str, content: File) -> str:
+    """
+    Имя файла по хэшу содержимого с сохранением каталога и расширения исходного имени
+    """
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    hexdigest = digest.hexdigest()
+    extension = posixpath.splitext(name)[1].lower()
+    return posixpath.join(posixpath.dirname(name), hexdigest[:2], hexdigest[2:4], hexdigest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, где имя файла - хэш его содержимого
+    Если такой файл уже есть, он не записывается повторно
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+content_addressed_storage = ContentAddressedStorage()
@@ -0,0 +1,35 @@
+"""
+Теги шаблонов для вывода производных изображений
+"""
+from django import template
+from django.core.files.storage import default_storage
+from django.db.models.fields.files import ImageFieldFile
+from django.utils.html import format_html
+
+from main.images import derivative_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(image: ImageFieldFile, ready: bool, size: str, **attrs) -> str:
+    """
+    Вывод изображения через <picture> с WebP и JPEG нужного размера
+    Пока копии не готовы, выводится оригинал
+
+    :param image: поле с оригиналом
+    :param ready: признак готовности производных копий
+    :param size: размер из ``main.images.SIZES``
+    :param attrs: атрибуты тега <img> (class, style, alt)
+    """
+    attributes = format_html(
+        ''.join(f' {key}="{{}}"' for key in attrs), *attrs.values()
+    )
+    if not ready:
+        return format_html('<img src="{}"{}>', image.url, attributes)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}"><img src="{}"{}></picture>',
+        default_storage.url(derivative_name(image.name, size, 'webp')),
+        default_storage.url(derivative_name(image.name, size, 'jpg')),
+        attributes
+    )
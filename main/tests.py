@@ -1,3 +1,1465 @@
-from django.test import TestCase
+"""
+Тесты проекта
+"""
+import importlib
+import io
+import json
+import math
+import posixpath
+import struct
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image, ImageFile, ImageFilter
+
+from main import (
+    analysis, answers, dataset, images, jobs, lsb, media, models, perceptual, profiles, ratelimit, search, timing,
+    uploads
+)
+from main.forms import CreateTaskForm, EncodeTaskForm, UserSettingsEditForm
+from main.pagination import keyset_page
+from main.models import DEFAULT_AVATAR, Complaint, ImageHash, ImageReport, Job, ScoreBucket, Task, UserSettings
+from main.storage import IMMUTABLE_CACHE_CONTROL, content_addressed_storage, content_name, is_content_addressed
+
+
+def make_user(name: str = 'author'):
+    """
+    Создание пользователя с паролем password
+    """
+    return get_user_model().objects.create_user(name, password='password')
+
+
+def make_task(author, **overrides) -> Task:
+    """
+    Создание задачи с типовыми полями, любое из которых можно переопределить
+    """
+    fields = {
+        'title': 'Задача', 'description': 'Описание', 'image': 'images/tasks/task.png',
+        'answer': 'ответ', 'points': 10, 'score_tier': 0,
+    }
+    fields.update(overrides)
+    return Task.objects.create(author=author, **fields)
+
+
+class TempMediaMixin:
+    """
+    Временный MEDIA_ROOT на время класса тестов, удаляется вместе с файлами после него
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        cls.addClassCleanup(media.disable)
+        super().setUpClass()
+
+
+class SetDoneConcurrencyTest(TempMediaMixin, TransactionTestCase):
+    """
+    Проверка начисления очков при параллельных решениях
+    """
+    SOLVERS = 20
+    ATTEMPTS = 5
+
+    def setUp(self):
+        self.task = make_task(make_user())
+        self.solvers = [make_user(f'solver{i}') for i in range(self.SOLVERS)]
+        UserSettings.objects.filter(user__in=self.solvers[:5]).update(score=20)
+
+    def solve(self, user) -> bool:
+        """
+        Решение задачи из отдельного потока со своим соединением
+        """
+        try:
+            return Task.objects.get(id=self.task.id).set_done(user)
+        finally:
+            connection.close()
+
+    def test_parallel_solvers(self):
+        """
+        Каждый решивший получает очки ровно один раз, сколько бы ответов он ни отправил
+        """
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(self.solve, self.solvers * self.ATTEMPTS))
+        self.assertEqual(sum(results), self.SOLVERS)
+        self.assertEqual(self.task.done.count(), self.SOLVERS)
+        scores = sorted(UserSettings.objects.filter(user__in=self.solvers).values_list('score', flat=True))
+        self.assertEqual(scores, [10] * (self.SOLVERS - 5) + [25] * 5)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.done_count, self.SOLVERS)
+        self.assertEqual(ScoreBucket.objects.get(score=10).count, self.SOLVERS - 5)
+        self.assertEqual(ScoreBucket.objects.get(score=25).count, 5)
+
+
+class AnswerCacheTest(TempMediaMixin, TestCase):
+    """
+    Проверка кэша ответов
+    """
+
+    def setUp(self):
+        self.loads = []
+
+    def load(self, id: int) -> tuple:
+        """
+        Загрузка ответа с запоминанием обращений
+        """
+        self.loads.append(id)
+        return f'ответ {id}', True
+
+    @mock.patch('main.answers.time')
+    def test_ttl_and_lru(self, clock):
+        """
+        Запись живёт TTL секунд, при переполнении вытесняется давно не использованная
+        """
+        clock.monotonic.return_value = 1000.0
+        cache = answers.AnswerCache(2, 10)
+        self.assertEqual(cache.get(1, self.load), (answers.answer_hash('ответ 1'), True))
+        cache.get(1, self.load)
+        clock.monotonic.return_value += 10
+        self.assertEqual(cache.peek(1), (False, None))
+        cache.get(1, self.load)
+        self.assertEqual(self.loads, [1, 1])
+        cache.get(2, self.load)
+        cache.get(1, self.load)
+        cache.get(3, self.load)
+        self.assertEqual([cache.peek(id)[0] for id in (1, 2, 3)], [True, False, True])
+
+    def test_invalidate_during_load(self):
+        """
+        Значение, загруженное до сброса, возвращается, но в кэш не попадает
+        """
+        cache = answers.AnswerCache(10, 60)
+
+        def load_and_invalidate(id: int) -> tuple:
+            cache.invalidate(id)
+            return self.load(id)
+
+        def load_and_clear(id: int) -> tuple:
+            cache.clear()
+            return self.load(id)
+        for load in (load_and_invalidate, load_and_clear):
+            self.assertEqual(cache.get(1, load)[1], True)
+            self.assertEqual(cache.peek(1), (False, None))
+        cache.get(1, self.load)
+        self.assertTrue(cache.peek(1)[0])
+        self.assertEqual((cache._loading, cache._versions), ({}, {}))  # pylint: disable=protected-access
+
+    def test_model_changes(self):
+        """
+        Блокировка задач и смена ответа видны проверке сразу после фиксации транзакции
+        """
+        answers.cache.clear()
+        task = make_task(make_user())
+        self.assertTrue(Task.check_answer(task.id, 'ответ'))
+        task.answer = 'новый ответ'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            task.save()
+            self.assertTrue(Task.check_answer(task.id, 'ответ'))
+        self.assertTrue(callbacks)
+        self.assertFalse(Task.check_answer(task.id, 'ответ'))
+        self.assertTrue(Task.check_answer(task.id, ' новый ответ '))
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.deactivate_many([task.id])
+        self.assertFalse(Task.check_answer(task.id, 'новый ответ'))
+
+
+class TaskSearchTest(TempMediaMixin, TestCase):
+    """
+    Проверка полнотекстового поиска задач
+    """
+
+    def setUp(self):
+        self.author = make_user()
+        self.described = make_task(
+            self.author, title='Картинка', description='Ответ спрятан стеганографией в младших битах'
+        )
+        self.titled = make_task(self.author, title='Стеганография для начинающих', description='Простая задача')
+
+    @staticmethod
+    def found(text: str) -> list:
+        """
+        Найденные задачи первой страницы
+        """
+        return Task.search_by_text(text)[0]
+
+    def test_prefix_and_rank(self):
+        """
+        Слова ищутся по префиксу, совпадение в названии выше совпадения в описании
+        """
+        if not search.fts_available():
+            self.skipTest('Нужен SQLite с FTS5')
+        self.assertEqual(self.found('стег'), [self.titled, self.described])
+        self.assertEqual(self.found('СТЕГАНО млад'), [self.described])
+        self.assertIn('<mark>Стеганография</mark>', self.found('стеганография')[0].title_highlight)
+        self.assertEqual(self.found('"*'), [self.described, self.titled])
+
+    def test_index_sync(self):
+        """
+        Изменение, блокировка и удаление задачи сразу видны поиску
+        """
+        if not search.fts_available():
+            self.skipTest('Нужен SQLite с FTS5')
+        self.titled.title = 'Шифр Цезаря'
+        self.titled.save()
+        self.assertEqual(self.found('цез'), [self.titled])
+        self.assertEqual(self.found('стег'), [self.described])
+        self.titled.active = False
+        self.titled.save()
+        self.assertEqual(self.found('цез'), [])
+        self.titled.active = True
+        self.titled.save()
+        self.assertEqual(Task.deactivate_many([self.titled.id]), 1)
+        self.assertEqual(self.found('цез'), [])
+        self.described.delete()
+        self.assertEqual(self.found('стег'), [])
+        search.rebuild()
+        self.assertEqual(self.found('картинка цезаря'), [])
+
+    def test_icontains_fallback(self):
+        """
+        Без FTS5 поиск идёт по подстроке в названии и описании с экранированием
+        """
+        make_task(self.author, title='<b>Стеганография</b>', description='Третья')
+        with mock.patch('main.search.fts_available', return_value=False):
+            self.assertIsNone(search.search_ids('стег', 0, 10))
+            tasks, has_next = Task.search_by_text('еганограф', size=2)
+            self.assertEqual(tasks, [self.described, self.titled])
+            self.assertTrue(has_next)
+            self.assertEqual(Task.search_by_text('еганограф', page=2, size=2)[0][0].title_highlight,
+                             '&lt;b&gt;Стеганография&lt;/b&gt;')
+
+    def test_empty_query(self):
+        """
+        Пустой запрос и запрос без слов возвращают все активные задачи, как и раньше
+        """
+        self.titled.active = False
+        self.titled.save()
+        for fts in (True, False):
+            with mock.patch('main.search.fts_available', return_value=fts and search.fts_available()):
+                for text in ('', '  ', '"*!'):
+                    self.assertEqual(Task.search_by_text(text), ([self.described], False), (fts, text))
+        self.client.force_login(self.author)
+        response = self.client.get('/api/tasks_search/', {'title': '', 'format': 'json'})
+        self.assertEqual([task['id'] for task in response.json()['tasks']], [self.described.id])
+        self.assertNotIn('Ничего не найдено', self.client.get('/api/tasks_search/', {'title': ''}).json()['html'])
+
+
+class TaskCardCacheTest(TempMediaMixin, TestCase):
+    """
+    Проверка кэша карточек каталога
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.author = make_user()
+        self.task = make_task(self.author)
+
+    def render(self, task: Task) -> str:
+        """
+        Карточка задачи в том виде, в каком её отдаёт каталог
+        """
+        return render_to_string('pages/tasks/cards.html', {'items': [[task, False]]})
+
+    def test_versioned_key(self):
+        """
+        Карточка обновляется после сохранения задачи и смены имени автора
+        """
+        self.assertIn('Задача', self.render(Task.objects.select_related('author').get(id=self.task.id)))
+        self.task.title = 'Новое название'
+        self.task.save()
+        self.assertIn('Новое название', self.render(Task.objects.select_related('author').get(id=self.task.id)))
+        self.author.username = 'renamed'
+        self.author.save()
+        self.assertIn('renamed', self.render(Task.objects.select_related('author').get(id=self.task.id)))
+
+    def test_search_cards(self):
+        """
+        Карточки поиска кэшируются отдельно для каждой подсветки
+        """
+        self.task.title_highlight = 'Задача'
+        self.task.snippet = 'Первый запрос'
+        self.assertIn('Первый запрос', self.render(self.task))
+        self.task.snippet = 'Второй запрос'
+        self.assertIn('Второй запрос', self.render(self.task))
+        with mock.patch('django.template.loader_tags.IncludeNode.render') as include:
+            self.assertIn('Второй запрос', self.render(self.task))
+        include.assert_not_called()
+
+
+class DoneCountTest(TempMediaMixin, TestCase):
+    """
+    Проверка пересчёта количества решивших задачу
+    """
+
+    def setUp(self):
+        self.author, self.solver = make_user('author'), make_user('solver')
+        self.tasks = [make_task(self.author, title=f'Задача {i}') for i in range(3)]
+        for task in self.tasks[:2]:
+            task.set_done(self.solver)
+        Job.objects.all().delete()
+
+    def done_counts(self) -> list:
+        """
+        Количество решивших каждую задачу
+        """
+        return [Task.objects.get(id=task.id).done_count for task in self.tasks]
+
+    def test_command(self):
+        """
+        Команда исправляет только разошедшиеся счётчики, повторный запуск ничего не меняет
+        """
+        Task.objects.filter(id=self.tasks[0].id).update(done_count=7)
+        Task.objects.filter(id=self.tasks[2].id).update(done_count=-1)
+        output = io.StringIO()
+        call_command('recount_done', stdout=output)
+        self.assertIn('Исправлено задач: 2', output.getvalue())
+        self.assertEqual(self.done_counts(), [1, 1, 0])
+        self.assertEqual(Task.recount_done(), 0)
+        call_command('recount_done', '--enqueue', stdout=output)
+        self.assertEqual(list(Job.objects.values_list('name', flat=True)), ['recount_done'])
+
+    def test_user_deleted(self):
+        """
+        Удаление решившего ставит пересчёт в очередь, и фоновая задача исправляет счётчики
+        """
+        self.solver.delete()
+        self.assertEqual(self.done_counts(), [1, 1, 0])
+        self.assertEqual(list(Job.objects.values_list('name', flat=True)), ['recount_done'])
+        jobs.work('worker', once=True)
+        self.assertEqual(self.done_counts(), [0, 0, 0])
+        self.assertFalse(Job.objects.exists())
+
+
+class ScoreBucketTest(TestCase):
+    """
+    Проверка гистограммы рейтинга
+    """
+
+    def setUp(self):
+        self.users = [make_user(f'user{i}') for i in range(5)]
+
+    def set_score(self, user, score: int):
+        """
+        Изменение очков пользователя вместе с корзинами
+        """
+        usersettings = UserSettings.objects.get(user=user)
+        ScoreBucket.move(usersettings.score, score)
+        UserSettings.objects.filter(id=usersettings.id).update(score=score)
+
+    def assertRanks(self):
+        """
+        Место каждого пользователя совпадает с подсчётом по всем настройкам
+        """
+        for usersettings in UserSettings.objects.all():
+            expected = UserSettings.objects.filter(score__gt=usersettings.score).count() + 1
+            self.assertEqual(usersettings.get_rank(), expected, usersettings.score)
+
+    def test_move_and_rank(self):
+        """
+        Одинаковые очки делят место, перенос, удаление и пустые корзины не ломают места
+        """
+        self.assertEqual(ScoreBucket.objects.get(score=0).count, 5)
+        self.assertEqual(ScoreBucket.get_rank(0), 1)
+        for user, score in zip(self.users, (30, 30, 20, 10)):
+            self.set_score(user, score)
+        self.assertEqual([ScoreBucket.get_rank(score) for score in (30, 20, 10, 0)], [1, 3, 4, 5])
+        self.assertRanks()
+        self.set_score(self.users[2], 40)
+        self.assertEqual(ScoreBucket.objects.get(score=20).count, 0)
+        self.assertEqual(ScoreBucket.get_rank(20), 4)
+        self.assertRanks()
+        ScoreBucket.move(40, 40)
+        self.assertEqual(ScoreBucket.objects.get(score=40).count, 1)
+        self.users[0].delete()
+        self.assertEqual(ScoreBucket.objects.get(score=30).count, 1)
+        self.assertRanks()
+        ScoreBucket.rebuild()
+        self.assertFalse(ScoreBucket.objects.filter(count=0).exists())
+        self.assertRanks()
+
+    def test_users_without_buckets(self):
+        """
+        Пользователи, появившиеся до гистограммы: решение не даёт отрицательных корзин,
+        а миграция заполняет корзины по уже существующим очкам
+        """
+        UserSettings.objects.filter(user__in=self.users[:2]).update(score=20)
+        ScoreBucket.objects.all().delete()
+        self.set_score(self.users[0], 30)
+        self.set_score(self.users[2], 10)
+        self.assertEqual(list(ScoreBucket.objects.order_by('score').values_list('score', 'count')), [(10, 1), (30, 1)])
+        ScoreBucket.objects.all().delete()
+        migration = importlib.import_module('main.migrations.0012_scorebucket')
+        migration.fill_buckets(apps, None)
+        self.assertEqual(
+            list(ScoreBucket.objects.order_by('score').values_list('score', 'count')),
+            [(0, 2), (10, 1), (20, 1), (30, 1)]
+        )
+        self.assertRanks()
+        self.set_score(self.users[1], 0)
+        self.set_score(self.users[3], 0)
+        self.assertEqual(ScoreBucket.objects.get(score=20).count, 0)
+        self.assertFalse(ScoreBucket.objects.filter(count__lt=0).exists())
+        self.assertRanks()
+
+
+class ComplaintResolveTest(TempMediaMixin, TestCase):
+    """
+    Проверка массового рассмотрения жалоб
+    """
+
+    def setUp(self):
+        self.user = make_user('user')
+        self.tasks = [make_task(self.user, title=f'Задача {i}') for i in range(3)]
+        self.complaints = [
+            Complaint.objects.create(author=self.user, task=self.tasks[i], description='Жалоба')
+            for i in (0, 0, 1, 1, 2)
+        ]
+
+    def states(self) -> tuple:
+        """
+        Состояния жалоб и активность задач
+        """
+        return (
+            [Complaint.objects.get(id=complaint.id).state for complaint in self.complaints],
+            [Task.objects.get(id=task.id).active for task in self.tasks],
+        )
+
+    def test_resolve_many(self):
+        """
+        Принятие блокирует задачи и отклоняет остальные жалобы на них, рассмотренные жалобы не меняются
+        """
+        first, second, third, fourth, fifth = [complaint.id for complaint in self.complaints]
+        result = Complaint.resolve_many(accept=[first, third, 999], dismiss=[fifth, second])
+        self.assertEqual(result, {'accepted': 2, 'dismissed': 3, 'blocked': 2})
+        accepted, dismissed = Complaint.ACCEPTED, Complaint.DISMISSED
+        self.assertEqual(self.states(), ([accepted, dismissed, accepted, dismissed, dismissed], [False, False, True]))
+        self.assertEqual(
+            Complaint.resolve_many(accept=[second, fifth], dismiss=[first]),
+            {'accepted': 0, 'dismissed': 0, 'blocked': 0}
+        )
+        self.assertEqual(self.states()[0], [accepted, dismissed, accepted, dismissed, dismissed])
+
+    def test_single_transaction(self):
+        """
+        Ошибка при блокировке задач откатывает и изменения жалоб
+        """
+        with mock.patch.object(Task, 'deactivate_many', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            Complaint.resolve_many(accept=[self.complaints[0].id], dismiss=[self.complaints[4].id])
+        self.assertEqual(self.states(), ([Complaint.PENDING] * 5, [True] * 3))
+
+    def test_api(self):
+        """
+        API доступно только администраторам и только через POST, некорректные id пропускаются
+        """
+        self.client.force_login(self.user)
+        data = {'accept': [self.complaints[0].id, 'abc'], 'dismiss': [self.complaints[4].id, '']}
+        self.assertEqual(self.client.post('/api/complaints/resolve/', data).status_code, 404)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get('/api/complaints/resolve/', data).status_code, 404)
+        self.assertEqual(self.states()[0], [Complaint.PENDING] * 5)
+        response = self.client.post('/api/complaints/resolve/', data)
+        self.assertEqual(response.json(), {'accepted': 1, 'dismissed': 2, 'blocked': 1})
+        self.assertEqual(self.states()[1], [False, True, True])
+
+
+class ComplaintQueueTest(TestCase):
+    """
+    Проверка очереди модерации
+    """
+
+    def test_deleted_task(self):
+        """
+        Задача, удалённая между запросами страницы, пропускается, остальные группы остаются
+        """
+        author = make_user()
+        tasks = [make_task(author, title=f'Задача {i}') for i in range(3)]
+        for i, task in enumerate(tasks):
+            for _ in range(i + 1):
+                Complaint.objects.create(author=author, task=task, description='Жалоба')
+        count_page = models.count_page
+
+        def delete_after_groups(*args, **kwargs):
+            page = count_page(*args, **kwargs)
+            tasks[1].delete()
+            return page
+        with mock.patch('main.models.count_page', side_effect=delete_after_groups):
+            queue, _ = Complaint.get_queue('', 10)
+        self.assertEqual([(item['task'], item['reports']) for item in queue], [(tasks[2], 3), (tasks[0], 1)])
+
+
+class LsbTest(SimpleTestCase):
+    """
+    Проверка встраивания и извлечения текста
+    """
+
+    def test_round_trip(self):
+        """
+        Текст извлекается при любых каналах и глубине
+        """
+        cover = Image.new('RGB', (40, 30), (120, 200, 33))
+        for channels, bits in (('RGB', 1), ('G', 2), ('RB', 4)):
+            encoded = lsb.encode(cover, 'Секретный ответ', channels, bits)
+            self.assertEqual(lsb.decode(encoded, channels, bits), 'Секретный ответ')
+
+    def test_capacity(self):
+        """
+        Слишком длинный текст не встраивается
+        """
+        cover = Image.new('RGB', (10, 10))
+        with self.assertRaises(ValueError):
+            lsb.encode(cover, 'x' * (lsb.capacity(cover, 'RGB', 1) + 1))
+
+
+class EncodeTaskTest(TempMediaMixin, TestCase):
+    """
+    Проверка создания задачи со встраиванием текста на сервере
+    """
+
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_login(self.user)
+
+    def data(self, **kwargs) -> dict:
+        """
+        Данные формы с JPEG-изображением без текста
+        """
+        buffer = io.BytesIO()
+        Image.effect_mandelbrot((120, 90), (-2, -1, 1, 1), 60).convert('RGB').save(buffer, 'JPEG')
+        return {
+            'author': self.user.id, 'title': 'Задача', 'description': 'Описание', 'answer': 'ответ',
+            'points': 10, 'score_tier': 0, 'channels': ['R', 'G', 'B'], 'bits': 1,
+            'image': SimpleUploadedFile('cover.jpg', buffer.getvalue(), 'image/jpeg'), **kwargs
+        }
+
+    def test_round_trip(self):
+        """
+        Сохранённое изображение - PNG, из которого текст извлекается с выбранными каналами и глубиной
+        """
+        for channels, bits, secret in ((['G'], 2, 'Здесь спрятан ответ'), (['R', 'B'], 4, '')):
+            response = self.client.post('/tasks/encode/', self.data(channels=channels, bits=bits, secret=secret))
+            task = Task.objects.latest('id')
+            self.assertRedirects(response, f'/tasks/{task.id}/', fetch_redirect_response=False)
+            with task.image.open() as file, Image.open(file) as image:
+                self.assertEqual(image.format, 'PNG')
+                self.assertEqual(lsb.decode(image, channels, bits), secret or 'ответ')
+            self.assertEqual(task.author, self.user)
+
+    def test_invalid(self):
+        """
+        Текст без ответа и текст больше вместимости отклоняются, задача не создаётся
+        """
+        data = self.data(secret='без него')
+        form = EncodeTaskForm(data=data, files={'image': data.pop('image')})
+        self.assertFalse(form.is_valid())
+        self.assertIn('secret', form.errors)
+        data = self.data(secret='ответ' * 1000, channels=['B'])
+        form = EncodeTaskForm(data=data, files={'image': data.pop('image')})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['image'], ['Текст не помещается в изображение'])
+        self.assertFalse(Task.objects.exists())
+
+
+class SteganalysisTest(TempMediaMixin, TestCase):
+    """
+    Проверка стегоанализа изображений задач
+    """
+
+    def setUp(self):
+        self.cover = Image.effect_mandelbrot((256, 192), (-2, -1, 1, 1), 60).convert('RGB').filter(
+            ImageFilter.GaussianBlur(3)
+        )
+        pixels = np.asarray(self.cover)
+        self.random_lsb = Image.fromarray(
+            (pixels & 0xFE) | np.random.default_rng(0).integers(0, 2, pixels.shape, dtype=np.uint8)
+        )
+
+    def test_scores(self):
+        """
+        Чистое изображение почти не подозрительно, заполненная случайными битами
+        младшая плоскость обнаруживается обеими атаками, а RS оценивает долю встраивания
+        """
+        clean = analysis.analyse(self.cover)
+        self.assertLess(clean['detectability'], 0.1)
+        full = analysis.analyse(self.random_lsb)
+        self.assertGreater(full['chi_square'], 0.9)
+        self.assertGreater(full['rs_estimate'], 0.9)
+        self.assertGreater(full['lsb_entropy'], clean['lsb_entropy'])
+        text = ''.join(map(chr, np.random.default_rng(1).integers(0x400, 0x450, 9000)))
+        half = analysis.analyse(lsb.encode(self.cover, text))
+        self.assertGreater(half['rs_estimate'], 0.4)
+        self.assertLess(half['rs_estimate'], full['rs_estimate'])
+        self.assertEqual(clean['capacity'], lsb.capacity(self.cover, 'RGB', 1))
+
+    def test_report(self):
+        """
+        Отчёт сохраняется по задаче и обновляется при повторном анализе, пропавший файл пропускается
+        """
+        task = make_task(make_user())
+        clean = default_storage.save('images/tasks/clean.png', io.BytesIO(lsb.to_png(self.cover)))
+        embedded = default_storage.save('images/tasks/embedded.png', io.BytesIO(lsb.to_png(self.random_lsb)))
+        ImageReport.analyse_task(task.id, 'images/tasks/missing.png')
+        self.assertFalse(ImageReport.objects.exists())
+        ImageReport.analyse_task(task.id, clean)
+        self.assertLess(ImageReport.objects.get(task=task).detectability, 0.1)
+        ImageReport.analyse_task(task.id, embedded)
+        report = ImageReport.objects.get(task=task)
+        self.assertEqual(report.image_name, embedded)
+        self.assertGreater(report.detectability, 0.9)
+        self.assertEqual(len(report.bitplane_entropy), 8)
+
+
+class PerceptualHashTest(SimpleTestCase):
+    """
+    Проверка перцептивных хэшей
+    """
+
+    def test_near_duplicate(self):
+        """
+        Встраивание текста и уменьшение почти не меняют pHash, другое изображение - меняет
+        """
+        cover = Image.effect_mandelbrot((256, 192), (-2, -1, 1, 1), 60).convert('RGB').filter(
+            ImageFilter.GaussianBlur(3)
+        )
+        other = Image.linear_gradient('L').convert('RGB')
+        original = perceptual.hashes(cover)['phash']
+        for changed in (lsb.encode(cover, 'Секретный ответ'), cover.resize((128, 96))):
+            self.assertLessEqual(perceptual.distance(original, perceptual.hashes(changed)['phash']), 2)
+        self.assertGreater(perceptual.distance(original, perceptual.hashes(other)['phash']), perceptual.MAX_DISTANCE)
+
+    def test_chunks(self):
+        """
+        Части хэша собираются обратно в хэш, знаковое хранение обратимо
+        """
+        value = 0xF00DBABE12345678
+        parts = perceptual.chunks(value)
+        self.assertEqual(sum(part << (16 * (3 - i)) for i, part in enumerate(parts)), value)
+        self.assertEqual(perceptual.to_unsigned(perceptual.to_signed(value)), value)
+
+
+class ImageHashTest(TempMediaMixin, TestCase):
+    """
+    Проверка поиска похожих изображений задач
+    """
+
+    def setUp(self):
+        self.author = make_user()
+        self.cover = Image.effect_mandelbrot((256, 192), (-2, -1, 1, 1), 60).convert('RGB').filter(
+            ImageFilter.GaussianBlur(3)
+        )
+
+    def indexed_task(self, image: Image.Image, name: str = 'images/tasks/task.png') -> Task:
+        """
+        Задача с сохранённым изображением и посчитанными хэшами
+        """
+        name = default_storage.save(name, io.BytesIO(lsb.to_png(image)))
+        task = make_task(self.author, image=name)
+        ImageHash.index_task(task.id, name)
+        return task
+
+    def test_find_similar(self):
+        """
+        Похожие изображения находятся, самые похожие в начале, непохожие - нет
+        """
+        task = self.indexed_task(self.cover)
+        other = self.indexed_task(Image.linear_gradient('L').convert('RGB'))
+        copy = self.indexed_task(lsb.encode(self.cover, 'Секретный ответ'))
+        found = ImageHash.find_similar(perceptual.hashes(self.cover))
+        self.assertEqual({item[0] for item in found}, {task, copy})
+        self.assertEqual(found[0], [task, 0])
+        self.assertLessEqual(found[1][1], 2)
+        self.assertEqual(ImageHash.find_similar(perceptual.hashes(self.cover), limit=1), [[task, 0]])
+        self.assertNotIn(other, [item[0] for item in found])
+        noise = Image.fromarray(np.random.default_rng(0).integers(0, 256, (192, 256, 3), dtype=np.uint8))
+        self.assertEqual(ImageHash.find_similar(perceptual.hashes(noise)), [])
+
+    def test_form_rejects_duplicate(self):
+        """
+        Форма отклоняет похожее изображение и перечисляет задачи, с отметкой - принимает
+        """
+        task = self.indexed_task(self.cover)
+        data = {
+            'author': self.author.id, 'title': 'Задача', 'description': 'Описание', 'answer': 'ответ',
+            'points': 10, 'score_tier': 0
+        }
+        image = lsb.to_png(self.cover.resize((128, 96)))
+        form = CreateTaskForm(data=data, files={'image': SimpleUploadedFile('copy.png', image, 'image/png')})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['image'], ['Похожие изображения уже есть в других задачах'])
+        self.assertEqual([item[0] for item in form.duplicates], [task])
+        form = CreateTaskForm(
+            data={**data, 'allow_duplicate': True},
+            files={'image': SimpleUploadedFile('copy.png', image, 'image/png')}
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.duplicates, [])
+
+    def test_hash_media_rename(self):
+        """
+        Перенос файла на имя по хэшу меняет имя и в хэшах, и в отчёте стегоанализа
+        """
+        task = self.indexed_task(self.cover, 'images/tasks/legacy.png')
+        ImageReport.analyse_task(task.id, task.image.name)
+        call_command('hash_media', stdout=io.StringIO())
+        task.refresh_from_db()
+        self.assertTrue(is_content_addressed(task.image.name))
+        self.assertEqual(ImageHash.objects.get(task=task).image_name, task.image.name)
+        self.assertEqual(ImageReport.objects.get(task=task).image_name, task.image.name)
+
+
+class RequestTimingTest(TempMediaMixin, TestCase):
+    """
+    Проверка замеров запросов и бюджета запросов
+    """
+
+    def setUp(self):
+        profiles.get_cache().clear()
+        self.user = make_user('user')
+        self.client.force_login(self.user)
+
+    @override_settings(REQUEST_TIMING=True)
+    def test_server_timing(self):
+        """
+        Замеры отдаются заголовком, логом и накапливаются по представлениям
+        """
+        timing.stats.clear()
+        with self.assertLogs('main.timing') as logs:
+            response = self.client.get(f'/accounts/profile/{self.user.id}/')
+        self.assertEqual(json.loads(logs.records[0].getMessage())['view'], 'profile')
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^sql;desc="\d+ queries";dur=[\d.]+, template;dur=[\d.]+, total;dur=[\d.]+$'
+        )
+        self.assertEqual([row['view'] for row in timing.stats.summary()], ['profile'])
+
+    def test_query_budget(self):
+        """
+        Повторный просмотр профиля укладывается в бюджет, превышение бюджета - ошибка
+        """
+        self.client.get(f'/accounts/profile/{self.user.id}/')
+        with timing.max_queries(4):
+            self.client.get(f'/accounts/profile/{self.user.id}/')
+        with self.assertRaises(AssertionError):
+            with timing.max_queries(0):
+                Task.get_active().count()
+
+
+class CheckAnswerApiTest(TempMediaMixin, TestCase):
+    """
+    Проверка api отправки ответа
+    """
+
+    def setUp(self):
+        ratelimit._backend = None  # pylint: disable=protected-access
+        answers.cache.clear()
+        self.user = make_user('user')
+        self.task = make_task(self.user)
+        self.client.force_login(self.user)
+
+    def answer(self, id: str, answer: str = 'неверно', prefix: str = '') -> tuple:
+        """
+        Отправка ответа, возвращает код и тело ответа
+        """
+        response = self.client.get(f'/api/{prefix}check_answer/', {'id': id, 'answer': answer})
+        return response.status_code, response.json()
+
+    def test_bad_id(self):
+        """
+        Некорректный id отклоняется до лимита частоты и не заводит ведро
+        """
+        for prefix in ('', 'async/'):
+            for id in ('', 'abc', ' 5', '+5', '-5', '0', '5.0', '٥', '9' * 5000):
+                self.assertEqual(self.answer(id, prefix=prefix)[0], 400, (prefix, id))
+        self.assertEqual(len(ratelimit.get_backend()._buckets), 0)  # pylint: disable=protected-access
+
+    def test_id_forms_share_bucket(self):
+        """
+        Записи одного id с ведущими нулями попадают в одно ведро
+        """
+        capacity = settings.ANSWER_RATE_LIMIT['TASK'][1]
+        for _ in range(capacity):
+            self.assertEqual(self.answer(str(self.task.id))[0], 200)
+        self.assertEqual(self.answer(f'0{self.task.id}')[0], 429)
+        self.assertEqual(self.answer(f'00{self.task.id}', prefix='async/')[0], 429)
+
+    def test_deactivated_after_check(self):
+        """
+        Задача, заблокированная после проверки ответа по кэшу, не засчитывается и не роняет запрос
+        """
+        for prefix in ('', 'async/'):
+            self.assertFalse(self.answer(str(self.task.id), prefix=prefix)[1]['is_ok'])
+            Task.objects.filter(id=self.task.id).update(active=False)
+            status, body = self.answer(str(self.task.id), 'ответ', prefix)
+            self.assertEqual((status, body['is_ok']), (200, False))
+            self.assertFalse(self.task.done.exists())
+            Task.objects.filter(id=self.task.id).update(active=True)
+            answers.cache.clear()
+
+    @mock.patch('main.ratelimit.time')
+    def test_rate_limit(self, clock):
+        """
+        Пачка ответов проходит, следующий отклоняется с Retry-After, жетоны восстанавливаются,
+        а ведро одной задачи не мешает отвечать на другую
+        """
+        clock.monotonic.return_value = 1000.0
+        other = make_task(self.user, title='Другая')
+        rate, capacity = settings.ANSWER_RATE_LIMIT['TASK']
+        for _ in range(capacity):
+            self.assertEqual(self.answer(str(self.task.id))[0], 200)
+        response = self.client.get('/api/check_answer/', {'id': self.task.id, 'answer': 'неверно'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(math.ceil(1 / rate)))
+        self.assertEqual(self.answer(str(other.id))[0], 200)
+        clock.monotonic.return_value += 1 / rate
+        self.assertEqual(self.answer(str(self.task.id))[0], 200)
+        self.assertEqual(self.answer(str(self.task.id))[0], 429)
+
+    def test_rate_limit_disabled(self):
+        """
+        Выключенный лимит (для нагрузочных тестов) пропускает все ответы
+        """
+        with override_settings(ANSWER_RATE_LIMIT=dict(settings.ANSWER_RATE_LIMIT, ENABLED=False)):
+            statuses = {self.answer(str(self.task.id))[0] for _ in range(settings.ANSWER_RATE_LIMIT['TASK'][1] * 2)}
+        self.assertEqual(statuses, {200})
+
+    @mock.patch('main.ratelimit.time')
+    def test_eviction(self, clock):
+        """
+        Очистка удаляет только полные вёдра, каждое по его собственной скорости,
+        и запускается не на каждом запросе
+        """
+        clock.monotonic.return_value = 1000.0
+        backend = ratelimit.LocalMemoryBackend({'MAX_KEYS': 4})
+        self.assertTrue(backend.take('user:1', 0.01, 1)[0])
+        with mock.patch.object(backend, '_evict', wraps=backend._evict) as evict:  # pylint: disable=protected-access
+            for number in range(100):
+                clock.monotonic.return_value += 0.1
+                backend.take(f'task:1:{number}', 100, 1)
+        self.assertLessEqual(evict.call_count, 100 // 3)
+        self.assertLessEqual(len(backend._buckets), 8)  # pylint: disable=protected-access
+        allowed, wait = backend.take('user:1', 0.01, 1)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 90.0)
+
+    @mock.patch('main.ratelimit.time')
+    def test_denied_keeps_tokens(self, clock):
+        """
+        Запрос, отклонённый лимитом задачи, не тратит общий лимит пользователя:
+        перебор ответов на одну задачу не блокирует остальные
+        """
+        clock.monotonic.return_value = clock.time.return_value = 1000.0
+        caches['default'].clear()
+        for backend in (ratelimit.LocalMemoryBackend({}), ratelimit.CacheBackend({})):
+            def limits(task: int) -> list:
+                return [(f'task:1:{task}', 0.5, 5), ('user:1', 2, 20)]
+            self.assertEqual(sum(backend.take_all(limits(0))[0] for _ in range(40)), 5, backend)
+            self.assertEqual(sum(backend.take_all(limits(task))[0] for task in range(1, 40)), 15, backend)
+            allowed, wait = backend.take_all(limits(40))
+            self.assertFalse(allowed)
+            self.assertGreater(wait, 0)
+
+    @mock.patch('main.ratelimit.time')
+    def test_cache_backend(self, clock):
+        """
+        Параллельные запросы к общему кэшу не превышают лимит, отклонённые не тратят его,
+        а ожидание приводит к разрешённому запросу
+        """
+        clock.time.return_value = 1000.0
+        caches['default'].clear()
+        backend = ratelimit.CacheBackend({})
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda _: backend.take('task:1:1', 0.5, 5), range(64)))
+        self.assertEqual(sum(allowed for allowed, _ in results), 5)
+        self.assertEqual(caches['default'].get('ratelimit:task:1:1:100'), 5)
+        allowed, wait = backend.take('task:1:1', 0.5, 5)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 12.0)
+        clock.time.return_value += wait - 0.1
+        self.assertFalse(backend.take('task:1:1', 0.5, 5)[0])
+        clock.time.return_value += 0.2
+        self.assertTrue(backend.take('task:1:1', 0.5, 5)[0])
+        self.assertFalse(backend.take('task:1:1', 0.5, 5)[0])
+
+
+class ProfileSummaryTest(TempMediaMixin, TestCase):
+    """
+    Проверка кэша сводки профиля
+    """
+
+    def setUp(self):
+        profiles.get_cache().clear()
+        self.author, self.solver, self.other = [make_user(name) for name in ('author', 'solver', 'other')]
+        self.task = self.committed_task()
+        self.client.force_login(self.solver)
+
+    def committed_task(self) -> Task:
+        """
+        Создание задачи автором с фиксацией транзакции для сигналов
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_task(self.author)
+
+    def profile(self) -> dict:
+        """
+        Контекст страницы профиля решающего
+        """
+        return self.client.get(f'/accounts/profile/{self.solver.id}/').context
+
+    def test_query_count(self):
+        """
+        Повторный показ профиля - фиксированное число запросов при любом количестве задач
+        """
+        for _ in range(6):
+            Task.objects.get(id=self.committed_task().id).set_done(self.solver)
+        self.profile()
+        with self.assertNumQueries(4):
+            context = self.profile()
+        self.assertEqual(len(context['tasks_to_history']), 5)
+        self.assertEqual(context['rank'], 1)
+        self.assertEqual(context['rank'], UserSettings.objects.get(user=self.solver).get_rank())
+
+    def test_done_count_fresh(self):
+        """
+        Количество прохождений в закэшированной сводке не устаревает
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.task.set_done(self.solver)
+        self.assertEqual(self.profile()['tasks_to_history'], [[self.task, 1]])
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.get(id=self.task.id).set_done(self.other)
+        self.assertEqual(self.profile()['tasks_to_history'][0][1], 2)
+
+    def test_active_tasks_change(self):
+        """
+        Новая, заблокированная и удалённая задача сразу меняет предложенную задачу в чужих сводках
+        """
+        self.assertEqual(self.profile()['suggestion_task'], self.task)
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.deactivate_many([self.task.id])
+        self.assertIsNone(self.profile()['suggestion_task'])
+        task = self.committed_task()
+        self.assertEqual(self.profile()['suggestion_task'], task)
+        with self.captureOnCommitCallbacks(execute=True):
+            task.delete()
+        self.assertIsNone(self.profile()['suggestion_task'])
+
+    def test_reactivation(self):
+        """
+        Снова открытая задача возвращается в сводки, а сохранение неактивной задачи их не сбрасывает
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.deactivate_many([self.task.id])
+        self.assertIsNone(self.profile()['suggestion_task'])
+        task = Task.objects.get(id=self.task.id)
+        task.title = 'Новое название'
+        with mock.patch('main.profiles.invalidate_all') as invalidate_all:
+            task.save()
+        invalidate_all.assert_not_called()
+        task.active = True
+        with self.captureOnCommitCallbacks(execute=True):
+            task.save()
+        self.assertEqual(self.profile()['suggestion_task'], self.task)
+
+    def test_invalidate_during_build(self):
+        """
+        Сводка, собранная до сброса, возвращается, но следующий показ собирает новую
+        """
+        def build_and_invalidate(invalidate) -> dict:
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidate()
+            return {'build': 'stale'}
+        for invalidate in (lambda: profiles.invalidate(self.solver.id), profiles.invalidate_all):
+            profiles.get_cache().clear()
+            summary = profiles.get(self.solver.id, lambda: build_and_invalidate(invalidate))
+            self.assertEqual(summary, {'build': 'stale'})
+            self.assertEqual(profiles.get(self.solver.id, lambda: {'build': 'fresh'}), {'build': 'fresh'})
+            self.assertEqual(profiles.get(self.solver.id, lambda: {'build': 'unused'}), {'build': 'fresh'})
+        profiles.get_cache().delete(profiles.GENERATION_KEY)
+        self.assertEqual(profiles.get(self.solver.id, lambda: {'build': 'evicted'}), {'build': 'evicted'})
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Планы запросов проверяются для SQLite')
+class QueryPlanTest(TestCase):
+    """
+    Проверка того, что горячие запросы идут по индексам, без полного просмотра и сортировки
+    """
+
+    def setUp(self):
+        self.user = make_user('user')
+        Task.objects.bulk_create(
+            Task(
+                author=self.user, title=f'Задача {i}', description='Описание', image=f'images/tasks/{i}.png',
+                answer='ответ', points=10, score_tier=i % 7 * 5, active=i % 5 > 0
+            ) for i in range(60)
+        )
+
+    @staticmethod
+    def plans(func) -> list:
+        """
+        Планы (EXPLAIN QUERY PLAN) всех запросов, выполненных функцией
+        """
+        with CaptureQueriesContext(connection) as context:
+            func()
+        with connection.cursor() as cursor:
+            return [
+                ' | '.join(row[-1] for row in cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}').fetchall())
+                for query in context.captured_queries
+            ]
+
+    def assertIndexed(self, plan: str, index: str):
+        """
+        План использует индекс и не сортирует во временном B-дереве
+        """
+        self.assertIn(index, plan)
+        self.assertNotIn('SCAN main_task', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_catalogue_pages(self):
+        """
+        Первая страница и страница по курсору берутся из индекса (active, created, id)
+        """
+        result = {}
+
+        def first_page():
+            result['page'] = keyset_page(Task.get_catalogue(self.user), '', 10)
+        first, = self.plans(first_page)
+        self.assertIndexed(first, 'task_active_created_idx (active=?)')
+        cursor, = self.plans(lambda: keyset_page(Task.get_catalogue(self.user), result['page'][1], 10))
+        self.assertIndexed(cursor, 'task_active_created_idx (active=? AND created>?)')
+
+    def test_suggestion(self):
+        """
+        Предлагаемая задача выбирается запросами по индексу (active, score_tier) с тем же порядком диапазонов
+        """
+        Task.objects.filter(score_tier=15).first().done.add(self.user)
+        done = set(Task.done.through.objects.filter(user=self.user).values_list('task_id', flat=True))
+        tasks = [task for task in Task.get_active() if task.id not in done]
+        for score in (0, 12, 28, 100):
+            UserSettings.objects.filter(user=self.user).update(score=score)
+            self.user.refresh_from_db()
+            expected = min(tasks, key=lambda task: (
+                (0, task.score_tier, task.id) if score <= task.score_tier <= score + 5
+                else (1, task.score_tier, task.id) if task.score_tier > score + 5
+                else (2, -task.score_tier, -task.id)
+            ))
+            self.assertEqual(Task.get_suggestion_task(self.user), expected)
+        for plan in self.plans(lambda: Task.get_suggestion_task(self.user))[1:]:
+            self.assertIndexed(plan, 'task_active_tier_idx')
+
+
+class DatasetTest(TempMediaMixin, TestCase):
+    """
+    Проверка генерации синтетических данных
+    """
+
+    def setUp(self):
+        self.result = dataset.seed(0, users=20, tasks=10, solves=50, complaints=5, prefix='smoke')
+
+    def test_seed(self):
+        """
+        Создаётся заказанное количество объектов, счётчики решений и гистограмма рейтинга согласованы с данными
+        """
+        self.assertEqual(get_user_model().objects.filter(username__startswith='smoke').count(), 20)
+        self.assertEqual(UserSettings.objects.count(), 20)
+        self.assertEqual(Task.objects.count(), 10)
+        self.assertEqual(Complaint.objects.count(), 5)
+        self.assertEqual(Task.done.through.objects.count(), self.result['solves'])
+        self.assertEqual(sum(Task.objects.values_list('done_count', flat=True)), self.result['solves'])
+        self.assertEqual(Task.recount_done(), 0)
+        scores = {}
+        for score in UserSettings.objects.values_list('score', flat=True):
+            scores[score] = scores.get(score, 0) + 1
+        self.assertEqual(dict(ScoreBucket.objects.values_list('score', 'count')), scores)
+
+    def test_prefix_collision(self):
+        """
+        Повторная генерация с занятым префиксом отклоняется до вставки, другой префикс проходит
+        """
+        options = ['--users', '3', '--tasks', '2', '--solves', '3', '--complaints', '1', '--no-images']
+        with self.assertRaisesMessage(CommandError, 'smoke'):
+            call_command('generate_dataset', *options, '--prefix', 'smoke', stdout=io.StringIO())
+        self.assertEqual(get_user_model().objects.count(), 20)
+        call_command('generate_dataset', *options, '--prefix', 'smok', stdout=io.StringIO())
+        self.assertEqual(get_user_model().objects.count(), 23)
+
+
+class UploadValidationTest(TempMediaMixin, TestCase):
+    """
+    Проверка загрузки изображений: бюджеты, удаление метаданных и то, что файл
+    не декодируется и не читается в память целиком
+    """
+
+    class ReadRecorder:
+        """
+        Обёртка файла загрузки, запоминающая размеры прочитанных кусков
+        """
+
+        def __init__(self, file):
+            self.file = file
+            self.reads = []
+
+        def read(self, size: int = -1) -> bytes:
+            data = self.file.read(size)
+            self.reads.append(len(data))
+            return data
+
+        def __getattr__(self, name):
+            return getattr(self.file, name)
+
+    def assertNotDecoded(self, validate, upload) -> list:
+        """
+        Проверка формы без вызова декодера пикселей
+
+        :return: размеры кусков, прочитанных из загрузки
+        """
+        upload.file = self.ReadRecorder(upload.file)
+        with mock.patch.object(ImageFile.ImageFile, 'load', autospec=True) as load:
+            validate()
+        load.assert_not_called()
+        return upload.file.reads
+
+    def test_decompression_bomb(self):
+        """
+        PNG на 2.5 гигапикселя отклоняется по заголовку, не распаковываясь
+        """
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+        bomb = (
+            uploads.PNG_SIGNATURE + chunk(b'IHDR', struct.pack('>IIBBBBB', 50000, 50000, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(bytes(1 << 24), 9)) + chunk(b'IEND', b'')
+        )
+        author = make_user()
+        data = {
+            'author': author.id, 'title': 'Бомба', 'description': 'Бомба', 'answer': 'a', 'points': 5, 'score_tier': 0
+        }
+        upload = SimpleUploadedFile('bomb.png', bomb)
+        form = CreateTaskForm(data=data, files={'image': upload})
+        reads = self.assertNotDecoded(form.is_valid, upload)
+        self.assertEqual(form.errors.as_data()['image'][0].code, 'too_many_pixels')
+        self.assertGreater(len(bomb), 10 * 1024)
+        self.assertLess(sum(reads), 1024)
+
+    def test_avatar_metadata(self):
+        """
+        Из аватара удаляется EXIF, кроме ориентации, пиксели не меняются, большой файл не читается в память
+        """
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        exif[0x0112] = 6
+        picture = Image.fromarray(np.random.default_rng(0).integers(0, 256, (800, 800, 3), dtype=np.uint8))
+        upload = TemporaryUploadedFile('avatar.jpg', 'image/jpeg', 0, None)
+        picture.save(upload.file, 'JPEG', exif=exif, quality=95)
+        upload.size = upload.file.tell()
+        self.assertGreater(upload.size, 512 * 1024)
+        form = UserSettingsEditForm(data={}, files={'avatar': upload})
+        reads = self.assertNotDecoded(form.is_valid, upload)
+        self.assertTrue(form.is_valid())
+        self.assertLessEqual(max(reads), uploads.CHUNK_SIZE)
+        avatar = form.cleaned_data['avatar']
+        with Image.open(avatar) as stripped, Image.open(upload.temporary_file_path()) as original:
+            self.assertEqual(dict(stripped.getexif()), {0x0112: 6})
+            self.assertEqual(stripped.tobytes(), original.tobytes())
+
+    def test_orientation(self):
+        """
+        Ориентация остаётся в PNG, JPEG и WebP, обычная ориентация и остальные теги удаляются,
+        уменьшенные копии поворачиваются по ориентации
+        """
+        picture = Image.fromarray(np.random.default_rng(0).integers(0, 256, (40, 60, 3), dtype=np.uint8))
+        for image_format in ('PNG', 'JPEG', 'WEBP'):
+            for orientation, expected in ((8, {0x0112: 8}), (1, {}), (None, {})):
+                exif = Image.Exif()
+                exif[0x010F] = 'Camera'
+                if orientation is not None:
+                    exif[0x0112] = orientation
+                buffer = io.BytesIO()
+                picture.save(buffer, image_format, exif=exif, lossless=True)
+                upload = SimpleUploadedFile('avatar', buffer.getvalue())
+                stripped = uploads.strip_metadata(upload, image_format)
+                with Image.open(stripped) as image, Image.open(upload) as original:
+                    self.assertEqual(dict(image.getexif()), expected, (image_format, orientation))
+                    self.assertEqual(image.tobytes(), original.tobytes())
+        self.assertEqual(uploads.exif_orientation(b'Exif\x00\x00MM\x00*\x00\x00\xff\xff'), 1)
+
+    def test_rotated_derivatives(self):
+        """
+        Уменьшенные копии повёрнуты по ориентации оригинала
+        """
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 200)).save(buffer, 'JPEG', exif=exif)
+        name = default_storage.save('images/users/avatar.jpg', io.BytesIO(buffer.getvalue()))
+        self.assertTrue(images.generate_derivatives(name))
+        with default_storage.open(images.derivative_name(name, 'thumb', 'webp')) as file, Image.open(file) as thumb:
+            self.assertEqual(thumb.size, (160, 320))
+
+    @override_settings(UPLOAD_LIMITS={'avatar': {'BYTES': 1000, 'PIXELS': 100, 'FORMATS': ('PNG',)}})
+    def test_byte_budget(self):
+        """
+        Сверх бюджета на диск попадает один байт, и форма отклоняет файл по размеру
+        """
+        request = RequestFactory().post('/', {'avatar': io.BytesIO(bytes(500000))})
+        self.assertEqual(request.FILES['avatar'].size, 1001)
+        form = UserSettingsEditForm(data={}, files=request.FILES)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['avatar'][0].code, 'file_too_large')
+
+
+class JobQueueTest(TempMediaMixin, TestCase):
+    """
+    Проверка очереди фоновых задач
+    """
+
+    def test_dedup_and_priority(self):
+        """
+        Задача с тем же ключом не ставится второй раз, но поднимает приоритет; задачи берутся по приоритету
+        """
+        first = Job.enqueue('recount_done', key='recount_done')
+        low = Job.enqueue('recount_done', priority=Job.LOW)
+        self.assertEqual(Job.enqueue('recount_done', priority=Job.HIGH, key='recount_done').id, first.id)
+        self.assertEqual([job.id for job in Job.claim('worker', 5)], [first.id, low.id])
+        self.assertEqual(Job.enqueue('recount_done', key='recount_done').state, Job.QUEUED)
+
+    def test_no_threads_in_tests(self):
+        """
+        В тестах задачи не разбираются фоновыми потоками, даже если это включено в окружении
+        """
+        self.assertFalse(settings.JOB_QUEUE['IN_PROCESS'])
+        with mock.patch('main.jobs.drain_in_background') as drain, self.captureOnCommitCallbacks(execute=True):
+            Job.enqueue('recount_done')
+        drain.assert_not_called()
+
+    def test_retry(self):
+        """
+        Упавшая задача повторяется с задержкой, пока не кончатся попытки
+        """
+        with mock.patch.dict(jobs.HANDLERS, {'broken': lambda: 1 / 0}), self.assertLogs('main.jobs'):
+            job = Job.enqueue('broken')
+            self.assertEqual(jobs.work('worker', once=True), 0)
+            job.refresh_from_db()
+            self.assertEqual((job.state, job.attempts), (Job.QUEUED, 1))
+            self.assertGreater(job.run_at, timezone.now())
+            Job.objects.filter(pk=job.pk).update(attempts=job.max_attempts - 1, run_at=timezone.now())
+            jobs.work('worker', once=True)
+            job.refresh_from_db()
+            self.assertEqual(job.state, Job.FAILED)
+            self.assertIn('ZeroDivisionError', job.last_error)
+
+    def test_avatar_change_tracking(self):
+        """
+        Смена аватара сбрасывает признак готовых копий, а сохранение без смены не читает базу
+        """
+        user = make_user('user')
+        UserSettings.objects.filter(user=user).update(avatar_derivatives=True)
+        usersettings = UserSettings.objects.get(user=user)
+        usersettings.score = 5
+        with self.assertNumQueries(1):
+            usersettings.save()
+        usersettings.avatar = 'images/users/other.png'
+        usersettings.save()
+        self.assertFalse(UserSettings.objects.get(user=user).avatar_derivatives)
+        self.assertEqual(
+            list(Job.objects.values_list('name', 'args')),
+            [('avatar_derivatives', [usersettings.id, 'images/users/other.png'])]
+        )
+        Job.objects.all().delete()
+        usersettings.score = 10
+        usersettings.save()
+        self.assertFalse(Job.objects.exists())
+        UserSettings.objects.filter(user=user).update(avatar_derivatives=True)
+        usersettings = UserSettings.objects.only('id', 'avatar_derivatives').get(user=user)
+        usersettings.save(update_fields=['avatar_derivatives'])
+        self.assertTrue(UserSettings.objects.get(user=user).avatar_derivatives)
+
+    def test_task_image_jobs(self):
+        """
+        Новая задача ставит обработку изображения в очередь, обработчик её выполняет
+        """
+        buffer = io.BytesIO()
+        Image.linear_gradient('L').convert('RGB').save(buffer, 'PNG')
+        task = make_task(make_user(), image=SimpleUploadedFile('task.png', buffer.getvalue()))
+        self.assertEqual(
+            set(Job.objects.values_list('name', flat=True)),
+            {'task_derivatives', 'analyse_task', 'index_image_hashes'}
+        )
+        jobs.work('worker', once=True)
+        self.assertFalse(Job.objects.exists())
+        task.refresh_from_db()
+        self.assertTrue(task.image_derivatives)
+        self.assertTrue(ImageReport.objects.filter(task=task).exists())
+        self.assertTrue(ImageHash.objects.filter(task=task).exists())
+
+
+class ContentStorageTest(TempMediaMixin, TestCase):
+    """
+    Проверка хранения файлов по хэшу содержимого
+    """
+
+    def test_dedup(self):
+        """
+        Одинаковое содержимое под разными именами хранится одним файлом, имя зависит только от содержимого
+        """
+        data = b'\x89PNG\r\n\x1a\n' + b'0' * 100
+        first = content_addressed_storage.save('images/tasks/first.PNG', io.BytesIO(data))
+        second = content_addressed_storage.save('images/tasks/second.png', SimpleUploadedFile('x.png', data))
+        self.assertEqual(first, second)
+        self.assertEqual(first, content_name('images/tasks/other.png', SimpleUploadedFile('y.png', data)))
+        self.assertTrue(is_content_addressed(first))
+        self.assertRegex(first, r'^images/tasks/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.png$')
+        self.assertEqual(len(content_addressed_storage.listdir(posixpath.dirname(first))[1]), 1)
+        other = content_addressed_storage.save('images/tasks/first.png', io.BytesIO(data + b'1'))
+        self.assertNotEqual(other, first)
+        self.assertFalse(is_content_addressed('images/tasks/first.png'))
+
+    def test_hash_media(self):
+        """
+        Команда переносит старые файлы на имена по хэшу, одинаковые файлы сводятся в один,
+        а пустые пути и аватар по умолчанию не трогаются
+        """
+        author = make_user()
+        data = lsb.to_png(Image.linear_gradient('L').convert('RGB'))
+        tasks = []
+        for name in ('images/tasks/a.png', 'images/tasks/b.png'):
+            default_storage.save(name, io.BytesIO(data))
+            tasks.append(make_task(author, image=name))
+        empty = make_task(author, image='')
+        call_command('hash_media', stdout=io.StringIO())
+        names = set(Task.objects.exclude(id=empty.id).values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertTrue(is_content_addressed(names.pop()))
+        self.assertEqual(Task.objects.get(id=empty.id).image.name, '')
+        self.assertEqual(author.usersettings.avatar.name, DEFAULT_AVATAR)
+        self.assertTrue(default_storage.exists('images/tasks/a.png'))
+
+
+class MediaServeTest(TempMediaMixin, TestCase):
+    """
+    Проверка раздачи загруженных файлов
+    """
+    DATA = b'0123456789' * 100
+
+    def setUp(self):
+        self.name = default_storage.save('images/tasks/task.png', io.BytesIO(self.DATA))
+        self.task = make_task(make_user(), image=self.name)
+        self.url = reverse('media', args=[self.name])
+
+    def get(self, url: str = None, **headers):
+        """
+        GET-запрос файла с тем же телом, что получил бы клиент
+        """
+        response = self.client.get(url or self.url, **headers)
+        response.body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response
+
+    def test_full(self):
+        """
+        Файл отдаётся целиком с ETag и проверкой кэша, файл по хэшу - с бессрочным кэшем
+        """
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, self.DATA)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(self.DATA)))
+        self.assertEqual(response['Cache-Control'], media.REVALIDATE_CACHE_CONTROL)
+        hashed = content_addressed_storage.save('images/users/avatar.png', io.BytesIO(self.DATA))
+        response = self.get(reverse('media', args=[hashed]))
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['ETag'], f'"{posixpath.splitext(posixpath.basename(hashed))[0]}"')
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    def test_range(self):
+        """
+        Один диапазон (с концом, без конца и с конца файла) отдаётся ответом 206
+        """
+        for header, first, last in (('bytes=10-19', 10, 19), ('bytes=995-', 995, 999), ('bytes=-5', 995, 999),
+                                    ('bytes=990-5000', 990, 999)):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(response['Content-Range'], f'bytes {first}-{last}/1000')
+            self.assertEqual(response['Content-Length'], str(last - first + 1))
+            self.assertEqual(response.body, self.DATA[first:last + 1])
+
+    def test_unsupported_range(self):
+        """
+        Диапазон за концом файла - 416, несколько диапазонов и непонятный заголовок - весь файл
+        """
+        for header in ('bytes=1000-', 'bytes=-0'):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */1000')
+        for header in ('bytes=0-1,5-6', 'items=0-1', 'bytes=5-1'):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200, header)
+            self.assertEqual(response.body, self.DATA)
+
+    def test_if_range(self):
+        """
+        Диапазон отдаётся, только если If-Range совпадает с текущим ETag
+        """
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, self.DATA)
+
+    def test_not_modified(self):
+        """
+        Совпавший If-None-Match (или *) - ответ 304 без тела, но с ETag
+        """
+        etag = self.get()['ETag']
+        for header in (etag, f'"other", {etag}', '*'):
+            response = self.get(HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, 304, header)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response.body, b'')
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_offload(self):
+        """
+        При передаче веб-серверу Django отдаёт только заголовок с путём, доступ проверяется как обычно
+        """
+        with override_settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.get(HTTP_RANGE='bytes=0-9')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Sendfile'], default_storage.path(self.name))
+            self.assertEqual(response.body, b'')
+            self.assertEqual(response['ETag'], self.get()['ETag'])
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.get()
+            self.assertEqual(response['X-Accel-Redirect'], settings.MEDIA_ACCEL_PREFIX + self.name)
+            self.assertNotIn('Content-Type', response)
+            self.assertEqual(response.body, b'')
+            Task.objects.filter(id=self.task.id).update(active=False)
+            self.assertEqual(self.get().status_code, 404)
+
+    def test_inactive_task(self):
+        """
+        Изображение неактивной задачи и его копии не отдаются, пути вне MEDIA_ROOT - тоже
+        """
+        derived = default_storage.save(images.derivative_name(self.name, 'thumb', 'webp'), io.BytesIO(self.DATA))
+        self.assertEqual(self.get(reverse('media', args=[derived])).status_code, 200)
+        Task.objects.filter(id=self.task.id).update(active=False)
+        self.assertEqual(self.get().status_code, 404)
+        self.assertEqual(self.get(reverse('media', args=[derived])).status_code, 404)
+        self.assertEqual(self.get(reverse('media', args=['images/tasks/missing.png'])).status_code, 404)
+        self.assertEqual(self.get(reverse('media', args=['images/../../manage.py'])).status_code, 404)
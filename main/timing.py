@@ -0,0 +1,169 @@
+"""
+Модуль с замером запросов к базе и времени обработки запросов
+
+``TimingMiddleware`` включается настройкой ``REQUEST_TIMING`` и для каждого
+запроса считает количество и время SQL, время рендера шаблона и общее время.
+Результат отдаётся заголовком ``Server-Timing`` (виден во вкладке Network
+браузера), пишется строкой JSON в логгер ``main.timing`` и накапливается
+по представлениям в памяти процесса (страница /admin/timing/).
+
+``max_queries`` - помощник для тестов, который падает, если код внутри
+блока выполнил больше запросов, чем разрешено
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+
+class ViewStats:
+    """
+    Потокобезопасные суммы замеров по представлениям
+    """
+    FIELDS = ('total', 'sql_time', 'sql_count', 'template')
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def add(self, view: str, timings: dict):
+        """
+        Добавление замеров одного запроса
+        """
+        with self._lock:
+            item = self._items.setdefault(view, {'requests': 0, 'max_total': 0.0, **dict.fromkeys(self.FIELDS, 0)})
+            item['requests'] += 1
+            item['max_total'] = max(item['max_total'], timings['total'])
+            for field in self.FIELDS:
+                item[field] += timings[field]
+
+    def summary(self) -> list:
+        """
+        Средние значения по представлениям, самые медленные в начале
+        """
+        with self._lock:
+            items = [(view, dict(item)) for view, item in self._items.items()]
+        rows = []
+        for view, item in items:
+            count = item['requests']
+            rows.append({
+                'view': view,
+                'requests': count,
+                'total': item['total'] / count,
+                'max_total': item['max_total'],
+                'sql_count': item['sql_count'] / count,
+                'sql_time': item['sql_time'] / count,
+                'template': item['template'] / count,
+            })
+        return sorted(rows, key=lambda row: row['total'] * row['requests'], reverse=True)
+
+    def clear(self):
+        """
+        Сброс накопленных замеров
+        """
+        with self._lock:
+            self._items.clear()
+
+
+stats = ViewStats()
+
+
+class QueryCounter:
+    """
+    Обёртка выполнения SQL (``connection.execute_wrapper``), считающая запросы и их время
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - start
+
+
+def server_timing(timings: dict) -> str:
+    """
+    Значение заголовка Server-Timing, длительности в миллисекундах
+    """
+    return ', '.join([
+        f'sql;desc="{timings["sql_count"]} queries";dur={timings["sql_time"] * 1000:.1f}',
+        f'template;dur={timings["template"] * 1000:.1f}',
+        f'total;dur={timings["total"] * 1000:.1f}',
+    ])
+
+
+class TimingMiddleware:
+    """
+    Замер SQL, рендера шаблона и общего времени каждого запроса
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        request.template_time = 0.0
+        start = time.perf_counter()
+        with connections['default'].execute_wrapper(counter):
+            response = self.get_response(request)
+        timings = {
+            'total': time.perf_counter() - start,
+            'sql_time': counter.time,
+            'sql_count': counter.count,
+            'template': request.template_time,
+        }
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        stats.add(view, timings)
+        response['Server-Timing'] = server_timing(timings)
+        logger.info(json.dumps({
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **timings,
+        }))
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Замер рендера: он начинается сразу после этого метода и заканчивается в post_render_callback
+        """
+        start = time.perf_counter()
+
+        def finish(rendered):
+            request.template_time += time.perf_counter() - start
+            return rendered
+        response.add_post_render_callback(finish)
+        return response
+
+
+@contextmanager
+def max_queries(budget: int, using: str = 'default'):
+    """
+    Проверка бюджета запросов в тестах
+
+    :param budget: сколько запросов разрешено
+    :param using: алиас базы
+    :raise AssertionError: если запросов больше, текст содержит их список
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    if len(context) > budget:
+        queries = '\n'.join(f'{i}. {query["sql"]}' for i, query in enumerate(context.captured_queries, start=1))
+        raise AssertionError(f'{len(context)} queries executed, budget is {budget}:\n{queries}')
@@ -0,0 +1,344 @@
+"""
+Модуль с проверкой загружаемых изображений
+
+Загрузка не читается в память целиком:
+
+* ``UploadBudgetHandler`` стоит первым в ``settings.FILE_UPLOAD_HANDLERS`` и
+  после самого большого бюджета из ``settings.UPLOAD_LIMITS`` перестаёт
+  передавать куски файла дальше, поэтому на диск попадает не больше бюджета
+  (плюс один байт, чтобы форма отклонила файл по размеру). Файлы больше
+  ``settings.FILE_UPLOAD_MAX_MEMORY_SIZE`` Django пишет во временный файл;
+* ``check_image`` проверяет размер в байтах, формат и размеры в пикселях по
+  заголовку, до декодирования, так что декомпрессионная бомба отклоняется,
+  не распаковав ни одного пикселя;
+* ``strip_metadata`` переписывает PNG, JPEG и WebP по блокам, выбрасывая EXIF,
+  XMP, комментарии и текстовые блоки. Пиксели при этом не декодируются и не
+  меняются. Из EXIF остаётся только ориентация (если она не обычная), иначе
+  снятое боком фото показывалось бы повёрнутым. Используется только для
+  аватаров: в изображениях задач младшие биты и сам файл - часть задачи
+"""
+import io
+import struct
+import warnings
+import zlib
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image, UnidentifiedImageError
+
+CHUNK_SIZE = 64 * 1024
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_KEEP = {
+    b'IHDR', b'PLTE', b'IDAT', b'IEND', b'tRNS', b'gAMA', b'cHRM', b'sRGB', b'iCCP', b'sBIT', b'bKGD',
+    b'pHYs', b'acTL', b'fcTL', b'fdAT',
+}
+JPEG_DROP = {0xE1, *range(0xE3, 0xEE), 0xEF, 0xFE}
+JPEG_APP1 = 0xE1
+EXIF_HEADER = b'Exif\x00\x00'
+EXIF_ORIENTATION = 0x0112
+JPEG_STANDALONE = {0x01, *range(0xD0, 0xD8)}
+WEBP_DROP = {b'EXIF', b'XMP '}
+WEBP_METADATA_FLAGS = 0x0C
+WEBP_EXIF_FLAG = 0x08
+
+
+class UploadBudgetHandler(FileUploadHandler):
+    """
+    Обработчик загрузки, отбрасывающий всё, что больше бюджета
+    Сам ничего не хранит, только обрезает поток для следующих обработчиков
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_bytes = max(limits['BYTES'] for limits in settings.UPLOAD_LIMITS.values())
+
+    def receive_data_chunk(self, raw_data, start):
+        if start > self.max_bytes:
+            return None
+        return raw_data[:self.max_bytes + 1 - start]
+
+    def file_complete(self, file_size):
+        return None
+
+
+def check_image(upload: UploadedFile, kind: str) -> str:
+    """
+    Проверка загруженного изображения по заголовку, без декодирования пикселей
+
+    :param upload: загруженный файл
+    :param kind: ключ бюджета в ``settings.UPLOAD_LIMITS``
+    :return: формат изображения (как у Pillow)
+    :raise ValidationError: если файл слишком большой, не изображение или в нём слишком много пикселей
+    """
+    limits = settings.UPLOAD_LIMITS[kind]
+    if upload.size > limits['BYTES']:
+        raise ValidationError(f'Файл больше {limits["BYTES"] // (1024 * 1024)} МБ', code='file_too_large')
+    too_many_pixels = ValidationError(
+        f'Изображение больше {limits["PIXELS"] / 1_000_000:g} Мпикс', code='too_many_pixels'
+    )
+    upload.seek(0)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            with Image.open(upload, formats=limits['FORMATS']) as image:
+                width, height = image.size
+                image_format = image.format
+    except (Image.DecompressionBombWarning, Image.DecompressionBombError) as error:
+        raise too_many_pixels from error
+    except (OSError, UnidentifiedImageError, SyntaxError) as error:
+        formats = ', '.join(limits['FORMATS'])
+        raise ValidationError(f'Загрузите изображение в одном из форматов: {formats}', code='invalid_image') from error
+    finally:
+        upload.seek(0)
+    if width * height > limits['PIXELS']:
+        raise too_many_pixels
+    return image_format
+
+
+def exif_orientation(data: bytes) -> int:
+    """
+    Ориентация из EXIF (блок TIFF, с заголовком ``Exif`` или без него)
+    Блоки длиннее ``CHUNK_SIZE`` читаются только с начала, где обычно лежит IFD0
+
+    :return: значение тега Orientation или 1, если его нет или EXIF не читается
+    """
+    if data.startswith(EXIF_HEADER):
+        data = data[len(EXIF_HEADER):]
+    order = {b'II': '<', b'MM': '>'}.get(data[:2])
+    if order is None:
+        return 1
+    try:
+        offset = struct.unpack_from(f'{order}I', data, 4)[0]
+        count = struct.unpack_from(f'{order}H', data, offset)[0]
+        for entry in range(offset + 2, offset + 2 + 12 * count, 12):
+            tag, kind, number = struct.unpack_from(f'{order}HHI', data, entry)
+            if tag == EXIF_ORIENTATION and kind == 3 and number == 1:
+                value = struct.unpack_from(f'{order}H', data, entry + 8)[0]
+                return value if 1 <= value <= 8 else 1
+    except struct.error:
+        return 1
+    return 1
+
+
+def orientation_exif(orientation: int) -> bytes:
+    """
+    Блок TIFF с единственным тегом Orientation
+    """
+    return struct.pack('>2sHIHHHIHHI', b'MM', 42, 8, 1, EXIF_ORIENTATION, 3, 1, orientation, 0, 0)
+
+
+def copy(source, target, length: int):
+    """
+    Копирование ``length`` байт кусками
+    """
+    while length > 0:
+        chunk = source.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            raise ValueError('Файл обрывается')
+        target.write(chunk)
+        length -= len(chunk)
+
+
+def strip_png(source, target):
+    """
+    PNG без текстовых блоков и времени изменения, от EXIF остаётся только ориентация
+    """
+    if source.read(8) != PNG_SIGNATURE:
+        raise ValueError('Это не PNG')
+    target.write(PNG_SIGNATURE)
+    kind = None
+    while kind != b'IEND':
+        header = source.read(8)
+        if len(header) < 8:
+            raise ValueError('Файл обрывается')
+        length, kind = struct.unpack('>I', header[:4])[0], header[4:]
+        if kind in PNG_KEEP:
+            target.write(header)
+            copy(source, target, length + 4)
+        elif kind == b'eXIf':
+            head = source.read(min(length, CHUNK_SIZE))
+            source.seek(length - len(head) + 4, io.SEEK_CUR)
+            orientation = exif_orientation(head)
+            if orientation != 1:
+                data = orientation_exif(orientation)
+                target.write(struct.pack('>I', len(data)) + kind + data)
+                target.write(struct.pack('>I', zlib.crc32(kind + data)))
+        else:
+            source.seek(length + 4, io.SEEK_CUR)
+
+
+def copy_scan(source, target):
+    """
+    Копирование сжатых данных JPEG до следующего маркера (он остаётся непрочитанным)
+    В сжатых данных за 0xFF идут только 0x00, RSTn или ещё один 0xFF
+    """
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            raise ValueError('Файл обрывается')
+        position = chunk.find(b'\xff')
+        while position != -1:
+            if position + 1 == len(chunk):
+                following = source.read(1)
+                if not following:
+                    raise ValueError('Файл обрывается')
+                chunk += following
+            code = chunk[position + 1]
+            if code not in (0x00, 0xFF) and code not in JPEG_STANDALONE:
+                target.write(chunk[:position])
+                source.seek(position - len(chunk), io.SEEK_CUR)
+                return
+            position = chunk.find(b'\xff', position + 1)
+        target.write(chunk)
+
+
+def strip_jpeg(source, target):
+    """
+    JPEG без EXIF, XMP и комментариев (JFIF, ICC профиль и Adobe остаются)
+    Вместо EXIF пишется APP1 с одной ориентацией, если она не обычная.
+    Всё, что после EOI (например, дополнительные кадры MPO), отбрасывается
+    """
+    if source.read(2) != b'\xff\xd8':
+        raise ValueError('Это не JPEG')
+    target.write(b'\xff\xd8')
+    while True:
+        marker = source.read(2)
+        while marker[1:] == b'\xff':
+            marker = b'\xff' + source.read(1)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ValueError('Повреждённый JPEG')
+        code = marker[1]
+        if code == 0xD9:
+            target.write(marker)
+            return
+        if code in JPEG_STANDALONE:
+            target.write(marker)
+            continue
+        size = source.read(2)
+        if len(size) < 2:
+            raise ValueError('Файл обрывается')
+        length = struct.unpack('>H', size)[0] - 2
+        if length < 0:
+            raise ValueError('Повреждённый JPEG')
+        head = source.read(min(length, 12))
+        if code == JPEG_APP1 and head.startswith(EXIF_HEADER):
+            orientation = exif_orientation(head + source.read(length - len(head)))
+            if orientation != 1:
+                data = EXIF_HEADER + orientation_exif(orientation)
+                target.write(marker + struct.pack('>H', len(data) + 2) + data)
+            continue
+        if code in JPEG_DROP or code == 0xE2 and not head.startswith(b'ICC_PROFILE\x00'):
+            source.seek(length - len(head), io.SEEK_CUR)
+            continue
+        target.write(marker + size + head)
+        copy(source, target, length - len(head))
+        if code == 0xDA:
+            copy_scan(source, target)
+
+
+def strip_webp(source, target):
+    """
+    WebP без блоков EXIF и XMP (флаги в VP8X сбрасываются, размер RIFF пересчитывается)
+    Вместо EXIF пишется блок с одной ориентацией, если она не обычная
+    """
+    header = source.read(12)
+    if header[:4] != b'RIFF' or header[8:] != b'WEBP':
+        raise ValueError('Это не WebP')
+    remaining = struct.unpack('<I', header[4:8])[0] - 4
+    start = target.tell()
+    flags_position = None
+    target.write(header)
+    while remaining >= 8:
+        chunk_header = source.read(8)
+        if len(chunk_header) < 8:
+            raise ValueError('Файл обрывается')
+        kind, length = chunk_header[:4], struct.unpack('<I', chunk_header[4:])[0]
+        length += length & 1
+        remaining -= 8 + length
+        if kind == b'EXIF' and flags_position is not None:
+            head = source.read(min(length, CHUNK_SIZE))
+            source.seek(length - len(head), io.SEEK_CUR)
+            orientation = exif_orientation(head)
+            if orientation != 1:
+                data = orientation_exif(orientation)
+                target.write(kind + struct.pack('<I', len(data)) + data)
+                position = target.tell()
+                target.seek(flags_position)
+                target.write(bytes([flags | WEBP_EXIF_FLAG]))
+                target.seek(position)
+            continue
+        if kind in WEBP_DROP:
+            source.seek(length, io.SEEK_CUR)
+            continue
+        target.write(chunk_header)
+        if kind == b'VP8X' and length:
+            flags = source.read(1)[0] & ~WEBP_METADATA_FLAGS
+            flags_position = target.tell()
+            target.write(bytes([flags]))
+            length -= 1
+        copy(source, target, length)
+    end = target.tell()
+    target.seek(start + 4)
+    target.write(struct.pack('<I', end - start - 8))
+    target.seek(end)
+
+
+STRIPPERS = {
+    'PNG': strip_png,
+    'JPEG': strip_jpeg,
+    'MPO': strip_jpeg,
+    'WEBP': strip_webp,
+}
+
+
+def strip_metadata(upload: UploadedFile, image_format: str) -> UploadedFile:
+    """
+    Копия загруженного изображения без метаданных
+
+    Копия, как и загрузка в Django, держится в памяти, только если она не больше
+    ``settings.FILE_UPLOAD_MAX_MEMORY_SIZE``, иначе пишется во временный файл
+
+    :raise ValidationError: если формат не поддерживается или файл повреждён
+    """
+    if image_format not in STRIPPERS:
+        raise ValidationError('Метаданные можно удалить только из PNG, JPEG и WebP', code='invalid_image')
+    if upload.size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        result = TemporaryUploadedFile(upload.name, upload.content_type, 0, upload.charset)
+    else:
+        result = InMemoryUploadedFile(io.BytesIO(), None, upload.name, upload.content_type, 0, upload.charset)
+    upload.seek(0)
+    try:
+        STRIPPERS[image_format](upload, result.file)
+    except (ValueError, IndexError) as error:
+        result.close()
+        raise ValidationError('Не удалось прочитать изображение', code='invalid_image') from error
+    finally:
+        upload.seek(0)
+    result.file.flush()
+    result.size = result.file.tell()
+    result.seek(0)
+    return result
+
+
+class LimitedImageField(forms.ImageField):
+    """
+    Поле изображения с проверкой бюджета до декодирования
+
+    :param kind: ключ бюджета в ``settings.UPLOAD_LIMITS``
+    :param strip: удалять ли метаданные
+    """
+
+    def __init__(self, kind: str, strip: bool = False, **kwargs):
+        self.kind = kind
+        self.strip = strip
+        super().__init__(**kwargs)
+
+    def to_python(self, data):
+        if data not in self.empty_values and hasattr(data, 'size'):
+            image_format = check_image(data, self.kind)
+            if self.strip:
+                data = strip_metadata(data, image_format)
+        return super().to_python(data)
@@ -7,14 +7,17 @@ from django.contrib.auth import logout, get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView
+from django.db.models import OuterRef
 from django.http import HttpResponse, Http404
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.views.generic import DetailView, UpdateView, ListView, CreateView, TemplateView
 
-from main.forms import UserSettingsEditForm, CreateTaskForm, CreateComplaintForm
-from main.models import UserSettings, Task, Complaint
-from stego.settings import BASE_URL
+from main.forms import UserSettingsEditForm, CreateTaskForm, CreateComplaintForm, EncodeTaskForm
+from main.models import ScoreBucket, UserSettings, Task, Complaint
+from main import timing
+from main.pagination import keyset_page
+from stego.settings import BASE_URL, TASKS_PAGE_SIZE, LEADERBOARD_SIZE, COMPLAINTS_PAGE_SIZE
 
 
 @login_required()
@@ -64,29 +67,28 @@ class ProfilePage(LoginRequiredMixin, DetailView):
         'BASE_URL': BASE_URL
     }
 
+    def get_queryset(self):
+        """
+        Пользователь загружается вместе с настройками и местом в рейтинге
+        """
+        return get_user_model().objects.select_related('usersettings').annotate(
+            rank=ScoreBucket.rank_expression(OuterRef('usersettings__score'))
+        )
+
     def get_context_data(self, **kwargs) -> dict:
         """
         Формирование словаря для наполнения страницы
         """
         context = super().get_context_data(**kwargs)
-        usersettings = UserSettings.get_usersettings_by_user(self.object)
+        usersettings = getattr(self.object, 'usersettings', None) or UserSettings.get_usersettings_by_user(self.object)
         context['user'] = self.object
         context['pagename'] = self.object.username
         context['avatar'] = usersettings.avatar
-        if self.object == self.request.user:
-            tasks_to_history = Task.get_done_tasks(self.object)
-            context['count_of_tasks_to_history'] = len(tasks_to_history)
-            tasks_to_history = tasks_to_history[:5]
-            context['tasks_to_history'] = [
-                [task, task.get_done_count()] for task in tasks_to_history
-            ]
-        created_tasks = Task.get_tasks_of_user(self.object)
-        context['count_of_created_tasks'] = len(created_tasks)
-        created_tasks = created_tasks[:5]
-        context['created_tasks'] = [
-            [task, task.get_done_count()] for task in created_tasks
-        ]
-        context['suggestion_task'] = Task.get_suggestion_task(self.object)
+        context['avatar_derivatives'] = usersettings.avatar_derivatives
+        context['rank'] = self.object.rank if hasattr(self.object, 'usersettings') else usersettings.get_rank()
+        context.update(usersettings.get_summary())
+        if self.object != self.request.user:
+            del context['tasks_to_history'], context['count_of_tasks_to_history']
         return context
 
 
@@ -164,7 +166,7 @@ class HistoryPage(LoginRequiredMixin, ListView):
         """
         tasks_to_history = Task.get_done_tasks(self.request.user)
         return [
-            [task, task.get_done_count()] for task in tasks_to_history
+            [task, task.done_count] for task in tasks_to_history
         ]
 
 
@@ -187,11 +189,67 @@ class CreatedTasksPage(LoginRequiredMixin, DetailView):
         context['user'] = self.object
         created_tasks = Task.get_tasks_of_user(self.object)
         context['created_tasks'] = [
-            [task, task.get_done_count()] for task in created_tasks
+            [task, task.done_count] for task in created_tasks
         ]
         return context
 
 
+class RequestTimingPage(LoginRequiredMixin, ListView):
+    """
+    Страница со средними замерами запросов по представлениям (см. main.timing)
+    Доступна только администраторам
+    """
+    template_name = 'pages/timing/index.html'
+    context_object_name = 'context'
+    extra_context = {
+        'BASE_URL': BASE_URL,
+        'pagename': 'Замеры запросов'
+    }
+
+    def get_queryset(self) -> List:
+        """
+        Получение замеров и проверка на администратора
+        """
+        if not self.request.user.is_staff:
+            raise Http404
+        return timing.stats.summary()
+
+
+class LeaderboardPage(LoginRequiredMixin, ListView):
+    """
+    Страница рейтинга пользователей
+    """
+    template_name = 'pages/profile/leaderboard/index.html'
+    context_object_name = 'context'
+    extra_context = {
+        'BASE_URL': BASE_URL,
+        'pagename': 'Рейтинг'
+    }
+
+    def get_queryset(self) -> List:
+        """
+        Получение первых мест рейтинга
+        Место считается по гистограмме очков, одинаковые очки делят место
+        """
+        top = list(UserSettings.get_top(LEADERBOARD_SIZE))
+        result = []
+        for index, usersettings in enumerate(top):
+            if index and usersettings.score == top[index - 1].score:
+                rank = result[-1][0]
+            else:
+                rank = index + 1
+            result.append([rank, usersettings])
+        return result
+
+    def get_context_data(self, **kwargs) -> dict:
+        """
+        Формирование словаря для наполнения страницы
+        """
+        context = super().get_context_data(**kwargs)
+        context['rank'] = self.request.user.usersettings.get_rank()
+        return context
+
+
 class EducationPage(LoginRequiredMixin, TemplateView):
     """
     Страница с обучением
@@ -217,13 +275,24 @@ class TaskListPage(LoginRequiredMixin, ListView):
 
     def get_queryset(self) -> List:
         """
-        Получение активных задач
+        Получение первой страницы активных задач
+        Следующие страницы подгружаются через api по курсору из ``next_cursor``
         """
-        tasks = Task.get_active()
+        tasks, self.next_cursor = keyset_page(
+            Task.get_catalogue(self.request.user), self.request.GET.get('cursor', ''), TASKS_PAGE_SIZE
+        )
         return [
-            [task, task.is_done(self.request.user)] for task in tasks
+            [task, task.solved] for task in tasks
         ]
 
+    def get_context_data(self, **kwargs) -> dict:
+        """
+        Формирование словаря для наполнения страницы
+        """
+        context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.next_cursor
+        return context
+
 
 class TaskPage(LoginRequiredMixin, DetailView):
     """
@@ -245,7 +314,7 @@ class TaskPage(LoginRequiredMixin, DetailView):
         context['pagename'] = self.object.title
         context['task'] = self.object
         context['done'] = self.object.is_done(self.request.user)
-        context['done_count'] = self.object.get_done_count()
+        context['done_count'] = self.object.done_count
         return context
 
 
@@ -254,7 +323,7 @@ class CreateTaskPage(LoginRequiredMixin, CreateView):
     Страница создания задачи
     """
     model = Task
-    fields = ['author', 'title', 'description', 'image', 'answer', 'points', 'score_tier']
+    form_class = CreateTaskForm
     template_name = 'pages/tasks/create.html'
     extra_context = {
         'BASE_URL': BASE_URL,
@@ -267,16 +336,29 @@ class CreateTaskPage(LoginRequiredMixin, CreateView):
         """
         return reverse('task', kwargs={'pk': self.object.id})
 
-    def get_context_data(self, **kwargs) -> dict:
+    def get_initial(self) -> dict:
         """
-        Формирование словаря для наполнения страницы
+        Начальные значения скрытых полей формы
         """
-        context = super().get_context_data(**kwargs)
-        context['form'] = CreateTaskForm(initial={
+        return {
             'author': self.request.user,
             'score_tier': self.request.user.usersettings.score
-        })
-        return context
+        }
+
+    def form_valid(self, form) -> HttpResponse:
+        """
+        Автором всегда становится текущий пользователь
+        """
+        form.instance.author = self.request.user
+        return super().form_valid(form)
+
+
+class EncodeTaskPage(CreateTaskPage):
+    """
+    Страница создания задачи со встраиванием текста на сервере
+    """
+    form_class = EncodeTaskForm
+    template_name = 'pages/tasks/encode.html'
 
 
 class ComplaintListPage(LoginRequiredMixin, ListView):
@@ -293,11 +375,20 @@ class ComplaintListPage(LoginRequiredMixin, ListView):
 
     def get_queryset(self) -> List:
         """
-        Получение жалоб и проверка на администратора
+        Получение страницы очереди модерации и проверка на администратора
         """
         if not self.request.user.is_staff:
             raise Http404
-        return Complaint.get_active()
+        groups, self.next_cursor = Complaint.get_queue(self.request.GET.get('cursor', ''), COMPLAINTS_PAGE_SIZE)
+        return groups
+
+    def get_context_data(self, **kwargs) -> dict:
+        """
+        Формирование словаря для наполнения страницы
+        """
+        context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.next_cursor
+        return context
 
 
 class CreateComplaintPage(LoginRequiredMixin, CreateView):
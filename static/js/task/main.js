@@ -1,15 +1,36 @@
 "use strict"
 
 let enable_message = false
+let blocked_until = 0
+let backoff = 0
+
+function wait_before_retry(seconds) {
+    backoff = Math.min(Math.max(seconds, backoff * 2), 60)
+    blocked_until = Date.now() + backoff * 1000
+    answer.disabled = true
+    answer.placeholder = `Слишком много попыток, подождите ${backoff} с`
+    setTimeout(() => {
+        answer.disabled = false
+        answer.placeholder = "Ответ..."
+    }, backoff * 1000)
+}
 
 async function send_answer() {
+    if (Date.now() < blocked_until)
+        return
     let url = BASE_URL.value
     let id = task_id.value
     let user_answer = answer.value
     answer.value = ''
     if (user_answer === "")
         return
-    let response = await fetch(url + `api/check_answer/?id=${id}&answer=${user_answer}`)
+    let response = await fetch(url + `api/check_answer/?id=${id}&answer=${encodeURIComponent(user_answer)}`)
+    if (response.status === 429) {
+        answer.value = user_answer
+        wait_before_retry(Number(response.headers.get("Retry-After")) || 1)
+        return
+    }
+    backoff = 0
     let data = await response.json()
     if (data.is_ok) {
         done_count.innerText = Number(done_count.innerText) + 1
@@ -21,4 +42,4 @@ async function send_answer() {
             input_form.innerHTML = data.message + input_form.innerHTML
         }
     }
-}
+}
\ No newline at end of file
@@ -3,6 +3,37 @@
 let ALL_TASKS = tasks.innerHTML
 let timer = setTimeout(1000)
 let url = BASE_URL.value
+let cursor = next_cursor.value
+let search_page = ""
+let loading = false
+
+function escape_html(text) {
+    let element = document.createElement("span")
+    element.textContent = text
+    return element.innerHTML
+}
+
+function render_card(task) {
+    let color = task.solved ? "green" : "red"
+    let header_class = task.solved ? "text-success" : "text-danger"
+    return `<a href="${url}tasks/${task.id}/" class="text-decoration-none">
+        <div data-augmented-ui="tl-2-clip-y tr-2-round-inset br-clip border" class="border border-0 bg-gradient card m-4 pb-3"
+             style="width: 20vw; height: 30vh; background-color: #38046C; color: ${color};">
+            <div class="shadow card-header text-center bg-dark bg-gradient ${header_class}">
+                <strong>${task.title}</strong>
+                <p class="text-white m-0 p-0">Автор: <strong>${escape_html(task.author)}</strong></p>
+            </div>
+            <div class="card-body text-white text-break" style="overflow: hidden">${task.snippet}</div>
+        </div>
+    </a>`
+}
+
+async function fetch_search(title, page) {
+    let response = await fetch(url + `api/tasks_search/?format=json&title=${encodeURIComponent(title)}&page=${page}`)
+    let data = await response.json()
+    search_page = data.next_page
+    return data.tasks.map(render_card).join("")
+}
 
 async function find() {
     tasks.innerHTML = "<p>Поиск</p>"
@@ -10,9 +41,9 @@ async function find() {
     if (title === "")
         tasks.innerHTML = ALL_TASKS
     else {
-        let response = await fetch(url + `api/tasks_search/?title=${title}`)
-        let data = await response.json()
-        tasks.innerHTML = data.html
+        let html = await fetch_search(title, 1)
+        if (title === search_input.value)
+            tasks.innerHTML = html || '<p class="text-danger fs-3">Ничего не найдено</p>'
     }
 }
 
@@ -20,3 +51,44 @@ function search() {
     clearTimeout(timer)
     timer = setTimeout(find, 500)
 }
+
+async function load_more() {
+    if (loading)
+        return
+    let title = search_input.value
+    let paging = title === "" && cursor !== ""
+    let searching = title !== "" && search_page !== ""
+    if (!paging && !searching)
+        return
+    loading = true
+    try {
+        if (paging) {
+            let response = await fetch(url + `api/tasks_page/?cursor=${cursor}`)
+            if (!response.ok)
+                throw new Error(response.statusText)
+            let data = await response.json()
+            tasks.insertAdjacentHTML("beforeend", data.html)
+            ALL_TASKS = tasks.innerHTML
+            cursor = data.next
+        }
+        else {
+            let html = await fetch_search(title, search_page)
+            if (title === search_input.value)
+                tasks.insertAdjacentHTML("beforeend", html)
+        }
+    }
+    catch (error) {
+        console.error(error)
+        return
+    }
+    finally {
+        loading = false
+    }
+    if (tasks_end.getBoundingClientRect().top < window.innerHeight)
+        load_more()
+}
+
+new IntersectionObserver(entries => {
+    if (entries[0].isIntersecting)
+        load_more()
+}).observe(tasks_end)
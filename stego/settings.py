@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'main.timing.TimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,6 +90,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {
+            # Файл вместо памяти: в in-memory базе параллельные записи сразу падают
+            # с "table is locked", а тестам на конкурентность нужно ожидание блокировки
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -134,6 +141,33 @@ STATICFILES_DIRS = [
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Передача загруженных файлов веб-серверу (см. main.media): '' - отдаёт Django,
+# 'x-sendfile' - Apache/lighttpd, 'x-accel-redirect' - nginx с internal location по MEDIA_ACCEL_PREFIX
+MEDIA_SENDFILE = os.getenv('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Загрузка изображений (см. main.uploads): больше FILE_UPLOAD_MAX_MEMORY_SIZE байт -
+# во временный файл, а всё, что больше самого большого бюджета, не записывается вовсе.
+# Бюджет на загрузку: байты, пиксели (проверяются по заголовку до декодирования) и форматы Pillow
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+FILE_UPLOAD_HANDLERS = [
+    'main.uploads.UploadBudgetHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+UPLOAD_LIMITS = {
+    'task': {
+        'BYTES': 20 * 1024 * 1024,
+        'PIXELS': 24_000_000,
+        'FORMATS': ('PNG', 'JPEG', 'BMP', 'GIF', 'WEBP'),
+    },
+    'avatar': {
+        'BYTES': 5 * 1024 * 1024,
+        'PIXELS': 16_000_000,
+        'FORMATS': ('PNG', 'JPEG', 'WEBP'),
+    },
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
@@ -146,3 +180,75 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 BASE_URL = 'http://127.0.0.1:8000/'
+
+TASKS_PAGE_SIZE = 24
+LEADERBOARD_SIZE = 50
+COMPLAINTS_PAGE_SIZE = 30
+
+# Замер SQL и времени обработки запросов (см. main.timing), выключен по умолчанию.
+# Middleware синхронный, поэтому под ASGI асинхронные view при включённом замере
+# выполняются через адаптер
+REQUEST_TIMING = os.getenv('REQUEST_TIMING', '') == '1'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'main.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'profiles': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'profiles',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Кэш сводки профиля (см. main.profiles): алиас из CACHES и время жизни записи в секундах.
+# Для нескольких процессов нужен общий кэш
+PROFILE_CACHE = {
+    'CACHE': 'profiles',
+    'TTL': 3600,
+}
+
+# Кэш ответов для /api/check_answer/ (см. main.answers)
+ANSWER_CACHE_SIZE = 10000
+ANSWER_CACHE_TTL = 60
+
+# Ограничение частоты ответов (см. main.ratelimit): (жетонов в секунду, размер ведра).
+# Для нескольких процессов нужен main.ratelimit.CacheBackend с общим кэшем.
+# Для нагрузочных тестов (manage.py bench_api) выключить: ANSWER_RATE_LIMIT=0
+ANSWER_RATE_LIMIT = {
+    'ENABLED': os.getenv('ANSWER_RATE_LIMIT', '1') == '1',
+    'BACKEND': 'main.ratelimit.LocalMemoryBackend',
+    'USER': (2, 20),
+    'TASK': (0.5, 5),
+}
+
+# Очередь фоновых задач (см. main.jobs): повтор после ошибки через RETRY_DELAY * 2^(попытка - 1) секунд,
+# задачи, выполняемые дольше STALE_TIMEOUT секунд, возвращаются в очередь, POLL_INTERVAL - пауза
+# обработчика при пустой очереди. IN_PROCESS - выполнять задачи в потоках процесса сайта
+# (только для разработки, включается JOBS_IN_PROCESS=1; по умолчанию задачи выполняет manage.py run_jobs).
+# В тестах всегда выключено: фоновые потоки писали бы в тестовую базу, тесты вызывают main.jobs.work сами
+TESTING = sys.argv[1:2] == ['test']
+JOB_QUEUE = {
+    'IN_PROCESS': not TESTING and os.getenv('JOBS_IN_PROCESS', '0') == '1',
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 10,
+    'STALE_TIMEOUT': 600,
+    'POLL_INTERVAL': 1,
+}
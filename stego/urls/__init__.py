@@ -13,21 +13,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
-from main import views
+from main import media, views
 from stego import settings
 
 urlpatterns = [
+    path('admin/timing/', views.RequestTimingPage.as_view(), name='request_timing'),
     path('admin/', admin.site.urls),
     path('', views.IndexPage.as_view(), name='index'),
     path('accounts/', include('stego.urls.accounts')),
     path('tasks/', include('stego.urls.tasks')),
     path('complaints/', include('stego.urls.complaints')),
     path('api/', include('stego.urls.api')),
+    path(f'{settings.MEDIA_URL.lstrip("/")}<path:path>', media.serve, name='media'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -37,4 +37,5 @@ urlpatterns = [
     path('profile/history/', views.HistoryPage.as_view(), name='history'),
     path('profile/<int:pk>/created_tasks/', views.CreatedTasksPage.as_view(), name='created_tasks'),
     path('profile/education/', views.EducationPage.as_view(), name='education'),
+    path('leaderboard/', views.LeaderboardPage.as_view(), name='leaderboard'),
 ]
@@ -3,10 +3,15 @@
 """
 from django.urls import path
 
-from main.api import main
+from main.api import asynchronous, main
 
 
 urlpatterns = [
     path('check_answer/', main.check_answer),
     path('tasks_search/', main.tasks_search),
+    path('tasks_page/', main.tasks_page),
+    path('complaints/resolve/', main.complaints_resolve),
+    path('async/check_answer/', asynchronous.check_answer),
+    path('async/tasks_search/', asynchronous.tasks_search),
+    path('async/tasks_page/', asynchronous.tasks_page),
 ]
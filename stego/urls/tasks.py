@@ -9,5 +9,6 @@ from main import views
 urlpatterns = [
     path('list/', views.TaskListPage.as_view(), name='task_list'),
     path('create/', views.CreateTaskPage.as_view(), name='create_task'),
+    path('encode/', views.EncodeTaskPage.as_view(), name='encode_task'),
     path('<int:pk>/', views.TaskPage.as_view(), name='task'),
 ]